@@ -0,0 +1,348 @@
+# admission.py
+#
+# Admission control for OpenAI calls, shared by everything in the process.
+# Under a burst (a radio ad, a storm) every webhook used to call OpenAI at
+# once; the excess came back as 429s and those leads got "Sorry, something
+# went wrong". Calls now pass through one controller that:
+#
+#   - paces them with a token bucket matched to the account's rate limit
+#     (ADMISSION_RPM, bursts of ADMISSION_BURST), pausing it for the
+#     Retry-After of any 429
+#   - caps how many run at once with an AIMD window: +1/window per call that
+#     finishes within ADMISSION_LATENCY_TARGET, halved on a 429 or a slow
+#     call (at most once per DECREASE_COOLDOWN), kept between
+#     ADMISSION_MIN_CONCURRENCY and ADMISSION_MAX_CONCURRENCY
+#   - queues the rest in a bounded priority queue: first contact with a new
+#     lead before ongoing chats, before background work (summaries, thread
+#     pre-creation). When the queue is full a new caller displaces the
+#     lowest-priority waiter, or is turned away if it is the lowest itself;
+#     nobody waits longer than ADMISSION_MAX_WAIT, or past the request's
+#     deadline (resilience.py). Background work has no customer waiting on
+#     it, so it may wait up to ADMISSION_BACKGROUND_MAX_WAIT for a lull
+#
+# A call that can't be admitted raises AdmissionRejected, which callers
+# handle like any other OpenAI error. call() / acall() also send a call that
+# still hit a 429 (after the client's own retries) back through the queue, up
+# to ADMISSION_RETRIES times, instead of failing the reply.
+#
+#   with admission.slot(admission.BACKGROUND):
+#       client.beta.threads.create()
+#   reply = admission.call(lambda: client.chat.completions.create(...), admission.FIRST_CONTACT)
+#   reply = await admission.acall(lambda: client.chat.completions.create(...))
+#
+# Metrics: admission.wait (timing), admission.admitted, admission.rejected,
+# admission.displaced, admission.rate_limited, admission.retries,
+# admission.slow_calls;
+# admission.limit, admission.in_flight, admission.queue_depth (gauges).
+#
+#   ADMISSION                   "on" (default) or "off"
+#   ADMISSION_RPM               calls admitted per minute (default 500)
+#   ADMISSION_BURST             calls admitted back to back before pacing (default 20)
+#   ADMISSION_INITIAL_CONCURRENCY   starting window (default 8)
+#   ADMISSION_MIN_CONCURRENCY   (default 2)
+#   ADMISSION_MAX_CONCURRENCY   (default 32)
+#   ADMISSION_LATENCY_TARGET    seconds; slower calls shrink the window (default 15)
+#   ADMISSION_QUEUE_SIZE        max waiting calls (default 200)
+#   ADMISSION_MAX_WAIT          seconds a call may wait to be admitted (default 10)
+#   ADMISSION_BACKGROUND_MAX_WAIT   same, for BACKGROUND calls (default 120)
+#   ADMISSION_RETRIES           re-admissions after a 429 (default 2)
+
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+import metrics
+import resilience
+
+ADMISSION = os.getenv("ADMISSION", "on").lower()
+ADMISSION_RPM = float(os.getenv("ADMISSION_RPM", "500"))
+ADMISSION_BURST = float(os.getenv("ADMISSION_BURST", "20"))
+ADMISSION_INITIAL_CONCURRENCY = float(os.getenv("ADMISSION_INITIAL_CONCURRENCY", "8"))
+ADMISSION_MIN_CONCURRENCY = float(os.getenv("ADMISSION_MIN_CONCURRENCY", "2"))
+ADMISSION_MAX_CONCURRENCY = float(os.getenv("ADMISSION_MAX_CONCURRENCY", "32"))
+ADMISSION_LATENCY_TARGET = float(os.getenv("ADMISSION_LATENCY_TARGET", "15"))
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "200"))
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "10"))
+ADMISSION_BACKGROUND_MAX_WAIT = float(os.getenv("ADMISSION_BACKGROUND_MAX_WAIT", "120"))
+ADMISSION_RETRIES = int(os.getenv("ADMISSION_RETRIES", "2"))
+
+# Priorities, most urgent first
+FIRST_CONTACT = 0
+ONGOING = 1
+BACKGROUND = 2
+
+DECREASE_FACTOR = 0.5
+DECREASE_COOLDOWN = 2.0
+
+
+class AdmissionRejected(resilience.Rejected):
+    pass
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate  # tokens per second
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def delay(self):
+        # Seconds until a token is available (0: one is available now)
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(wait, self.paused_until - now)
+
+    def take(self):
+        self.tokens -= 1
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class _Waiter:
+    def __init__(self, priority, seq, wake):
+        self.priority = priority
+        self.seq = seq
+        self.wake = wake
+        self.displaced = False
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+def _rate_limit(error):
+    # (was this a 429, Retry-After seconds or None) for an OpenAI exception
+    if getattr(error, "status_code", None) != 429:
+        return False, None
+    response = getattr(error, "response", None)
+    try:
+        return True, float(response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return True, None
+
+
+class AdmissionController:
+    def __init__(self, rpm=ADMISSION_RPM, burst=ADMISSION_BURST, initial=ADMISSION_INITIAL_CONCURRENCY,
+                 minimum=ADMISSION_MIN_CONCURRENCY, maximum=ADMISSION_MAX_CONCURRENCY,
+                 latency_target=ADMISSION_LATENCY_TARGET, queue_size=ADMISSION_QUEUE_SIZE,
+                 max_wait=ADMISSION_MAX_WAIT, background_max_wait=ADMISSION_BACKGROUND_MAX_WAIT,
+                 enabled=ADMISSION != "off"):
+        self.bucket = TokenBucket(rpm / 60, burst)
+        self.limit = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_target = latency_target
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.background_max_wait = background_max_wait
+        self.enabled = enabled
+        self.queue = []  # heap of _Waiter
+        self.in_flight = 0
+        self.decreased_at = -math.inf
+        self.seq = itertools.count()
+        self.lock = threading.Lock()
+
+        metrics.set_gauge("admission.limit", lambda: round(self.limit, 2))
+        metrics.set_gauge("admission.in_flight", lambda: self.in_flight)
+        metrics.set_gauge("admission.queue_depth", lambda: len(self.queue))
+
+    # — queue
+
+    def _enqueue(self, priority, wake):
+        waiter = _Waiter(priority, next(self.seq), wake)
+        with self.lock:
+            if len(self.queue) >= self.queue_size:
+                worst = max(self.queue)
+                if not waiter < worst:
+                    metrics.inc("admission.rejected")
+                    raise AdmissionRejected("OpenAI admission queue is full")
+                # Make room by turning away the lowest-priority, newest waiter
+                self.queue.remove(worst)
+                heapq.heapify(self.queue)
+                worst.displaced = True
+                worst.wake()
+                metrics.inc("admission.displaced")
+            heapq.heappush(self.queue, waiter)
+        return waiter
+
+    def _try_admit(self, waiter):
+        # None once admitted, else seconds to wait before trying again
+        # (math.inf: until woken by a release or a new head of the queue)
+        with self.lock:
+            if waiter.displaced:
+                metrics.inc("admission.rejected")
+                raise AdmissionRejected("Displaced from the OpenAI admission queue")
+            if self.queue[0] is not waiter or self.in_flight >= max(int(self.limit), 1):
+                return math.inf
+            delay = self.bucket.delay()
+            if delay > 0:
+                return delay
+            self.bucket.take()
+            heapq.heappop(self.queue)
+            self.in_flight += 1
+            self._wake_head()
+            return None
+
+    def _give_up(self, waiter):
+        with self.lock:
+            if waiter in self.queue:
+                self.queue.remove(waiter)
+                heapq.heapify(self.queue)
+                self._wake_head()
+        metrics.inc("admission.rejected")
+        raise AdmissionRejected("Timed out waiting for OpenAI capacity")
+
+    def _max_wait(self, priority):
+        return self.background_max_wait if priority >= BACKGROUND else self.max_wait
+
+    def _wake_head(self):
+        if self.queue:
+            self.queue[0].wake()
+
+    # — window
+
+    def _release(self, seconds, rate_limited, retry_after):
+        now = time.monotonic()
+        with self.lock:
+            self.in_flight -= 1
+            slow = seconds > self.latency_target
+            if rate_limited:
+                metrics.inc("admission.rate_limited")
+                if retry_after:
+                    self.bucket.pause(retry_after)
+            elif slow:
+                metrics.inc("admission.slow_calls")
+            if rate_limited or slow:
+                if now - self.decreased_at >= DECREASE_COOLDOWN:
+                    self.limit = max(self.minimum, self.limit * DECREASE_FACTOR)
+                    self.decreased_at = now
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._wake_head()
+
+    # — public API
+
+    def acquire(self, priority=ONGOING):
+        event = threading.Event()
+        started = time.monotonic()
+        deadline = resilience.deadline_at(self._max_wait(priority))
+        waiter = self._enqueue(priority, event.set)
+        while True:
+            event.clear()
+            wait = self._try_admit(waiter)
+            if wait is None:
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._give_up(waiter)
+            event.wait(min(wait, remaining))
+        metrics.observe("admission.wait", time.monotonic() - started)
+        metrics.inc("admission.admitted")
+
+    async def aacquire(self, priority=ONGOING):
+        loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+        started = time.monotonic()
+        deadline = resilience.deadline_at(self._max_wait(priority))
+        waiter = self._enqueue(priority, lambda: loop.call_soon_threadsafe(event.set))
+        while True:
+            event.clear()
+            wait = self._try_admit(waiter)
+            if wait is None:
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._give_up(waiter)
+            try:
+                await asyncio.wait_for(event.wait(), min(wait, remaining))
+            except asyncio.TimeoutError:
+                pass
+        metrics.observe("admission.wait", time.monotonic() - started)
+        metrics.inc("admission.admitted")
+
+    @contextmanager
+    def slot(self, priority=ONGOING):
+        if not self.enabled:
+            yield
+            return
+        self.acquire(priority)
+        started = time.monotonic()
+        rate_limited, retry_after = False, None
+        try:
+            yield
+        except Exception as e:
+            rate_limited, retry_after = _rate_limit(e)
+            raise
+        finally:
+            self._release(time.monotonic() - started, rate_limited, retry_after)
+
+    @asynccontextmanager
+    async def aslot(self, priority=ONGOING):
+        if not self.enabled:
+            yield
+            return
+        await self.aacquire(priority)
+        started = time.monotonic()
+        rate_limited, retry_after = False, None
+        try:
+            yield
+        except Exception as e:
+            rate_limited, retry_after = _rate_limit(e)
+            raise
+        finally:
+            self._release(time.monotonic() - started, rate_limited, retry_after)
+
+    def _retry(self, error, attempt, retryable):
+        if not self.enabled or attempt >= ADMISSION_RETRIES or not _rate_limit(error)[0] or not retryable(error):
+            return False
+        metrics.inc("admission.retries")
+        return True
+
+    def call(self, fn, priority=ONGOING, retryable=lambda error: True):
+        # fn() in a slot; `retryable(error)` says whether a rate-limited
+        # attempt may simply be run again
+        for attempt in itertools.count():
+            try:
+                with self.slot(priority):
+                    return fn()
+            except Exception as e:
+                if not self._retry(e, attempt, retryable):
+                    raise
+
+    async def acall(self, fn, priority=ONGOING, retryable=lambda error: True):
+        # call() for a coroutine function
+        for attempt in itertools.count():
+            try:
+                async with self.aslot(priority):
+                    return await fn()
+            except Exception as e:
+                if not self._retry(e, attempt, retryable):
+                    raise
+
+
+# One controller per process, shared by every OpenAI caller
+controller = AdmissionController()
+
+
+def slot(priority=ONGOING):
+    return controller.slot(priority)
+
+
+def aslot(priority=ONGOING):
+    return controller.aslot(priority)
+
+
+def call(fn, priority=ONGOING, retryable=lambda error: True):
+    return controller.call(fn, priority, retryable)
+
+
+def acall(fn, priority=ONGOING, retryable=lambda error: True):
+    return controller.acall(fn, priority, retryable)
@@ -0,0 +1,430 @@
+# asgi_app.py
+#
+# asyncio-native version of the call handler. Serves the same routes as the
+# Flask apps (/sms-reply, /missed-call, /voice, /handle-recording,
+# /call-status, /sms-handler) but never blocks a thread on network I/O:
+# OpenAI goes through AsyncOpenAI and Google Sheets is called over a shared
+# httpx.AsyncClient, and outbound texts are handed to the SMS dispatcher's
+# send threads, so one process can hold hundreds of conversations at once.
+#
+# Replies get the same request deadline, timeouts and circuit breakers as the
+# Flask apps (resilience.py). Outbound texts go through the SMS dispatcher
+# (sms_dispatcher.py) and the "twilio" and "telnyx" breakers.
+#
+# Run with any ASGI server, e.g.
+#   uvicorn asgi_app:app --host 0.0.0.0 --port 5000
+
+from dotenv import load_dotenv
+load_dotenv()
+
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+
+import httpx
+from openai import AsyncOpenAI
+from quart import Quart, request, Response
+
+import metrics
+import resilience
+from chat_engine import make_reply_engine
+from handle_index import HandleIndex
+from log_sinks import make_turn_log
+from run_completion import areply_in_thread
+from sms_dispatcher import SMS_WORKERS, SmsDispatcher
+from webhook_dedup import adedup_webhooks, make_webhook_index
+from messaging import ERROR_REPLY, InboundText, TelnyxAdapter, TwilioAdapter
+from twiml_templates import TwimlTemplates
+from sheet_log_writer import REPLAY_CHECK_ROWS, SHEETS_BATCH_SIZE, SHEETS_FLUSH_SECONDS
+from thread_store import make_thread_store, normalize_number
+from turn_journal import make_turn_queue
+
+ASSISTANT_ID = os.getenv("OPENAI_ASSISTANT_ID")
+TWILIO_SID = os.getenv("TWILIO_SID")
+TWILIO_AUTH = os.getenv("TWILIO_AUTH")
+TWILIO_NUMBER = os.getenv("TWILIO_NUMBER")
+TELNYX_KEY = os.getenv("TELNYX_API_KEY")
+TELNYX_NUM = os.getenv("TELNYX_NUMBER")
+SPREADSHEET_ID = os.getenv("SPREADSHEET_ID")
+GOOGLE_CREDS = os.getenv("GOOGLE_CREDENTIALS_JSON", "google-credentials.json")
+
+# Upstream base URLs can be pointed at local stand-ins for testing/benchmarks
+TWILIO_API_BASE = os.getenv("TWILIO_API_BASE", "https://api.twilio.com")
+TELNYX_API_BASE = os.getenv("TELNYX_API_BASE", "https://api.telnyx.com")
+SHEETS_API_BASE = os.getenv("SHEETS_API_BASE", "https://sheets.googleapis.com")
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "200"))
+
+app = Quart(__name__)
+# Redelivered webhooks get the first delivery's response instead of a rerun (webhook_dedup.py)
+webhooks = make_webhook_index()
+adedup_webhooks(app, webhooks)
+# Static TwiML is rendered once, not rebuilt per call (twiml_templates.py)
+twiml = TwimlTemplates()
+
+# Created on startup so they bind to the server's event loop
+client = None
+http = None
+reply_engine = None  # REPLY_ENGINE=chat: chat completions with local history
+
+# Conversation thread per caller, plus a lock per caller so two concurrent
+# texts from the same number don't create two threads (or interleave chat
+# history); different numbers never wait for each other
+thread_store = make_thread_store()
+
+
+class NumberLocks:
+    # An asyncio.Lock per number, kept only while someone holds or awaits it
+    def __init__(self):
+        self.locks = {}  # number -> [lock, holders + waiters]
+
+    @asynccontextmanager
+    async def hold(self, number):
+        key = normalize_number(number)
+        entry = self.locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self.locks[key]
+
+
+thread_locks = NumberLocks()
+
+
+@app.before_serving
+async def startup():
+    global client, http, reply_engine
+    http = httpx.AsyncClient(
+        timeout=httpx.Timeout(15.0),
+        limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=50),
+    )
+    client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), timeout=resilience.OPENAI_TIMEOUT)
+    reply_engine = make_reply_engine(client)
+    if sheets.enabled:
+        sheets.task = asyncio.create_task(sheets.run())
+    print("✅ Async call handler ready")
+
+
+@app.after_serving
+async def shutdown():
+    if sheets.task:
+        sheets.task.cancel()
+        try:
+            await asyncio.wait_for(sheets.flush(), timeout=10)
+        except Exception:
+            pass  # still journaled; written on the next start
+    await http.aclose()
+    await client.close()
+    await asyncio.to_thread(outbox.stop)
+
+
+# — Google Sheets over the REST API
+
+class AsyncSheetsLogger:
+    name = "sheets"
+    SCOPE = [
+        "https://spreadsheets.google.com/feeds",
+        "https://www.googleapis.com/auth/drive",
+    ]
+
+    def __init__(self, spreadsheet_id, creds_path):
+        self.spreadsheet_id = spreadsheet_id
+        self.creds_path = creds_path
+        self.creds = None
+        self.token = None
+        self.token_expires = 0
+        self.tabs = None
+        self.lock = asyncio.Lock()
+        self.handles = HandleIndex()
+        self.index_lock = asyncio.Lock()
+        self.queue = make_turn_queue() if self.enabled else None
+        self.wake = asyncio.Event()
+        self.loop = None  # set by run(); put() is called from worker threads
+        # Turns left over from a previous run may already be in the sheet
+        self.recovering = bool(self.queue)
+        self.task = None
+
+    @property
+    def enabled(self):
+        return bool(self.spreadsheet_id) and os.path.exists(self.creds_path)
+
+    async def _headers(self):
+        # oauth2client's token exchange is blocking, so run it off the loop;
+        # the token is reused until shortly before it expires
+        if not self.token or time.time() > self.token_expires - 60:
+            async with self.lock:
+                if not self.token or time.time() > self.token_expires - 60:
+                    if self.creds is None:
+                        from oauth2client.service_account import ServiceAccountCredentials
+                        self.creds = ServiceAccountCredentials.from_json_keyfile_name(self.creds_path, self.SCOPE)
+                    info = await asyncio.to_thread(self.creds.get_access_token)
+                    self.token = info.access_token
+                    self.token_expires = time.time() + (info.expires_in or 3600)
+        return {"Authorization": f"Bearer {self.token}"}
+
+    def _url(self, suffix=""):
+        return f"{SHEETS_API_BASE}/v4/spreadsheets/{self.spreadsheet_id}{suffix}"
+
+    async def _ensure_tab(self, title):
+        if self.tabs is None:
+            r = await http.get(self._url(), params={"fields": "sheets.properties.title"}, headers=await self._headers())
+            r.raise_for_status()
+            self.tabs = {s["properties"]["title"] for s in r.json().get("sheets", [])}
+        if title in self.tabs:
+            return
+        print(f"➕ Creating sheet tab '{title}'")
+        r = await http.post(
+            self._url(":batchUpdate"),
+            json={"requests": [{"addSheet": {"properties": {
+                "title": title, "gridProperties": {"rowCount": 1, "columnCount": 4},
+            }}}]},
+            headers=await self._headers(),
+        )
+        r.raise_for_status()
+        self.tabs.add(title)
+        await self._append(title, [["Date/Time", "Source", "Username/Handle", "Conversation"]])
+
+    async def _append(self, title, rows):
+        r = await http.post(
+            self._url(f"/values/'{title}'!A:D:append"),
+            params={"valueInputOption": "RAW", "insertDataOption": "INSERT_ROWS"},
+            json={"values": rows},
+            headers=await self._headers(),
+        )
+        r.raise_for_status()
+        return r.json()
+
+    async def _index(self, title):
+        # Column C is only downloaded when the tab's handle index needs (re)loading
+        if not self.handles.needs_load(title):
+            return
+        async with self.index_lock:
+            if self.handles.needs_load(title):
+                r = await http.get(self._url(f"/values/'{title}'!C:C"), headers=await self._headers())
+                r.raise_for_status()
+                self.handles.load(title, [row[0] if row else "" for row in r.json().get("values", [])])
+
+    def put(self, turn):
+        # The "sheets" log sink: journaled locally (turn_journal.py) and
+        # written by run(); never blocks the reply on Sheets, and turns
+        # survive an outage or restart
+        if self.queue is None:
+            return
+        self.queue.put(turn)
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.wake.set)
+
+    async def run(self):
+        # Background task: drain the journal every SHEETS_FLUSH_SECONDS, or
+        # as soon as a turn is queued
+        self.loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await asyncio.wait_for(self.wake.wait(), SHEETS_FLUSH_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self.wake.clear()
+            if not await self.flush():
+                await asyncio.sleep(SHEETS_FLUSH_SECONDS)  # Sheets is down; don't spin
+
+    async def _unwritten(self, title, batch):
+        # After a restart or a failed write, skip turns already at the end of the tab
+        last_row = self.handles.row_count(title)
+        first_row = max(2, last_row - 3 * len(batch) - REPLAY_CHECK_ROWS)
+        r = await http.get(self._url(f"/values/'{title}'!A{first_row}:D{last_row}"), headers=await self._headers())
+        r.raise_for_status()
+        written = {(row[0], row[2].strip().lower(), row[3]) for row in r.json().get("values", []) if len(row) >= 4}
+        return [t for t in batch if (t[1], t[3].strip().lower(), f"User: {t[4]}") not in written]
+
+    async def flush(self):
+        while len(self.queue):
+            batch = await asyncio.to_thread(self.queue.peek, SHEETS_BATCH_SIZE)
+            month = batch[0][0]
+            batch = [turn for turn in batch if turn[0] == month]
+            try:
+                await self._ensure_tab(month)
+                await self._index(month)
+                pending = await self._unwritten(month, batch) if self.recovering else batch
+                rows = []
+                for _, now, platform, handle, user_msg, ai_reply, *_ in pending:
+                    if self.handles.claim_new(month, handle):
+                        rows.append([now, platform, handle, f"🟢 New conversation with {handle}"])
+                    rows.append([now, platform, handle, f"User: {user_msg}"])
+                    rows.append([now, platform, handle, f"AI: {ai_reply}"])
+                if rows:
+                    self.handles.appending(month)
+                    response = await self._append(month, rows)
+                    self.handles.appended(month, response, len(rows))
+            except Exception as e:
+                print("❌ Error logging to Google Sheets:", e)
+                self.handles.invalidate()
+                self.tabs = None
+                self.recovering = True
+                return False
+            self.recovering = False
+            await asyncio.to_thread(self.queue.ack, batch)
+        return True
+
+
+sheets = AsyncSheetsLogger(SPREADSHEET_ID, GOOGLE_CREDS)
+# Every turn goes to the configured log sinks (LOG_SINKS): SQLite, the sheet, the archive
+turn_log = make_turn_log(sheets=lambda: sheets)
+
+
+# — outbound SMS
+
+# Texts are queued and sent by the SMS dispatcher (sms_dispatcher.py): paced
+# per number, retried, and never awaited by a handler. Its few send threads
+# share a keep-alive client of their own.
+sms_http = httpx.Client(timeout=httpx.Timeout(15.0), limits=httpx.Limits(max_keepalive_connections=SMS_WORKERS))
+
+
+def _post_sms(upstream, url, timeout, **kwargs):
+    r = resilience.guarded(upstream, lambda: sms_http.post(url, timeout=resilience.timeout_for(timeout), **kwargs),
+                           lambda r: r.status_code)
+    r.raise_for_status()
+
+
+def _twilio_send(from_, to, body):
+    _post_sms("twilio", f"{TWILIO_API_BASE}/2010-04-01/Accounts/{TWILIO_SID}/Messages.json", resilience.TWILIO_TIMEOUT,
+              data={"To": to, "From": from_, "Body": body}, auth=(TWILIO_SID, TWILIO_AUTH))
+
+
+def _telnyx_send(from_, to, text):
+    _post_sms("telnyx", f"{TELNYX_API_BASE}/v2/messages", resilience.TELNYX_TIMEOUT,
+              json={"from": from_, "to": to, "text": text}, headers={"Authorization": f"Bearer {TELNYX_KEY}"})
+
+
+outbox = SmsDispatcher({"twilio": _twilio_send, "telnyx": _telnyx_send}).start()
+
+
+def send_twilio_sms(to_number, body):
+    return outbox.send("twilio", TWILIO_NUMBER, to_number, body)
+
+
+# — AI replies
+
+async def generate_reply(from_number, user_msg):
+    async with thread_locks.hold(from_number):
+        if reply_engine:
+            return await reply_engine.areply(from_number, user_msg)
+        # Message + run in one request; a first-time caller's thread comes from create_and_run
+        thread_id = await asyncio.to_thread(thread_store.get, from_number)  # SQLite: off the loop
+        new_thread_id, reply = await areply_in_thread(client, thread_id, ASSISTANT_ID, user_msg)
+        if new_thread_id != thread_id:
+            await asyncio.to_thread(thread_store.set, from_number, new_thread_id)
+        return reply
+
+
+# Both carriers' texts go through the same steps as messaging.py's pipeline,
+# on the event loop: the adapter parses the webhook, then generate, log and
+# reply (in the webhook response for Twilio, by text for Telnyx)
+twilio_texts = TwilioAdapter(TWILIO_NUMBER, twiml)
+telnyx_texts = TelnyxAdapter(TELNYX_NUM if TELNYX_KEY else None)
+
+
+async def handle_text(adapter, form, payload=None):
+    inbound = adapter.parse(form, payload)
+    if not isinstance(inbound, InboundText):
+        metrics.inc("messages.ignored")
+        return inbound
+    metrics.inc(f"messages.{adapter.name}")
+
+    try:
+        with metrics.timer("asgi.reply"), resilience.deadline(resilience.REQUEST_DEADLINE_SECONDS):
+            reply = await generate_reply(inbound.from_number, inbound.text)
+        # Logging doesn't affect the reply, so don't make the caller wait on
+        # it; the sinks write to SQLite and disk, so off the loop (never raises)
+        asyncio.get_running_loop().run_in_executor(
+            None, turn_log.log_turn, "SMS", inbound.from_number, inbound.text, reply)
+    except Exception as e:
+        print("❌ OpenAI error:", e)
+        reply = ERROR_REPLY
+
+    if adapter.replies_inline:
+        return adapter.reply(reply)
+    if adapter.number:
+        outbox.send(adapter.name, adapter.number, inbound.from_number, reply)
+    else:
+        print(f"❌ Missing {adapter.name} number")
+    return adapter.ack()
+
+
+@app.route("/sms-reply", methods=["POST"])
+async def sms_reply():
+    return await handle_text(twilio_texts, await request.form)
+
+
+@app.route("/sms-handler", methods=["POST"])
+async def sms_handler():
+    return await handle_text(telnyx_texts, {}, await request.get_json(force=True, silent=True))
+
+
+@app.route("/missed-call", methods=["POST"])
+async def missed_call():
+    form = await request.form
+    from_number = form.get("From")
+    if await asyncio.to_thread(webhooks.allow_outreach, from_number):
+        if not send_twilio_sms(from_number, "Hey! Sorry we missed your call. How can we help you today?"):
+            await asyncio.to_thread(webhooks.release_outreach, from_number)
+
+    return Response(twiml.missed_call(), mimetype="application/xml")
+
+
+@app.route("/voice", methods=["POST"])
+async def voice():
+    return Response(twiml.voice(), mimetype="application/xml")
+
+
+@app.route("/handle-recording", methods=["POST"])
+async def handle_recording():
+    form = await request.form
+    recording_url = form.get("RecordingUrl")
+    caller = form.get("From")
+    send_twilio_sms(os.getenv("OWNER_NUMBER"), f"Voicemail from {caller}: {recording_url}")
+    return "", 200
+
+
+@app.route("/call-status", methods=["POST"])
+async def call_status():
+    form = await request.form
+    call_status = form.get("CallStatus")
+    from_number = form.get("From")
+
+    if call_status in ["no-answer", "busy", "failed", "canceled"]:
+        if await asyncio.to_thread(webhooks.allow_outreach, from_number):
+            if not send_twilio_sms(from_number, "We noticed you called but didn’t get through. Can we help?"):
+                await asyncio.to_thread(webhooks.release_outreach, from_number)
+
+    return "", 200
+
+
+@app.route("/test-gpt", methods=["GET"])
+async def test_gpt():
+    try:
+        _, reply = await areply_in_thread(client, None, ASSISTANT_ID, "Say hi in 3 words")
+        return reply, 200
+    except Exception as e:
+        print("❌ GPT ERROR:", e)
+        return f"GPT error: {e}", 500
+
+
+@app.route("/metrics", methods=["GET"])
+async def metrics_snapshot():
+    return metrics.snapshot(), 200
+
+
+@app.route("/", methods=["GET", "HEAD"])
+async def home():
+    return "AI Call Handler (async) is running.", 200
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    port = int(os.environ.get("PORT", 5000))
+    uvicorn.run(app, host="0.0.0.0", port=port)
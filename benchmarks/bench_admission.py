@@ -0,0 +1,95 @@
+# benchmarks/bench_admission.py
+#
+# A burst of texts (a radio ad: every reply requested within a couple of
+# seconds) against a fake OpenAI account that serves 8 runs at once and
+# answers 429 beyond that. Without admission control every handler calls at
+# once and leads fail after the client's retries run out; with it
+# (admission.py) calls queue, the AIMD window settles below the account's
+# limit, and first contacts are answered before ongoing chats.
+#
+#   python benchmarks/bench_admission.py [replies] [burst seconds]
+
+import os
+import random
+import sys
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from openai import OpenAI
+
+import admission
+import metrics
+from fake_openai import FakeOpenAIServer
+from run_completion import reply_in_thread
+
+CAPACITY = 8
+
+
+def percentile(values, pct):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)]
+
+
+def burst(client, threads, replies, spread):
+    random.seed(7)
+    arrivals = sorted(random.uniform(0, spread) for _ in range(replies))
+    start = time.perf_counter()
+
+    def one(i):
+        time.sleep(max(arrivals[i] - (time.perf_counter() - start), 0))
+        first = i % 3 == 0
+        sent = time.perf_counter()
+        try:
+            reply_in_thread(client, None if first else threads[i], "asst_fake", "Do you plow driveways in Laval?",
+                            timeout=60)
+            return first, time.perf_counter() - sent, True
+        except Exception:
+            return first, time.perf_counter() - sent, False
+
+    with ThreadPoolExecutor(max_workers=replies) as pool:
+        return list(pool.map(one, range(replies)))
+
+
+def report(name, server, results):
+    answered = [r for r in results if r[2]]
+    first = [seconds for is_first, seconds, ok in answered if is_first]
+    ongoing = [seconds for is_first, seconds, ok in answered if not is_first]
+    print(f"{name:<16}{len(answered):>5}/{len(results):<5}{server.state.calls['rate_limited']:>8}"
+          f"{percentile(first, 50):>10.2f}{percentile(first, 95):>10.2f}"
+          f"{percentile(ongoing, 50):>10.2f}{percentile(ongoing, 95):>10.2f}")
+
+
+def main():
+    warnings.filterwarnings("ignore", category=DeprecationWarning)
+    replies = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    spread = float(sys.argv[2]) if len(sys.argv) > 2 else 2.0
+
+    server = FakeOpenAIServer(latency=(1.0, 2.0), rtt=0.02, capacity=CAPACITY).start()
+    client = OpenAI(base_url=server.url, api_key="fake")  # default retries, as in the apps
+    threads = [client.beta.threads.create().id for _ in range(replies)]
+
+    print(f"{replies} replies within {spread:g}s, account serves {CAPACITY} runs at once, model 1–2s\n")
+    print(f"{'mode':<16}{'answered':>10}{'429s':>9}{'first p50':>10}{'p95':>10}{'ongoing p50':>12}{'p95':>8}")
+    try:
+        for name, controller in (
+            ("no admission", admission.AdmissionController(enabled=False)),
+            ("admission", admission.AdmissionController(initial=16, max_wait=60)),
+        ):
+            admission.controller = controller
+            metrics.reset()
+            server.state.calls.clear()
+            report(name, server, burst(client, threads, replies, spread))
+            time.sleep(2.5)  # let the fake account's runs drain
+        print(f"\nwindow settled at {controller.limit:.1f}, "
+              f"mean admission wait {metrics.snapshot()['timings']['admission.wait']['mean']:.2f}s")
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+# benchmarks/bench_asgi_load.py
+#
+# Load test: Flask app (app4.5.py) vs the asyncio app (asgi_app.py) on
+# /sms-reply, both talking to the local fake OpenAI server. Reports
+# requests/sec, latency percentiles and the server's peak RSS / thread count.
+#
+#   python benchmarks/bench_asgi_load.py [requests] [concurrency]
+
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+REPO = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+FAKE_OPENAI_PORT = 8765
+FLASK_PORT = 8801
+ASGI_PORT = 8802
+
+
+def proc_status(pid):
+    # Peak resident memory (MB) and current thread count from /proc
+    fields = {}
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            fields[key] = value.strip()
+    return int(fields["VmHWM"].split()[0]) / 1024, int(fields["Threads"])
+
+
+async def sample_threads(pid, peak):
+    while True:
+        peak[0] = max(peak[0], proc_status(pid)[1])
+        await asyncio.sleep(0.1)
+
+
+def start(cmd, port, env, cwd):
+    proc = subprocess.Popen(cmd, env=env, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 20
+    while time.time() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/", timeout=1)
+            return proc
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError(f"{cmd} did not start")
+
+
+async def load(pid, port, total, concurrency):
+    latencies = []
+    errors = 0
+    sem = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(limits=limits, timeout=60) as http:
+        async def one(i):
+            nonlocal errors
+            async with sem:
+                start = time.perf_counter()
+                try:
+                    r = await http.post(
+                        f"http://127.0.0.1:{port}/sms-reply",
+                        data={"Body": "What are your hours?", "From": f"+1514555{i:04d}"},
+                    )
+                    if r.status_code != 200 or b"Sorry" in r.content:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        peak_threads = [0]
+        sampler = asyncio.create_task(sample_threads(pid, peak_threads))
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(total)))
+        elapsed = time.perf_counter() - start
+        sampler.cancel()
+
+    latencies.sort()
+    return {
+        "rps": total / elapsed,
+        "p50": latencies[len(latencies) // 2],
+        "p95": latencies[int(len(latencies) * 0.95) - 1],
+        "errors": errors,
+        "threads": peak_threads[0],
+    }
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+    # Run the apps from an empty directory so there are no Google credentials
+    # and Sheets logging fails fast instead of hitting the network
+    workdir = tempfile.mkdtemp()
+    env = dict(
+        os.environ,
+        PYTHONPATH=REPO,
+        OPENAI_API_KEY="sk-fake-benchmark",
+        OPENAI_BASE_URL=f"http://127.0.0.1:{FAKE_OPENAI_PORT}/v1",
+        OPENAI_ASSISTANT_ID="asst_fake",
+        TWILIO_SID="ACfake",
+        TWILIO_AUTH="fake",
+        PYTHONWARNINGS="ignore",
+        ADMISSION="off",  # measure the servers, not the OpenAI rate limiter
+    )
+
+    fake = start(
+        [sys.executable, os.path.join(REPO, "benchmarks", "fake_openai.py")],
+        FAKE_OPENAI_PORT, dict(env, FAKE_OPENAI_PORT=str(FAKE_OPENAI_PORT)), workdir,
+    )
+    servers = {
+        "flask (app4.5.py)": ([sys.executable, os.path.join(REPO, "app4.5.py")], FLASK_PORT),
+        "asgi (asgi_app.py)": (
+            [sys.executable, "-m", "uvicorn", "asgi_app:app", "--port", str(ASGI_PORT), "--log-level", "warning"],
+            ASGI_PORT,
+        ),
+    }
+
+    print(f"{total} requests, concurrency {concurrency}\n")
+    print(f"{'server':<20}{'req/s':>8}{'p50 (s)':>9}{'p95 (s)':>9}{'errors':>8}{'peak RSS MB':>13}{'peak threads':>14}")
+    try:
+        for name, (cmd, port) in servers.items():
+            proc = start(cmd, port, dict(env, PORT=str(port)), workdir)
+            try:
+                result = asyncio.run(load(proc.pid, port, total, concurrency))
+                rss = proc_status(proc.pid)[0]
+            finally:
+                proc.terminate()
+                proc.wait()
+            print(
+                f"{name:<20}{result['rps']:>8.1f}{result['p50']:>9.3f}{result['p95']:>9.3f}"
+                f"{result['errors']:>8}{rss:>13.1f}{result['threads']:>14}"
+            )
+    finally:
+        fake.terminate()
+        fake.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# benchmarks/bench_calculator.py
+#
+# The safe_calculate tool: the old regex + eval() version vs the bounded AST
+# evaluator in calculator.py, cold (cache cleared before every call) and with
+# its LRU cache, on the kind of arithmetic the assistant asks for. Then the
+# adversarial inputs the old version let through, which the new one refuses
+# in microseconds.
+#
+#   python benchmarks/bench_calculator.py [iterations]
+
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import calculator
+
+EXPRESSIONS = [
+    "45 * 12", "1200 * 0.15", "(350 + 125) * 1.14975", "2 * (40 + 25) * 3.5", "1500 / 12",
+    "85 * 4 + 60", "3000 - 450", "12.5 * 12.5", "199.99 * 3", "(18 * 24) / 9",
+]
+
+ADVERSARIAL = ["9**9**6", "10**10**5", "2**2**22"]
+
+
+def old_safe_calculate(expression):
+    # app5.py before calculator.py
+    try:
+        cleaned = re.sub(r"[^0-9\.\+\-\*/\(\)\sx]", "", expression)
+        return eval(cleaned, {"__builtins__": {}})
+    except Exception as e:
+        return f"Could not calculate: {e}"
+
+
+def new_cold(expression):
+    calculator._evaluate.cache_clear()
+    return calculator.safe_calculate(expression)
+
+
+def per_call(fn, iterations):
+    start = time.perf_counter()
+    for i in range(iterations):
+        fn(EXPRESSIONS[i % len(EXPRESSIONS)])
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    for expression in EXPRESSIONS:
+        old, new = old_safe_calculate(expression), calculator.safe_calculate(expression)
+        assert abs(old - new) < 1e-6, (expression, old, new)
+
+    print(f"{len(EXPRESSIONS)} typical expressions, {iterations} calls each mode\n")
+    print(f"{'mode':<24}{'µs/call':>10}")
+    for name, fn in (("old regex + eval", old_safe_calculate),
+                     ("AST evaluator (cold)", new_cold),
+                     ("AST evaluator (cached)", calculator.safe_calculate)):
+        print(f"{name:<24}{per_call(fn, iterations) * 1e6:>10.1f}")
+
+    print(f"\n{'adversarial input':<16}{'old (ms)':>12}{'new (µs)':>12}   new result")
+    for expression in ADVERSARIAL:
+        start = time.perf_counter()
+        old_safe_calculate(expression)
+        old = time.perf_counter() - start
+        start = time.perf_counter()
+        result = new_cold(expression)
+        new = time.perf_counter() - start
+        print(f"{expression:<16}{old * 1e3:>12.1f}{new * 1e6:>12.1f}   {result}")
+    print("9**9**9 is not timed for the old version: it runs for minutes.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# benchmarks/bench_cold_start.py
+#
+# Cold start of the call handler (call_handler.create_app): each run is a new
+# Python process in an empty directory, against the local fake OpenAI server,
+# with outbound texts stubbed out. Times, from the moment the process is
+# spawned:
+#
+#   ready        interpreter start + imports + create_app: when the app can
+#                take its first request
+#   /voice       ready + the first call forwarded (no model involved)
+#   first text   ready + the first /sms-reply answered by the model
+#
+# for each LAZY_INIT mode ("off" builds every client in create_app, as the
+# separate apps did), and which heavy packages were already imported when the
+# app was ready. Also the import cost of each of those packages on its own.
+#
+#   python benchmarks/bench_cold_start.py [runs] [app ...]
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, REPO)
+
+HEAVY = ["openai", "twilio.rest", "twilio.twiml", "telnyx", "gspread", "oauth2client.service_account", "numpy", "tiktoken"]
+MODES = ["off", "on", "background"]
+APPS = ["app4.5.py", "app5.py", "app.py"]
+TEXT = {"MessageSid": "SM0123", "From": "+15145550000", "Body": "Can you come out to Laval on Saturday?"}
+
+
+def child(app_path, spawned):
+    # One cold start; prints its timings as JSON on the last line
+    import importlib.util
+
+    spec = importlib.util.spec_from_file_location("cold_app", app_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    app = module.app
+    ready = time.time() - spawned
+    loaded = [name for name in HEAVY if name in sys.modules]
+    app.extensions["call_handler"].outbox.send = lambda *args: True
+    client = app.test_client()
+
+    start = time.perf_counter()
+    assert client.post("/voice", data={"From": "+15145550000"}).status_code == 200
+    voice = time.perf_counter() - start
+    start = time.perf_counter()
+    reply = client.post("/sms-reply", data=TEXT)
+    assert reply.status_code == 200 and b"<Message>" in reply.data, reply.data
+    text = time.perf_counter() - start
+    print(json.dumps({"ready": ready, "voice": ready + voice, "text": ready + voice + text, "loaded": loaded}))
+
+
+def cold_start(app, mode, env):
+    workdir = tempfile.mkdtemp()
+    out = subprocess.run(
+        [sys.executable, __file__, "--child", os.path.join(REPO, app), repr(time.time())],
+        env=dict(env, LAZY_INIT=mode), cwd=workdir, capture_output=True, text=True, timeout=120,
+    )
+    if out.returncode:
+        raise RuntimeError(out.stderr[-2000:])
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def import_cost(name, env):
+    # Seconds to import `name` in a fresh interpreter (best of 3)
+    code = f"import time; t = time.perf_counter(); import {name}; print(time.perf_counter() - t)"
+    runs = [subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True) for _ in range(3)]
+    costs = [float(run.stdout) for run in runs if run.returncode == 0]
+    return min(costs) if costs else None
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    apps = sys.argv[2:] or APPS
+
+    sys.path.insert(0, os.path.dirname(__file__))
+    from fake_openai import FakeOpenAIServer
+    server = FakeOpenAIServer(latency=(0.05, 0.05)).start()
+    env = dict(
+        os.environ,
+        PYTHONPATH=REPO,
+        PYTHONWARNINGS="ignore",
+        OPENAI_API_KEY="sk-fake-benchmark",
+        OPENAI_BASE_URL=server.url,
+        OPENAI_ASSISTANT_ID="asst_fake",
+        TWILIO_SID="ACfake",
+        TWILIO_AUTH="fake",
+        TWILIO_NUMBER="+15145550100",
+        FORWARD_TO_NUMBER="+15145550199",
+        RUN_DEBOUNCE_SECONDS="0",
+        REPLY_MODE="sync",
+        LOG_SINKS="sqlite",
+    )
+
+    print(f"median of {runs} cold starts, seconds from process spawn\n")
+    print(f"{'app':<12}{'LAZY_INIT':<12}{'ready':>8}{'/voice':>8}{'first text':>12}   imported when ready")
+    for app in apps:
+        for mode in MODES:
+            results = [cold_start(app, mode, env) for _ in range(runs)]
+            median = {key: statistics.median(r[key] for r in results) for key in ("ready", "voice", "text")}
+            print(f"{app:<12}{mode:<12}{median['ready']:>8.3f}{median['voice']:>8.3f}{median['text']:>12.3f}"
+                  f"   {', '.join(results[-1]['loaded']) or '-'}")
+
+    print(f"\n{'package':<30}{'import (s)':>11}")
+    for name in HEAVY:
+        cost = import_cost(name, env)
+        print(f"{name:<30}{'not installed' if cost is None else f'{cost:.3f}':>11}")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--child"]:
+        child(sys.argv[2], float(sys.argv[3]))
+    else:
+        main()
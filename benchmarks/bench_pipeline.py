@@ -0,0 +1,119 @@
+# benchmarks/bench_pipeline.py
+#
+# Per-message overhead of the messaging pipeline (messaging.py), with the
+# model and the carrier taken out: answer() returns a canned reply at once and
+# the outbox only counts texts. Times, per inbound text:
+#
+#   parse      the adapter turning the webhook into an InboundText
+#   pipeline   MessagePipeline.handle (parse, coordinator, answer, dispatch)
+#   flask      a full POST through the Flask test client, both carriers
+#              routed on one app
+#
+# and, for comparison, the Telnyx handler telnyx-test.py had before the
+# pipeline, which printed the raw body, the headers and the parsed JSON on
+# every webhook. stdout goes to /dev/null while timing, so the dumps cost
+# only the formatting here; behind a real log pipe they cost more.
+#
+#   python benchmarks/bench_pipeline.py [iterations]
+
+import contextlib
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from flask import Flask, request
+
+from messaging import MessagePipeline, TelnyxAdapter, TwilioAdapter
+from run_coordinator import RunCoordinator
+from twiml_templates import TwimlTemplates
+
+NUMBER = "+15145550100"
+TWILIO_FORM = {"MessageSid": "SM0123", "From": "+15145550000", "To": NUMBER, "Body": "Do you plow driveways in Laval?"}
+TELNYX_EVENT = {"data": {"id": "evt-0123", "event_type": "message.received", "payload": {
+    "direction": "inbound", "text": "Do you plow driveways in Laval?",
+    "from": {"phone_number": "+15145550000"}, "to": [{"phone_number": NUMBER}]}}}
+
+
+class CountingOutbox:
+    def __init__(self):
+        self.sent = 0
+
+    def send(self, provider, from_, to, body):
+        self.sent += 1
+        return True
+
+
+def legacy_telnyx_route(app):
+    # /sms-handler as telnyx-test.py had it, reply loop stubbed out
+    @app.route("/legacy-sms-handler", methods=["POST"])
+    def legacy_sms_handler():
+        print("📩 RAW BODY:", request.data)
+        print("📩 HEADERS:", dict(request.headers))
+        try:
+            data = request.get_json(force=True)
+            print("📨 Parsed JSON:", data)
+        except Exception as e:
+            print("❌ JSON parse failed:", e)
+            return "Bad JSON", 400
+        event_type = data.get("data", {}).get("event_type")
+        if event_type != "message.received":
+            return "OK", 200
+        payload = data["data"]["payload"]
+        if payload.get("direction") != "inbound":
+            return "OK", 200
+        incoming_message = payload.get("text")
+        from_number = payload.get("from", {}).get("phone_number")
+        if not incoming_message or not from_number:
+            return "Missing data", 400
+        print("🧪 Incoming text:", incoming_message)
+        print("🧪 From number:", from_number)
+        print("🤖 AI Reply:", "We do! Want a quote?")
+        return "OK", 200
+
+
+def per_message(fn, iterations):
+    fn()  # warm up
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    outbox = CountingOutbox()
+    pipeline = MessagePipeline(lambda number, text: "We do! Want a quote?", outbox,
+                               coordinator=RunCoordinator(debounce=0, max_wait=0), reply_mode="sync")
+    twilio = TwilioAdapter(NUMBER, TwimlTemplates())
+    telnyx = TelnyxAdapter(NUMBER)
+
+    app = Flask(__name__)
+    pipeline.route(app, twilio)
+    pipeline.route(app, telnyx)
+    legacy_telnyx_route(app)
+    client = app.test_client()
+    body = json.dumps(TELNYX_EVENT)
+
+    cases = [
+        ("parse", "twilio", lambda: twilio.parse(TWILIO_FORM)),
+        ("parse", "telnyx", lambda: telnyx.parse({}, TELNYX_EVENT)),
+        ("pipeline", "twilio", lambda: pipeline.handle(twilio, TWILIO_FORM)),
+        ("pipeline", "telnyx", lambda: pipeline.handle(telnyx, {}, TELNYX_EVENT)),
+        ("flask", "twilio", lambda: client.post("/sms-reply", data=TWILIO_FORM)),
+        ("flask", "telnyx", lambda: client.post("/sms-handler", data=body, content_type="application/json")),
+        ("flask", "telnyx, old", lambda: client.post("/legacy-sms-handler", data=body, content_type="application/json")),
+    ]
+    print(f"{iterations} messages per case; model and carrier stubbed out\n")
+    print(f"{'stage':<10}{'carrier':<14}{'µs/message':>12}")
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        results = [(stage, carrier, per_message(fn, iterations)) for stage, carrier, fn in cases]
+    for stage, carrier, micros in results:
+        print(f"{stage:<10}{carrier:<14}{micros:>12.1f}")
+    print(f"\ntexts handed to the outbox: {outbox.sent}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+# benchmarks/bench_reply_engine.py
+#
+# Assistants threads vs the chat-completions engine (chat_engine.py) on the
+# same multi-turn SMS conversations, against the local fake OpenAI server with
+# a simulated network round-trip on every request. Reports per reply:
+#   - HTTP round-trips on the reply path (the chat engine's background
+#     summaries are counted separately)
+#   - reply latency
+#   - prompt tokens billed (an Assistants run re-reads the whole thread; the
+#     chat engine sends a bounded window plus a summary)
+#
+#   python benchmarks/bench_reply_engine.py [conversations] [turns] [rtt seconds]
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from openai import OpenAI
+
+from chat_engine import ChatEngine, ChatHistoryStore
+from fake_openai import FakeOpenAIServer
+from run_completion import reply_in_thread
+
+CUSTOMER_TEXTS = [
+    "Hi, do you do snow removal in Laval?",
+    "We have a double driveway and a walkway to the front door, about 40 feet long.",
+    "How often do you come by after a storm? Last year our company came way too late.",
+    "Ok and can you also salt the steps? My mother lives with us and she slipped last winter.",
+    "What would the price be for the whole season?",
+    "Can you come look at it this week? I'm home Thursday after 4.",
+    "My address is 1234 rue des Erables, Laval. The house with the red door.",
+    "Also do you do landscaping in the spring? We want to redo the front garden.",
+    "Great. Can you send me the booking link?",
+    "Thanks! One more thing, do you take e-transfer?",
+]
+
+REPLY = (
+    "Thanks for the details! We can definitely help with that. Our crews cover Laval and Montreal, "
+    "Monday to Saturday from 8am to 6pm, and we can come by to give you an exact price. "
+    "Would Thursday after 4pm work for a quick visit?"
+)
+
+
+def assistants_conversation(client, turns, stream):
+    thread_id = None
+    latencies = []
+    for turn in range(turns):
+        start = time.perf_counter()
+        thread_id, _ = reply_in_thread(client, thread_id, "asst_fake", CUSTOMER_TEXTS[turn % len(CUSTOMER_TEXTS)], stream=stream)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def chat_conversation(engine, number, turns):
+    latencies = []
+    for turn in range(turns):
+        start = time.perf_counter()
+        engine.reply(number, CUSTOMER_TEXTS[turn % len(CUSTOMER_TEXTS)])
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)]
+
+
+def bench(server, conversation, conversations):
+    random.seed(42)
+    server.state.calls.clear()
+    server.state.tokens.clear()
+    with ThreadPoolExecutor(max_workers=conversations) as pool:
+        latencies = [l for ls in pool.map(conversation, range(conversations)) for l in ls]
+    return latencies
+
+
+def report(name, server, latencies, replies, background=0):
+    calls = sum(server.state.calls.values())
+    print(
+        f"{name:<22}{(calls - background) / replies:>12.1f}{background / replies:>10.2f}"
+        f"{percentile(latencies, 50):>10.3f}{percentile(latencies, 95):>10.3f}"
+        f"{server.state.tokens['prompt'] / replies:>18.0f}"
+    )
+
+
+def main():
+    warnings.filterwarnings("ignore", category=DeprecationWarning)
+    conversations = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    turns = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    rtt = float(sys.argv[3]) if len(sys.argv) > 3 else 0.08
+    replies = conversations * turns
+
+    server = FakeOpenAIServer(latency=(0.3, 0.8), reply=REPLY, rtt=rtt).start()
+    client = OpenAI(base_url=server.url, api_key="fake", max_retries=0)
+    directory = tempfile.mkdtemp(prefix="chat-engine-")
+
+    print(f"{conversations} conversations x {turns} turns, model latency 0.3–0.8s, network round-trip {rtt * 1000:.0f}ms\n")
+    print(f"{'mode':<22}{'calls/reply':>12}{'bg/reply':>10}{'p50 (s)':>10}{'p95 (s)':>10}{'prompt tok/reply':>18}")
+    try:
+        for name, stream in (("assistants (stream)", True), ("assistants (poll)", False)):
+            latencies = bench(server, lambda _: assistants_conversation(client, turns, stream), conversations)
+            report(name, server, latencies, replies)
+
+        for budget in (1500, 400):
+            engine = ChatEngine(client, model="fake",
+                                store=ChatHistoryStore(os.path.join(directory, f"chat-{budget}.db")),
+                                history_tokens=budget)
+            latencies = bench(server, lambda i: chat_conversation(engine, f"+1514555{i:04d}", turns), conversations)
+            engine.summarizer.shutdown(wait=True)
+            summaries = server.state.calls["chat.completions"] - replies
+            report(f"chat ({budget}-tok window)", server, latencies, replies, background=summaries)
+    finally:
+        server.stop()
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+# benchmarks/bench_resilience.py
+#
+# Fault injection against the fake OpenAI server, with and without the
+# resilience layer (resilience.py).
+#
+#   - slow upstream: a small fraction of requests hang for several seconds.
+#     Without resilience a hung request holds the reply until it answers;
+#     with it, slow runs.retrieve / messages.list reads are hedged and
+#     anything else is cut off at the request deadline, so p99 is bounded
+#     by the deadline (the lead gets the canned reply instead)
+#   - outage: every request fails with a 500. Without a breaker each reply
+#     still goes through the client's retries; with one, replies fail fast
+#     once it opens and the upstream stops being hit
+#
+#   python benchmarks/bench_resilience.py [replies] [hang rate] [deadline seconds]
+
+import os
+import sys
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from openai import OpenAI
+
+import admission
+import metrics
+import resilience
+from fake_openai import FakeOpenAIServer
+from run_completion import reply_in_thread
+
+HANG_SECONDS = 8.0
+WORKERS = 8
+
+
+def percentile(values, pct):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)]
+
+
+def reply(client, thread_id, seconds):
+    # (latency, answered) for one webhook's reply, as the apps make it
+    started = time.perf_counter()
+    try:
+        if seconds is None:
+            reply_in_thread(client, thread_id, "asst_fake", "Do you plow driveways in Laval?", stream=False)
+        else:
+            with resilience.deadline(seconds):
+                reply_in_thread(client, thread_id, "asst_fake", "Do you plow driveways in Laval?", stream=False)
+        return time.perf_counter() - started, True
+    except Exception:
+        return time.perf_counter() - started, False
+
+
+def reset(server, on):
+    resilience.enabled = on
+    resilience._breakers.clear()
+    resilience._reads.clear()
+    metrics.reset()
+    server.state.calls.clear()
+
+
+def slow_upstream(server, replies, hang_rate, deadline):
+    threads = [server_client(server).beta.threads.create().id for _ in range(replies)]
+    server.state.hang_rate = hang_rate
+    print(f"slow upstream: {server.state.hang_rate:.0%} of requests hang {HANG_SECONDS:g}s, "
+          f"{replies} replies, {WORKERS} at a time, deadline {deadline:g}s\n")
+    print(f"{'mode':<14}{'p50':>8}{'p95':>8}{'p99':>8}{'max':>8}{'failed':>8}{'hung':>6}{'hedges':>8}{'won':>5}")
+    for name, on in (("off", False), ("resilience", True)):
+        reset(server, on)
+        # The apps' clients: OpenAI's default timeout before, OPENAI_TIMEOUT now
+        client = server_client(server, timeout=resilience.OPENAI_TIMEOUT if on else None)
+        with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+            results = list(pool.map(lambda t: reply(client, t, deadline if on else None), threads))
+        latencies = [seconds for seconds, _ in results]
+        counters = metrics.snapshot()["counters"]
+        print(f"{name:<14}{percentile(latencies, 50):>8.2f}{percentile(latencies, 95):>8.2f}"
+              f"{percentile(latencies, 99):>8.2f}{max(latencies):>8.2f}"
+              f"{sum(not ok for _, ok in results):>8}{server.state.calls['hung']:>6}"
+              f"{sum(v for k, v in counters.items() if k.endswith('.sent')):>8}"
+              f"{sum(v for k, v in counters.items() if k.endswith('.won')):>5}")
+
+
+def outage(server, replies):
+    server.state.hang_rate, server.state.error_rate = 0.0, 1.0
+    print(f"\noutage: every request fails with a 500, {replies} replies one after another\n")
+    print(f"{'mode':<14}{'per reply':>10}{'total':>8}{'upstream requests':>19}{'breaker':>9}")
+    for name, on in (("off", False), ("resilience", True)):
+        reset(server, on)
+        client = server_client(server)  # default retries, as in the apps
+        started = time.perf_counter()
+        for _ in range(replies):
+            reply(client, None, None)
+        total = time.perf_counter() - started
+        state = ("closed", "half-open", "open")[resilience.breaker("openai").state]
+        print(f"{name:<14}{total / replies * 1000:>8.0f}ms{total:>7.1f}s"
+              f"{server.state.calls['errors']:>19}{state:>9}")
+
+
+def server_client(server, timeout=None):
+    kwargs = {} if timeout is None else {"timeout": timeout}
+    return OpenAI(base_url=server.url, api_key="fake", **kwargs)
+
+
+def main():
+    warnings.filterwarnings("ignore", category=DeprecationWarning)
+    replies = int(sys.argv[1]) if len(sys.argv) > 1 else 160
+    hang_rate = float(sys.argv[2]) if len(sys.argv) > 2 else 0.03
+    deadline = float(sys.argv[3]) if len(sys.argv) > 3 else 4.0
+
+    admission.controller = admission.AdmissionController(enabled=False)  # measure the upstream, not pacing
+    server = FakeOpenAIServer(latency=(0.3, 0.6), rtt=0.02, hang_seconds=HANG_SECONDS).start()
+    try:
+        slow_upstream(server, replies, hang_rate, deadline)
+        outage(server, 20)
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+# benchmarks/bench_run_completion.py
+#
+# 1. Reply latency of the old fixed 1s polling loop vs the run_completion
+#    engine (adaptive polling and streaming), measured against the local fake
+#    Assistants server.
+# 2. The whole reply path with a simulated network round-trip, for a new and
+#    a returning caller: threads.create + messages.create + run + a default
+#    messages.list page, vs reply_in_thread() (create_and_run, or runs.create
+#    with additional_messages, and a run-scoped limit=1 fetch), with the new
+#    path's per-stage timings.
+#
+#   python benchmarks/bench_run_completion.py [replies] [concurrency] [rtt seconds]
+
+import os
+import random
+import statistics
+import sys
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from openai import OpenAI
+
+import metrics
+from fake_openai import FakeOpenAIServer
+from run_completion import reply_in_thread, wait_for_run
+
+
+def legacy_reply(client, thread_id, assistant_id):
+    # The loop the handlers used before run_completion existed
+    run = client.beta.threads.runs.create(thread_id=thread_id, assistant_id=assistant_id)
+    while True:
+        run_status = client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run.id)
+        if run_status.status == "completed":
+            break
+        elif run_status.status in ["failed", "cancelled"]:
+            raise Exception(f"Run failed with status: {run_status.status}")
+        time.sleep(1)
+    messages = client.beta.threads.messages.list(thread_id=thread_id)
+    return messages.data[0].content[0].text.value.strip()
+
+
+MODES = {
+    "legacy 1s poll": legacy_reply,
+    "adaptive poll": lambda c, t, a: reply_in_thread(c, t, a, None, stream=False)[1],
+    "streaming": lambda c, t, a: reply_in_thread(c, t, a, None, stream=True)[1],
+}
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def bench(server, client, reply_fn, replies, concurrency):
+    def one(_):
+        thread = client.beta.threads.create()
+        client.beta.threads.messages.create(thread_id=thread.id, role="user", content="What are your hours?")
+        start = time.perf_counter()
+        reply_fn(client, thread.id, "asst_fake")
+        return time.perf_counter() - start
+
+    server.state.calls.clear()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(one, range(replies)))
+    calls = dict(server.state.calls)
+    run_calls = sum(v for k, v in calls.items() if k.startswith("runs.") or k == "messages.list")
+    return latencies, run_calls / replies
+
+
+def separate_calls_reply(client, thread_id, message, stream):
+    # The handlers' reply path before reply_in_thread()
+    if thread_id is None:
+        thread_id = client.beta.threads.create().id
+    client.beta.threads.messages.create(thread_id=thread_id, role="user", content=message)
+    if stream:
+        return thread_id, reply_in_thread(client, thread_id, "asst_fake", None, stream=True)[1]
+    run = client.beta.threads.runs.create(thread_id=thread_id, assistant_id="asst_fake")
+    wait_for_run(client, thread_id, run)
+    messages = client.beta.threads.messages.list(thread_id=thread_id)
+    return thread_id, messages.data[0].content[0].text.value.strip()
+
+
+PATH_MODES = {
+    "separate calls": separate_calls_reply,
+    "reply_in_thread": lambda c, t, m, stream: reply_in_thread(c, t, "asst_fake", m, stream=stream),
+}
+
+
+def bench_path(server, client, reply_fn, returning, stream, replies, concurrency):
+    def one(_):
+        thread_id = None
+        if returning:
+            thread_id = client.beta.threads.create().id
+            for i in range(10):  # some history for the default messages.list page to carry
+                server.state.add_message(thread_id, "user" if i % 2 == 0 else "assistant", "Earlier message " * 8)
+        start = time.perf_counter()
+        reply_fn(client, thread_id, "What are your hours?", stream)
+        return time.perf_counter() - start
+
+    server.state.calls.clear()
+    metrics.reset()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(one, range(replies)))
+    calls = sum(server.state.calls.values()) - (replies if returning else 0)  # setup threads.create
+    return latencies, calls / replies
+
+
+def main():
+    warnings.filterwarnings("ignore", category=DeprecationWarning)
+    replies = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    rtt = float(sys.argv[3]) if len(sys.argv) > 3 else 0.08
+
+    server = FakeOpenAIServer(latency=(0.3, 1.5)).start()
+    client = OpenAI(base_url=server.url, api_key="fake", max_retries=0)
+
+    print(f"{replies} replies, concurrency {concurrency}, model latency 0.3–1.5s\n")
+    print(f"{'mode':<16}{'p50 (s)':>10}{'p95 (s)':>10}{'mean (s)':>10}{'calls/reply':>14}")
+    for name, reply_fn in MODES.items():
+        random.seed(42)  # same model latencies for every mode
+        latencies, calls_per_reply = bench(server, client, reply_fn, replies, concurrency)
+        print(
+            f"{name:<16}{percentile(latencies, 50):>10.3f}{percentile(latencies, 95):>10.3f}"
+            f"{statistics.mean(latencies):>10.3f}{calls_per_reply:>14.1f}"
+        )
+
+    server.state.rtt = rtt
+    print(f"\nWhole reply path, network round-trip {rtt * 1000:.0f}ms\n")
+    print(f"{'caller':<11}{'runs':<8}{'mode':<18}{'p50 (s)':>10}{'p95 (s)':>10}{'calls/reply':>14}   stages p50 (start/run/fetch)")
+    for returning in (False, True):
+        for stream in (True, False):
+            for name, reply_fn in PATH_MODES.items():
+                random.seed(42)
+                latencies, calls_per_reply = bench_path(server, client, reply_fn, returning, stream, replies, concurrency)
+                stages = ""
+                if name == "reply_in_thread":
+                    timings = metrics.snapshot()["timings"]
+                    stages = "/".join(
+                        f"{timings[f'assistant.{stage}']['p50']:.3f}" if f"assistant.{stage}" in timings else "-"
+                        for stage in ("start", "run", "fetch")
+                    )
+                print(
+                    f"{'returning' if returning else 'new':<11}{'stream' if stream else 'poll':<8}{name:<18}"
+                    f"{percentile(latencies, 50):>10.3f}{percentile(latencies, 95):>10.3f}{calls_per_reply:>14.1f}   {stages}"
+                )
+
+    server.stop()
+
+
+if __name__ == "__main__":
+    main()
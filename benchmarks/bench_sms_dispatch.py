@@ -0,0 +1,114 @@
+# benchmarks/bench_sms_dispatch.py
+#
+# A burst of missed-call follow-up texts (a storm knocks the phones out: many
+# callers within a couple of seconds) from a few sending numbers, against the
+# fake SMS provider with a 10% error rate. Compares sending inline from the
+# webhook, as the apps did, with queueing them on the SMS dispatcher
+# (sms_dispatcher.py, journaled). Reports how long the webhook spends on the
+# text, texts delivered, texts sent faster than the carrier allows for their
+# number, and end-to-end delivery latency.
+#
+#   python benchmarks/bench_sms_dispatch.py [texts] [burst seconds] [sending numbers]
+
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import requests
+
+import metrics
+from fake_sms import FakeSmsServer
+from sms_dispatcher import SmsDispatcher
+from turn_journal import TurnJournal
+
+CARRIER_RATE = 1.0  # texts/s per long code
+
+
+def percentile(values, pct):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)]
+
+
+def twilio_sender(server):
+    # What twilio_client.messages.create does: one POST over a pooled session
+    session = requests.Session()
+
+    def send(from_, to, body):
+        r = session.post(f"{server.url}/2010-04-01/Accounts/ACfake/Messages.json",
+                         data={"From": from_, "To": to, "Body": body}, timeout=10)
+        r.raise_for_status()
+    return send
+
+
+def burst(texts, spread, numbers, handle):
+    # Webhook latency for each missed call
+    random.seed(11)
+    arrivals = sorted(random.uniform(0, spread) for _ in range(texts))
+    start = time.perf_counter()
+
+    def webhook(i):
+        time.sleep(max(arrivals[i] - (time.perf_counter() - start), 0))
+        sent = time.perf_counter()
+        handle(f"+1514555{i % numbers:04d}", f"+1438555{i:04d}", "Hey! Sorry we missed your call. How can we help you today?")
+        return time.perf_counter() - sent
+
+    with ThreadPoolExecutor(max_workers=texts) as pool:
+        return list(pool.map(webhook, range(texts)))
+
+
+def report(name, server, webhook, latency=None):
+    calls = server.state.calls
+    e2e = f"{latency['p50']:>8.2f}{latency['p95']:>8.2f}{latency['p99']:>8.2f}" if latency else f"{'-':>8}{'-':>8}{'-':>8}"
+    print(f"{name:<12}{percentile(webhook, 50) * 1000:>12.1f}{percentile(webhook, 95) * 1000:>10.1f}"
+          f"{calls['accepted']:>11}{calls['over_limit']:>12}{e2e}")
+
+
+def main():
+    texts = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    spread = float(sys.argv[2]) if len(sys.argv) > 2 else 2.0
+    numbers = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+
+    server = FakeSmsServer(latency=(0.1, 0.3), error_rate=0.1, carrier_rate=CARRIER_RATE).start()
+    print(f"{texts} texts within {spread:g}s from {numbers} numbers ({CARRIER_RATE:g}/s each), "
+          f"provider 0.1–0.3s, 10% errors\n")
+    print(f"{'mode':<12}{'webhook p50':>12}{'p95 (ms)':>10}{'delivered':>11}{'over limit':>12}"
+          f"{'e2e p50':>8}{'p95':>8}{'p99':>8}")
+    try:
+        def inline(from_, to, body):
+            try:
+                send(from_, to, body)
+            except Exception:
+                pass  # printed and dropped, as the apps did
+
+        send = twilio_sender(server)
+        report("inline", server, burst(texts, spread, numbers, inline))
+
+        server.state.calls.clear()
+        server.state.accepted.clear()
+        metrics.reset()
+        with tempfile.TemporaryDirectory() as root:
+            outbox = SmsDispatcher({"twilio": twilio_sender(server)}, queue=TurnJournal(root),
+                                   rate=CARRIER_RATE, burst=1, retry_delay=0.5).start()
+            webhook = burst(texts, spread, numbers, lambda from_, to, body: outbox.send("twilio", from_, to, body))
+            started = time.perf_counter()
+            while len(outbox.queue) and time.perf_counter() - started < 120:
+                time.sleep(0.1)
+            outbox.stop()
+        snapshot = metrics.snapshot()
+        report("dispatcher", server, webhook, snapshot["timings"].get("sms.latency"))
+        print(f"\nretries: {snapshot['counters'].get('sms.retries', 0)}, "
+              f"failed for good: {snapshot['counters'].get('sms.failed', 0)}, "
+              f"drained in {time.perf_counter() - started:.1f}s after the burst")
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
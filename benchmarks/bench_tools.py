@@ -0,0 +1,104 @@
+# benchmarks/bench_tools.py
+#
+# A run step that asks for three tools at once (a calculation plus two
+# simulated lookups, e.g. a quote and an availability check) against the fake
+# OpenAI server. Compares running the calls one after another with
+# ToolRegistry.handle (tool_registry.py), which runs them side by side, and
+# shows a hung tool being cut off by its timeout instead of holding the reply.
+# Reports the time spent in tools per step, reply latency and
+# submit_tool_outputs requests per reply.
+#
+#   python benchmarks/bench_tools.py [replies] [lookup seconds]
+
+import json
+import os
+import sys
+import time
+import warnings
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from openai import OpenAI
+
+import metrics
+from calculator import safe_calculate
+from fake_openai import FakeOpenAIServer
+from run_completion import reply_in_thread
+from tool_registry import ToolRegistry, parse_tool_arguments
+
+
+def definition(name):
+    return {"type": "function", "function": {"name": name, "parameters": {"type": "object", "properties": {}}}}
+
+
+TOOL_CALLS = [
+    ("safe_calculate", json.dumps({"expression": "2 * (40 + 25) * 3.5"})),
+    ("get_quote", json.dumps({"service": "snow removal", "size": "double driveway"})),
+    ("check_availability", json.dumps({"day": "thursday"})),
+]
+
+
+def make_registry(lookup, hang=None, timeout=2.0):
+    def slow(seconds):
+        return lambda args: time.sleep(seconds) or {"ok": True, **args}
+
+    registry = ToolRegistry()
+    registry.register(definition("safe_calculate"), lambda args: safe_calculate(args.get("expression", "")))
+    registry.register(definition("get_quote"), slow(lookup), timeout=timeout)
+    registry.register(definition("check_availability"), slow(hang or lookup), timeout=timeout)
+    return registry
+
+
+def sequential(registry):
+    # The old handle_tool_calls loop: each call runs after the previous one
+    def handle(tool_calls):
+        return [{"tool_call_id": call.id,
+                 "output": str(registry.tools[call.function.name](parse_tool_arguments(call.function.arguments)))}
+                for call in tool_calls]
+    return handle
+
+
+def timed(handler):
+    def handle(tool_calls):
+        with metrics.timer("bench.tool_step"):
+            return handler(tool_calls)
+    return handle
+
+
+def bench(server, client, registry, handler, replies):
+    metrics.reset()
+    server.state.calls.clear()
+    latencies = []
+    for _ in range(replies):
+        start = time.perf_counter()
+        reply_in_thread(client, None, "asst_fake", "How much for the season, and can you come Thursday?",
+                        tools=registry.definitions, tool_handler=timed(handler))
+        latencies.append(time.perf_counter() - start)
+    step = metrics.snapshot()["timings"]["bench.tool_step"]
+    return sorted(latencies)[len(latencies) // 2], step["p50"], server.state.calls["runs.submit_tool_outputs"] / replies
+
+
+def main():
+    warnings.filterwarnings("ignore", category=DeprecationWarning)
+    replies = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    lookup = float(sys.argv[2]) if len(sys.argv) > 2 else 0.25
+
+    server = FakeOpenAIServer(latency=(0.3, 0.3), rtt=0.03, tool_calls=TOOL_CALLS).start()
+    client = OpenAI(base_url=server.url, api_key="fake", max_retries=0)
+    fast, hung = make_registry(lookup), make_registry(lookup, hang=10, timeout=0.5)
+
+    print(f"{replies} replies, 3 tool calls per step ({lookup * 1000:.0f}ms lookups), model 0.3s per step\n")
+    print(f"{'mode':<30}{'tool step (s)':>14}{'reply p50 (s)':>15}{'submits/reply':>15}")
+    try:
+        for name, registry, handler in (("sequential", fast, sequential(fast)),
+                                        ("registry (parallel)", fast, fast.handle),
+                                        ("registry, one tool hangs 10s", hung, hung.handle)):
+            p50, step, submits = bench(server, client, registry, handler, replies)
+            print(f"{name:<30}{step:>14.3f}{p50:>15.3f}{submits:>15.1f}")
+        print("\nlast outputs:", [o["output"] for o in server.state.tool_outputs[-3:]])
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+# benchmarks/bench_turn_journal.py
+#
+# 1. Write throughput of the local turn journal (turn_journal.py): many
+#    threads logging turns at once, with batched fsync, fsync on every write,
+#    and the old in-memory queue for reference.
+# 2. Replay after a simulated Sheets outage: turns keep arriving while the
+#    fake sheet is down; once it's back we time how long the writer takes to
+#    catch up, and check every turn landed exactly once (the first write after
+#    the outage "times out" after landing, to exercise the idempotent replay).
+#
+#   python benchmarks/bench_turn_journal.py [turns] [threads]
+
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from sheet_log_writer import SheetLogWriter
+from turn_journal import MemoryTurnQueue, TurnJournal
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)]
+
+
+def bench_writes(make_queue, turns, threads):
+    directory = tempfile.mkdtemp(prefix="turn-journal-")
+    queue = make_queue(directory, turns)
+    turn = ("October 2026", "2026-10-17 12:00", "SMS", "+15145550000", "What are your hours?", "9 to 5, Monday to Friday.")
+
+    def one(_):
+        start = time.perf_counter()
+        queue.put(turn)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        latencies = list(pool.map(one, range(turns)))
+    elapsed = time.perf_counter() - start
+    queue.close()
+    shutil.rmtree(directory, ignore_errors=True)
+    return turns / elapsed, percentile(latencies, 99)
+
+
+class FakeSheet:
+    # Just enough of a gspread Worksheet for SheetLogWriter
+    def __init__(self, title, latency):
+        self.title = title
+        self.latency = latency
+        self.rows = [["Date/Time", "Source", "Username/Handle", "Conversation"]]
+        self.lock = threading.Lock()
+        self.fail_after_next_append = False
+
+    def col_values(self, col):
+        time.sleep(self.latency)
+        return [row[col - 1] for row in self.rows]
+
+    def get(self, cells):
+        time.sleep(self.latency)
+        first, last = (int(n) for n in re.findall(r"\d+", cells))
+        return self.rows[first - 1:last]
+
+    def append_rows(self, rows):
+        time.sleep(self.latency)
+        with self.lock:
+            first = len(self.rows) + 1
+            self.rows.extend(rows)
+        if self.fail_after_next_append:
+            self.fail_after_next_append = False
+            raise TimeoutError("read timed out (rows were written)")
+        return {"updates": {"updatedRange": f"'{self.title}'!A{first}:D{len(self.rows)}"}}
+
+
+class FakeSession:
+    def __init__(self, sheet):
+        self.sheet = sheet
+        self.down = False
+
+    def worksheet(self, month_name=None):
+        if self.down:
+            raise ConnectionError("Sheets unavailable")
+        return self.sheet
+
+    def reset(self):
+        pass
+
+
+def bench_replay(turns, outage, latency):
+    directory = tempfile.mkdtemp(prefix="turn-journal-")
+    try:
+        sheet = FakeSheet("October 2026", latency)
+        session = FakeSession(sheet)
+        writer = SheetLogWriter(session, queue=TurnJournal(directory), flush_interval=0.05).start()
+
+        # Outage: turns arrive steadily and pile up in the journal
+        session.down = True
+        interval = outage / turns
+        for i in range(turns):
+            writer.log_turn("SMS", f"+1514555{i % 500:04d}", f"message {i}", f"reply {i}")
+            time.sleep(interval)
+        backlog = len(writer.queue)
+
+        # Recovery: first write lands but the client sees a timeout
+        sheet.fail_after_next_append = True
+        session.down = False
+        start = time.perf_counter()
+        while len(writer.queue):
+            time.sleep(0.01)
+        catch_up = time.perf_counter() - start
+        writer.stop()
+
+        user_rows = [row[3] for row in sheet.rows if row[3].startswith("User: ")]
+        return backlog, catch_up, len(user_rows), len(set(user_rows))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main():
+    turns = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+
+    print(f"Journal writes: {turns} turns from {threads} threads\n")
+    print(f"{'queue':<28}{'turns/s':>12}{'p99 put (ms)':>15}")
+    queues = {
+        "memory (not durable)": lambda directory, turns: MemoryTurnQueue(max_buffer=turns),
+        "journal, fsync every 50ms": lambda directory, turns: TurnJournal(directory, fsync_interval=0.05),
+        "journal, fsync every write": lambda directory, turns: TurnJournal(directory, fsync_interval=0),
+    }
+    for name, make_queue in queues.items():
+        count = turns if "every write" not in name else turns // 10
+        rate, p99 = bench_writes(make_queue, count, threads)
+        print(f"{name:<28}{rate:>12,.0f}{p99 * 1000:>15.2f}")
+
+    print("\nReplay after a 5s Sheets outage (fake sheet, 150ms per API call)\n")
+    print(f"{'turns':>8}{'backlog':>10}{'catch-up (s)':>14}{'turns/s':>10}{'in sheet':>10}{'unique':>8}")
+    for count in (500, 2000, 5000):
+        backlog, catch_up, written, unique = bench_replay(count, 5.0, 0.15)
+        print(f"{count:>8}{backlog:>10}{catch_up:>14.2f}{backlog / catch_up:>10,.0f}{written:>10}{unique:>8}")
+
+
+if __name__ == "__main__":
+    main()
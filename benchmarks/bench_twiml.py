@@ -0,0 +1,67 @@
+# benchmarks/bench_twiml.py
+#
+# Per-request cost of producing the TwiML body: building a VoiceResponse /
+# MessagingResponse tree and serializing it with the twilio helpers (what the
+# routes did) vs the precompiled templates (twiml_templates.py). Checks first
+# that both produce the same bytes, for the static responses and for a few
+# thousand random replies (markup characters, quotes, newlines, emoji).
+#
+#   python benchmarks/bench_twiml.py [iterations]
+
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from twiml_templates import (NOT_UNDERSTOOD, TwimlTemplates, build_message, build_missed_call,
+                             build_voice)
+
+REPLY = ("We're open Mon–Sat 8am–6pm & serve the whole island. Book a time here: "
+         "https://calendly.com/example <3 Anything else we can help with?")
+ALPHABET = "abc XYZ 0123 &<>\"'\n\t–’é😀"
+
+
+def check(templates):
+    assert templates.voice() == build_voice(os.getenv("FORWARD_TO_NUMBER"))
+    assert templates.missed_call() == build_missed_call()
+    assert templates.empty() == build_message()
+    assert templates.not_understood() == build_message(NOT_UNDERSTOOD)
+    assert templates.message("") == build_message("")
+    random.seed(3)
+    for _ in range(5000):
+        text = "".join(random.choice(ALPHABET) for _ in range(random.randint(1, 200)))
+        assert templates.message(text) == build_message(text), text
+
+
+def per_call(fn, iterations):
+    return min(timeit.repeat(fn, number=iterations, repeat=5)) / iterations * 1e6
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    templates = TwimlTemplates(enabled=True)
+    builder = TwimlTemplates(enabled=False)
+
+    for forward_to in ("", "+15145550199"):
+        os.environ["FORWARD_TO_NUMBER"] = forward_to
+        check(templates)
+    print("✅ templates match the twilio helpers byte for byte\n")
+
+    cases = [
+        ("/voice (forwarding)", lambda t: t.voice()),
+        ("/missed-call", lambda t: t.missed_call()),
+        ("/sms-reply empty body", lambda t: t.not_understood()),
+        ("/sms-reply ack", lambda t: t.empty()),
+        ("/sms-reply AI text", lambda t: t.message(REPLY)),
+    ]
+    print(f"{'response':<24}{'builder (µs)':>14}{'template (µs)':>15}{'speedup':>9}")
+    for name, render in cases:
+        slow = per_call(lambda: render(builder), iterations)
+        fast = per_call(lambda: render(templates), iterations)
+        print(f"{name:<24}{slow:>14.2f}{fast:>15.3f}{slow / fast:>8.0f}x")
+
+
+if __name__ == "__main__":
+    main()
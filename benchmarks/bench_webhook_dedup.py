@@ -0,0 +1,112 @@
+# benchmarks/bench_webhook_dedup.py
+#
+# Provider redeliveries against app4.5.py and the fake OpenAI server. The
+# model takes longer than the provider is willing to wait (Twilio gives up
+# after 15s; scaled down here), so every text is delivered again after the
+# timeout, up to twice more; each missed call also fires both /missed-call
+# and /call-status. Compares WEBHOOK_DEDUP=off with the dedup index
+# (webhook_dedup.py), counting OpenAI runs, logged turns and outbound
+# "sorry we missed you" texts per event.
+#
+#   python benchmarks/bench_webhook_dedup.py [texts] [provider timeout seconds]
+
+import importlib.util
+import os
+import sys
+import tempfile
+import time
+import uuid
+import warnings
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from fake_openai import FakeOpenAIServer
+
+REDELIVERIES = 2
+APP = os.path.join(os.path.dirname(__file__), "..", "app4.5.py")
+
+
+def load_app(mode, tmp):
+    # A fresh copy of the app with WEBHOOK_DEDUP=mode; counts its logged turns and texts
+    import turn_journal
+    import webhook_dedup
+    turn_journal.TURN_JOURNAL_DIR = os.path.join(tmp, f"journal-{mode}")  # one journal owner per directory
+    webhook_dedup.WEBHOOK_DEDUP = mode
+    spec = importlib.util.spec_from_file_location(f"app45_{mode}", APP)
+    app = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(app)
+    handler = app.app.extensions["call_handler"]
+
+    counts = {"turns": 0, "texts": 0}
+    log_turn = handler.turn_log.log_turn
+
+    def counted_log_turn(*args):
+        counts["turns"] += 1
+        log_turn(*args)
+
+    def counted_send(*args):
+        counts["texts"] += 1
+        return True  # don't actually text anyone
+
+    handler.turn_log.log_turn, handler.outbox.send = counted_log_turn, counted_send
+    return app, counts
+
+
+def deliver(pool, client, path, form, timeout):
+    # POST like the provider: give up after `timeout` and deliver again
+    for attempt in range(REDELIVERIES + 1):
+        future = pool.submit(client.post, path, data=form)
+        try:
+            return future.result(timeout=timeout), attempt
+        except TimeoutError:
+            continue
+    return future.result(), REDELIVERIES
+
+
+def run(server, app, counts, texts, timeout):
+    server.state.calls.clear()
+    client = app.app.test_client()
+    with ThreadPoolExecutor(max_workers=texts * (REDELIVERIES + 2)) as pool:
+        sms = [pool.submit(deliver, pool, client, "/sms-reply",
+                           {"MessageSid": f"SM{uuid.uuid4().hex}", "From": f"+1514555{i:04d}", "Body": "Do you plow driveways?"},
+                           timeout) for i in range(texts)]
+        replies = [future.result() for future in sms]
+        for i in range(texts):
+            call = {"CallSid": f"CA{uuid.uuid4().hex}", "From": f"+1438555{i:04d}"}
+            client.post("/missed-call", data=call)
+            client.post("/call-status", data={**call, "CallStatus": "no-answer"})
+    time.sleep(1)  # let runs started by redeliveries finish
+    runs = server.state.calls["threads.create_and_run"] + server.state.calls["runs.create"]
+    answered = sum(1 for response, _ in replies if b"<Message>" in response.data)
+    return runs, counts["turns"], counts["texts"], answered, sum(attempt for _, attempt in replies)
+
+
+def main():
+    warnings.filterwarnings("ignore", category=DeprecationWarning)
+    texts = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    timeout = float(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+
+    server = FakeOpenAIServer(latency=(1.5, 2.5), rtt=0.02).start()
+    tmp = tempfile.mkdtemp()
+    os.environ.update(
+        OPENAI_API_KEY="sk-fake", OPENAI_BASE_URL=server.url, OPENAI_ASSISTANT_ID="asst_fake",
+        TWILIO_SID="ACfake", TWILIO_AUTH="fake", TWILIO_NUMBER="+15145550100",
+        THREAD_STORE="memory", LOG_SINKS="sqlite", LOG_DB_PATH=os.path.join(tmp, "log.db"),
+        RUN_DEBOUNCE_SECONDS="0.1", THREAD_POOL_SIZE="0", WEBHOOK_DEDUP_PATH=os.path.join(tmp, "webhooks.db"),
+    )
+
+    print(f"{texts} texts, model 1.5–2.5s, provider redelivers after {timeout:g}s (up to {REDELIVERIES}x); "
+          f"{texts} missed calls firing /missed-call and /call-status\n")
+    print(f"{'mode':<8}{'redeliveries':>13}{'OpenAI runs':>12}{'turns logged':>13}{'answered':>10}{'missed-call texts':>19}")
+    try:
+        for mode in ("off", "sqlite"):
+            app, counts = load_app(mode, tmp)
+            runs, turns, sent, answered, redelivered = run(server, app, counts, texts, timeout)
+            print(f"{mode:<8}{redelivered:>13}{runs:>12}{turns:>13}{answered:>8}/{texts:<3}{sent:>17}")
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
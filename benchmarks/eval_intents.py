@@ -0,0 +1,160 @@
+# benchmarks/eval_intents.py
+#
+# Offline evaluation of the local intent fast path (intent_router.py) on a
+# held-out set of labelled customer texts (none of them appear in the
+# router's training examples). The texts that should go to the model
+# include near misses: services we don't offer, places we don't serve and
+# holidays, phrased like the fact questions. Reports:
+#   - precision: of the messages answered locally, how many got the right
+#     intent (a wrong local answer is worse than a slow model answer)
+#   - recall per intent: how many real fact questions were caught
+#   - diverted: share of all traffic that never reaches the model
+#   - routing latency
+#
+#   python benchmarks/eval_intents.py [--threshold 0.8] [--show-errors]
+
+import argparse
+import os
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import intent_router
+
+# (message, expected intent or None for "the model should answer this")
+HELD_OUT = [
+    ("What are your hours?", "hours"),
+    ("what time do you guys open", "hours"),
+    ("Are you open Saturdays?", "hours"),
+    ("When do you close today?", "hours"),
+    ("hours?", "hours"),
+    ("are you open right now", "hours"),
+    ("What time do you close on Friday?", "hours"),
+    ("Quelles sont vos heures d'ouverture?", "hours"),
+    ("Vous êtes ouverts le samedi?", "hours"),
+    ("À quelle heure fermez-vous?", "hours"),
+    ("Vos horaires?", "hours"),
+    ("Do you serve Laval?", "area"),
+    ("what areas do you cover", "area"),
+    ("Do you come to Montreal North?", "area"),
+    ("Where are you located?", "area"),
+    ("is the west island in your service area", "area"),
+    ("Desservez-vous Montréal?", "area"),
+    ("Vous venez à Laval?", "area"),
+    ("Quel est votre secteur?", "area"),
+    ("How do I book an appointment?", "booking"),
+    ("Can I schedule a consultation?", "booking"),
+    ("I'd like to book", "booking"),
+    ("book", "booking"),
+    ("Send me the link to book please", "booking"),
+    ("Je voudrais prendre rendez-vous", "booking"),
+    ("Comment je peux réserver?", "booking"),
+    ("What services do you offer?", "services"),
+    ("Do you do snow removal?", "services"),
+    ("Do you do hardscaping?", "services"),
+    ("do you guys do landscaping", "services"),
+    ("Do you offer lawn care?", "services"),
+    ("Quels services offrez-vous?", "services"),
+    ("Faites-vous du déneigement?", "services"),
+    ("Est-ce que vous faites de l'aménagement paysager?", "services"),
+    # Should go to the model
+    ("How much do you charge for snow removal?", None),
+    ("What's the price for a patio?", None),
+    ("Can I get a quote for my backyard?", None),
+    ("Combien coûte le déneigement?", None),
+    ("Quel est votre tarif pour la pelouse?", None),
+    ("I need to cancel my appointment tomorrow", None),
+    ("Je dois annuler mon rendez-vous", None),
+    ("My driveway wasn't plowed this morning", None),
+    ("The crew damaged my fence", None),
+    ("Hi", None),
+    ("Hello, who is this?", None),
+    ("Bonjour", None),
+    ("Thanks!", None),
+    ("Merci beaucoup", None),
+    ("ok sounds good", None),
+    ("Yes", None),
+    ("Can you come Tuesday at 10?", None),
+    ("What are your hours and do you serve Laval?", None),
+    ("Do you do snow removal in Laval?", None),
+    ("I have a big yard with a slope and lots of clay soil, what would you recommend for drainage there?", None),
+    ("Are you hiring for the summer?", None),
+    ("Do you take credit cards?", None),
+    ("Is someone coming today?", None),
+    ("I called earlier but nobody answered", None),
+    ("We spoke last week about the retaining wall, any update?", None),
+    ("Can you send me an invoice?", None),
+    # Services we don't offer and places we don't serve: the services and
+    # area templates would answer these with a yes and the booking link
+    ("Do you do snow removal in Toronto?", None),
+    ("Do you do pool cleaning?", None),
+    ("Do you do tree removal?", None),
+    ("Do you offer roofing?", None),
+    ("do you guys do gutter cleaning", None),
+    ("Do you plow driveways in Ottawa?", None),
+    ("do you plow driveways in brampton", None),
+    ("Do you serve Toronto?", None),
+    ("Faites-vous l'élagage?", None),
+    ("Faites-vous du déneigement à Gatineau?", None),
+    # Holidays and dates: the hours template doesn't cover them
+    ("are you open on christmas", None),
+    ("Are you open Christmas Day?", None),
+    ("are you open on boxing day", None),
+    ("are you open this thanksgiving", None),
+    ("are you open on the 24th", None),
+    ("are you open on december 24", None),
+    ("open on stat holidays?", None),
+    ("are you open on the long weekend", None),
+    ("Êtes-vous ouverts à Noël?", None),
+    ("Êtes-vous ouverts pendant les fêtes?", None),
+]
+
+
+def evaluate(threshold, show_errors):
+    intent_router.INTENT_THRESHOLD = threshold
+    answered = correct = 0
+    caught = Counter()
+    expected_counts = Counter(label for _, label in HELD_OUT if label)
+    errors = []
+    timings = []
+    for message, expected in HELD_OUT:
+        start = time.perf_counter()
+        intent, language, probability = intent_router.classify(message)
+        timings.append(time.perf_counter() - start)
+        if intent is not None:
+            answered += 1
+            if intent == expected:
+                correct += 1
+                caught[intent] += 1
+            else:
+                errors.append(("wrong", message, expected, intent, probability))
+        elif expected is not None:
+            errors.append(("missed", message, expected, None, probability))
+
+    total = len(HELD_OUT)
+    precision = correct / answered if answered else 1.0
+    print(f"threshold {threshold:.2f}: {total} messages, {answered} answered locally")
+    print(f"  precision  {precision:.1%} ({correct}/{answered})")
+    print(f"  diverted   {answered / total:.1%} of traffic never reaches the model")
+    for intent in intent_router.INTENTS:
+        print(f"  recall {intent:<9} {caught[intent]}/{expected_counts[intent]}")
+    timings.sort()
+    print(f"  routing    p50 {timings[len(timings) // 2] * 1e6:.0f}µs, max {timings[-1] * 1e6:.0f}µs")
+    if show_errors:
+        for kind, message, expected, got, probability in errors:
+            print(f"    {kind:<6} {message!r}: expected {expected}, got {got} (p={probability:.2f})")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threshold", type=float, action="append")
+    parser.add_argument("--show-errors", action="store_true")
+    args = parser.parse_args()
+    for threshold in args.threshold or [0.6, 0.8, 0.95]:
+        evaluate(threshold, args.show_errors)
+
+
+if __name__ == "__main__":
+    main()
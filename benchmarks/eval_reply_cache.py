@@ -0,0 +1,121 @@
+# benchmarks/eval_reply_cache.py
+#
+# Offline evaluation of the reply cache's semantic tier (reply_cache.py).
+# Each pair is (question whose reply is cached, question that comes in):
+#
+#   near misses   close in spelling but asking something else: another city,
+#                 day, number or a negation. Any hit here sends a customer a
+#                 wrong reply, so the eval fails unless there are 0.
+#   paraphrases   the same question reworded or misspelled: hits here are
+#                 model calls saved
+#
+# Also prints the raw cosine similarity of each pair, to show how many near
+# misses only the anchor check stops.
+#
+#   python benchmarks/eval_reply_cache.py [--threshold 0.9] [--show]
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from reply_cache import ReplyCache, normalize_text, text_vector
+
+NEAR_MISSES = [
+    ("Do you serve Laval?", "Do you serve Ottawa?"),
+    ("Do you serve Laval?", "Do you serve Toronto?"),
+    ("Do you come to Montreal?", "Do you come to Gatineau?"),
+    ("Do you come out to Brossard?", "Do you come out to Saint-Hubert?"),
+    ("Are you open on Monday?", "Are you open on Sunday?"),
+    ("Are you open Saturday?", "Are you open Thursday?"),
+    ("Can you come tomorrow?", "Can you come today?"),
+    ("Are you open in December?", "Are you open in November?"),
+    ("I'm not happy with the work", "I'm very happy with the work"),
+    ("The crew came today", "The crew never came today"),
+    ("Do you plow driveways?", "Don't you plow driveways?"),
+    ("Can you do 2 driveways?", "Can you do 3 driveways?"),
+    ("I have a 20 foot driveway", "I have a 40 foot driveway"),
+    ("Can you come at 3?", "Can you come at 5?"),
+    ("Êtes-vous ouverts le lundi?", "Êtes-vous ouverts le mardi?"),
+    ("Desservez-vous Laval?", "Desservez-vous Longueuil?"),
+    ("Je suis content du travail", "Je ne suis pas content du travail"),
+    # Longer texts: the shared words push these to 0.88-0.94 on similarity alone
+    ("Hi, do you guys do snow removal in Laval this winter?", "Hi, do you guys do snow removal in Ottawa this winter?"),
+    ("Hello, are you open on Monday for a landscaping consultation?",
+     "Hello, are you open on Sunday for a landscaping consultation?"),
+    ("I am not happy with the snow removal on my driveway this week",
+     "I am very happy with the snow removal on my driveway this week"),
+    ("Can you come by on Saturday to look at my backyard garden design?",
+     "Can you come by on Thursday to look at my backyard garden design?"),
+    ("Can your crew clear 2 driveways on my street after the storm?",
+     "Can your crew clear 4 driveways on my street after the storm?"),
+    ("The crew did clear my driveway this morning after the storm",
+     "The crew did not clear my driveway this morning after the storm"),
+    ("Can you come out in March to start the spring cleanup of my yard?",
+     "Can you come out in April to start the spring cleanup of my yard?"),
+    ("do you do snow removal for driveways in saint-laurent this winter?",
+     "do you do snow removal for driveways in saint-leonard this winter?"),
+    ("Est-ce que vous faites le déneigement à Laval cet hiver?",
+     "Est-ce que vous faites le déneigement à Longueuil cet hiver?"),
+]
+
+PARAPHRASES = [
+    ("What are your hours?", "what are ur hours"),
+    ("What are your hours?", "What are your hours please?"),
+    ("Do you serve Laval?", "do you serve laval??"),
+    ("Do you serve Laval?", "you serve Laval?"),
+    ("How do I book an appointment?", "how do i book an appointment pls"),
+    ("Do you plow driveways?", "do u plow driveways"),
+    ("Are you open on Saturday?", "are you guys open on saturday"),
+    ("Do you do snow removal?", "do you do snow remova"),
+    ("Hi, do you guys do snow removal in Laval this winter?", "hi do you do snow removal in laval this winter"),
+    ("Can you come by on Saturday to look at my backyard garden design?",
+     "can you come by saturday to look at my backyard garden design"),
+]
+
+
+def similarity(a, b):
+    return float(text_vector(normalize_text(a)) @ text_vector(normalize_text(b)))
+
+
+def hits(pairs, threshold):
+    result = []
+    for cached, incoming in pairs:
+        cache = ReplyCache(maxsize=8, semantic=True, threshold=threshold)
+        cache.set_facts("facts")
+        cache.put(cached, "cached reply")
+        result.append(cache.get(incoming) is not None)
+    return result
+
+
+def evaluate(threshold, show):
+    false_hits = hits(NEAR_MISSES, threshold)
+    true_hits = hits(PARAPHRASES, threshold)
+    above = sum(similarity(a, b) >= threshold for a, b in NEAR_MISSES)
+    print(f"threshold {threshold:.2f}")
+    print(f"  near misses  {sum(false_hits)}/{len(NEAR_MISSES)} false hits "
+          f"({above} above the threshold on similarity alone)")
+    print(f"  paraphrases  {sum(true_hits)}/{len(PARAPHRASES)} hits")
+    if show:
+        for (a, b), hit in zip(NEAR_MISSES + PARAPHRASES, false_hits + true_hits):
+            print(f"    {similarity(a, b):.3f} {'hit ' if hit else 'miss'} {a!r} -> {b!r}")
+    return sum(false_hits)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threshold", type=float, action="append")
+    parser.add_argument("--show", action="store_true")
+    args = parser.parse_args()
+    if not ReplyCache(maxsize=1, semantic=True).semantic:
+        sys.exit("numpy is needed for the semantic tier")
+    false_hits = sum(evaluate(threshold, args.show) for threshold in args.threshold or [0.8, 0.9])
+    if false_hits:
+        print(f"❌ {false_hits} near misses served a cached reply")
+        sys.exit(1)
+    print("✅ no near miss served a cached reply")
+
+
+if __name__ == "__main__":
+    main()
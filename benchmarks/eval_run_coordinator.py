@@ -0,0 +1,101 @@
+# benchmarks/eval_run_coordinator.py
+#
+# Checks the RunCoordinator (run_coordinator.py) with a stub run: texts from
+# one number, sent from separate webhook threads at set times, and how many
+# runs that cost and who got the reply.
+#
+#   burst          two texts inside the debounce window: exactly one run,
+#                  answering both, and only the second webhook gets the reply
+#   lone text      one run, started after the debounce window
+#   spaced texts   two texts further apart than the window: two runs
+#   behind a run   a text that arrives during a slow run is held, then run
+#                  once the first finishes
+#   deadline       a text whose webhook can't wait for the run in flight is
+#                  acknowledged, and its reply is delivered afterwards
+#
+# Exits 1 if any check fails.
+#
+#   python benchmarks/eval_run_coordinator.py
+
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import resilience
+from run_coordinator import RunCoordinator, combine_messages
+
+DEBOUNCE = 0.3
+NUMBER = "+15145550000"
+
+
+def send(coordinator, texts, run_seconds=0.0, deadline=None):
+    # texts: [(seconds after start, text)]; returns (runs, replies, delivered),
+    # replies being text -> (reply, seconds after start)
+    runs, replies, delivered = [], {}, []
+    started = time.monotonic()
+
+    def run(batch):
+        runs.append(list(batch))
+        time.sleep(run_seconds)
+        return f"reply to {combine_messages(batch)!r}"
+
+    def webhook(at, text):
+        time.sleep(at)
+        if deadline is None:
+            reply = coordinator.submit(NUMBER, text, run)
+        else:
+            with resilience.deadline(deadline):
+                reply = coordinator.submit(NUMBER, text, run, deliver=delivered.append)
+        replies[text] = (reply, time.monotonic() - started)
+
+    threads = [threading.Thread(target=webhook, args=pair) for pair in texts]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    time.sleep(run_seconds * 2 + DEBOUNCE * 2)  # any follow-up run
+    return runs, replies, delivered
+
+
+def check(name, ok, detail):
+    print(f"{'✅' if ok else '❌'} {name}: {detail}")
+    return ok
+
+
+def main():
+    coordinator = RunCoordinator(debounce=DEBOUNCE, max_wait=DEBOUNCE * 4, reserve=0.2)
+    results = []
+
+    runs, replies, _ = send(coordinator, [(0.0, "hi"), (DEBOUNCE / 3, "do you plow driveways?")])
+    results.append(check("burst", runs == [["hi", "do you plow driveways?"]]
+                         and replies["hi"][0] is None and replies["do you plow driveways?"][0] is not None,
+                         f"{len(runs)} run(s) {runs}"))
+
+    runs, replies, _ = send(coordinator, [(0.0, "hi")])
+    results.append(check("lone text", runs == [["hi"]] and replies["hi"][0] is not None,
+                         f"{len(runs)} run(s), answered after {replies['hi'][1]:.2f}s ({DEBOUNCE:g}s window)"))
+
+    runs, replies, _ = send(coordinator, [(0.0, "hi"), (DEBOUNCE * 3, "are you open saturday?")])
+    results.append(check("spaced texts", runs == [["hi"], ["are you open saturday?"]],
+                         f"{len(runs)} run(s) {runs}"))
+
+    runs, replies, _ = send(coordinator, [(0.0, "hi"), (DEBOUNCE * 2, "in laval?")], run_seconds=1.0)
+    results.append(check("behind a run", runs == [["hi"], ["in laval?"]]
+                         and all(reply for reply, _ in replies.values()),
+                         f"{len(runs)} run(s) {runs}"))
+
+    runs, replies, delivered = send(coordinator, [(0.0, "hi"), (DEBOUNCE * 2, "in laval?")],
+                                    run_seconds=1.5, deadline=1.0)
+    results.append(check("deadline", replies["in laval?"][0] is None and delivered == ["reply to 'in laval?'"],
+                         f"webhook answered after {replies['in laval?'][1]:.2f}s with no reply, "
+                         f"delivered {delivered}"))
+
+    if not all(results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,431 @@
+# benchmarks/fake_openai.py
+#
+# Local stand-in for the parts of the OpenAI API the call handler uses, so
+# benchmarks can run without network access or API spend. Point the OpenAI
+# client at it with OpenAI(base_url=server.url, api_key="fake").
+#
+# Runs "think" for a random model latency (uniform between `latency` min and
+# max seconds; FAKE_MODEL_LATENCY="min,max" when run as a script) before
+# completing. Every request is
+# counted per route so benchmarks can report round-trips, and prompt and
+# completion tokens are estimated (~4 characters per token) the way they are
+# billed: a run reads its whole thread, a chat completion reads the messages
+# it was sent.
+#
+# With `tool_calls` (a list of (name, arguments JSON) pairs), a run started
+# with tools stops in requires_action asking for all of them in one step, then
+# thinks again once the outputs are submitted; submitted outputs are kept in
+# state.tool_outputs.
+#
+# With `capacity`, at most that many runs and chat completions are served at
+# once; beyond it requests get a 429 with Retry-After, like a rate-limited
+# account (counted as calls["rate_limited"]).
+#
+# Fault injection: a `hang_rate` fraction of requests stall for
+# `hang_seconds` before being answered, and an `error_rate` fraction fail
+# with a 500 (counted as calls["hung"] / calls["errors"]).
+
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+
+def _id(prefix):
+    return f"{prefix}_{uuid.uuid4().hex[:24]}"
+
+
+def _tokens(text):
+    return len(text) // 4 + 1
+
+
+class FakeOpenAIState:
+    def __init__(self, latency=(0.5, 2.0), reply="Thanks for reaching out! How can we help?", rtt=0.0,
+                 tool_calls=None, capacity=None, hang_rate=0.0, hang_seconds=30.0, error_rate=0.0):
+        self.latency = latency
+        self.reply = reply
+        self.rtt = rtt  # simulated network round-trip added to every request
+        self.tool_calls = tool_calls or []
+        self.tool_outputs = []
+        self.capacity = capacity
+        self.hang_rate = hang_rate
+        self.hang_seconds = hang_seconds
+        self.error_rate = error_rate
+        self.busy = 0  # chat completions in progress
+        self.lock = threading.Lock()
+        self.threads = {}   # thread_id -> list of message dicts (oldest first)
+        self.runs = {}      # run_id -> run dict
+        self.calls = Counter()
+        self.tokens = Counter()  # "prompt" / "completion"
+
+    def model_latency(self):
+        return random.uniform(*self.latency)
+
+    def count(self, route):
+        with self.lock:
+            self.calls[route] += 1
+
+    def usage(self, prompt, completion):
+        with self.lock:
+            self.tokens["prompt"] += prompt
+            self.tokens["completion"] += completion
+        return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
+
+    def over_capacity(self):
+        if self.capacity is None:
+            return False
+        now = time.monotonic()
+        with self.lock:
+            active = sum(1 for run in self.runs.values()
+                         if run["status"] in ("queued", "in_progress") and run["_ready_at"] > now)
+            return active + self.busy >= self.capacity
+
+    def new_thread(self):
+        thread_id = _id("thread")
+        with self.lock:
+            self.threads[thread_id] = []
+        return {"id": thread_id, "object": "thread", "created_at": int(time.time()), "metadata": {}}
+
+    def add_message(self, thread_id, role, content, run_id=None):
+        message = {
+            "id": _id("msg"),
+            "object": "thread.message",
+            "created_at": int(time.time()),
+            "thread_id": thread_id,
+            "role": role,
+            "run_id": run_id,
+            "assistant_id": None,
+            "status": "completed",
+            "attachments": [],
+            "metadata": {},
+            "content": [{"type": "text", "text": {"value": content, "annotations": []}}],
+        }
+        with self.lock:
+            self.threads.setdefault(thread_id, []).append(message)
+        return message
+
+    def new_run(self, thread_id, body):
+        run_id = _id("run")
+        run = {
+            "id": run_id,
+            "object": "thread.run",
+            "created_at": int(time.time()),
+            "thread_id": thread_id,
+            "assistant_id": body.get("assistant_id"),
+            "status": "queued",
+            "required_action": None,
+            "last_error": None,
+            "instructions": "",
+            "model": "fake",
+            "tools": body.get("tools") or [],
+            "metadata": {},
+            "parallel_tool_calls": True,
+            "_ready_at": time.monotonic() + self.model_latency(),
+            "_wants_tools": bool(body.get("tools")) and bool(self.tool_calls),
+        }
+        for extra in body.get("additional_messages") or []:
+            self.add_message(thread_id, extra.get("role", "user"), extra.get("content", ""))
+        with self.lock:
+            self.runs[run_id] = run
+        return run
+
+    def refresh_run(self, run):
+        # Advance a run's status based on elapsed time
+        if run["status"] in ("queued", "in_progress"):
+            if time.monotonic() >= run["_ready_at"] and run["_wants_tools"]:
+                run["_wants_tools"] = False
+                run["status"] = "requires_action"
+                run["required_action"] = {"type": "submit_tool_outputs", "submit_tool_outputs": {"tool_calls": [
+                    {"id": _id("call"), "type": "function", "function": {"name": name, "arguments": arguments}}
+                    for name, arguments in self.tool_calls
+                ]}}
+            elif time.monotonic() >= run["_ready_at"]:
+                thread = self.threads.get(run["thread_id"], [])
+                prompt = sum(_tokens(m["content"][0]["text"]["value"]) + 4 for m in thread)
+                self.add_message(run["thread_id"], "assistant", self.reply, run_id=run["id"])
+                run["usage"] = self.usage(prompt, _tokens(self.reply))
+                run["status"] = "completed"
+            else:
+                run["status"] = "in_progress"
+        return run
+
+    def submit_tool_outputs(self, run, outputs):
+        with self.lock:
+            self.tool_outputs.extend(outputs)
+        run["status"] = "queued"
+        run["required_action"] = None
+        run["_ready_at"] = time.monotonic() + self.model_latency()
+        return run
+
+
+def _public(obj):
+    return {k: v for k, v in obj.items() if not k.startswith("_")}
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    state = None  # set by FakeOpenAIServer
+
+    def log_message(self, *args):
+        pass
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        return json.loads(self.rfile.read(length))
+
+    def _json(self, payload, status=200):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def handle_one_request(self):
+        try:
+            super().handle_one_request()
+        except ConnectionError:
+            pass  # the client gave up on a hung request
+
+    def _fault(self):
+        # Injected failure for this request: True if it was answered with an error
+        state = self.state
+        roll = random.random()
+        if roll < state.error_rate:
+            state.count("errors")
+            self._json({"error": {"message": "The server had an error", "type": "server_error"}}, 500)
+            return True
+        if roll < state.error_rate + state.hang_rate:
+            state.count("hung")
+            time.sleep(state.hang_seconds)
+        return False
+
+    def _rate_limited(self):
+        self.state.count("rate_limited")
+        data = json.dumps({"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}}).encode()
+        self.send_response(429)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Retry-After", "1")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _sse(self, event, payload):
+        self.wfile.write(f"event: {event}\ndata: {json.dumps(payload)}\n\n".encode())
+        self.wfile.flush()
+
+    def _stream_run(self, run, thread=None, resumed=False):
+        state = self.state
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        if thread is not None:
+            self._sse("thread.created", thread)
+        if not resumed:
+            self._sse("thread.run.created", _public(run))
+        self._sse("thread.run.queued", _public(run))
+        run["status"] = "in_progress"
+        self._sse("thread.run.in_progress", _public(run))
+        time.sleep(max(run["_ready_at"] - time.monotonic(), 0))
+        state.refresh_run(run)
+        if run["status"] == "requires_action":
+            self._sse("thread.run.requires_action", _public(run))
+            self.wfile.write(b"event: done\ndata: [DONE]\n\n")
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        message = state.threads[run["thread_id"]][-1]
+        self._sse("thread.message.created", message)
+        self._sse("thread.message.completed", message)
+        self._sse("thread.run.completed", _public(run))
+        self.wfile.write(b"event: done\ndata: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+    def do_GET(self):
+        state = self.state
+        path, _, query = self.path.partition("?")
+        params = dict(parse_qsl(query))
+        time.sleep(state.rtt)
+        if path.startswith("/v1/") and self._fault():
+            return
+
+        m = re.fullmatch(r"/v1/threads/([^/]+)/runs/([^/]+)", path)
+        if m:
+            state.count("runs.retrieve")
+            run = state.runs.get(m.group(2))
+            if not run:
+                return self._json({"error": {"message": "run not found"}}, 404)
+            return self._json(_public(state.refresh_run(run)))
+
+        m = re.fullmatch(r"/v1/threads/([^/]+)/messages", path)
+        if m:
+            state.count("messages.list")
+            data = list(state.threads.get(m.group(1), []))
+            if params.get("run_id"):
+                data = [msg for msg in data if msg["run_id"] == params["run_id"]]
+            if params.get("order", "desc") == "desc":
+                data.reverse()
+            data = data[:int(params.get("limit", 20))]
+            return self._json({
+                "object": "list",
+                "data": data,
+                "first_id": data[0]["id"] if data else None,
+                "last_id": data[-1]["id"] if data else None,
+                "has_more": False,
+            })
+
+        if path == "/_stats":
+            return self._json(dict(state.calls))
+
+        self._json({"error": {"message": f"unknown route {path}"}}, 404)
+
+    def do_POST(self):
+        state = self.state
+        path = self.path.split("?")[0]
+        body = self._body()
+        time.sleep(state.rtt)
+        if path.startswith("/v1/") and self._fault():
+            return
+
+        if path in ("/v1/chat/completions", "/v1/threads/runs") or re.fullmatch(r"/v1/threads/[^/]+/runs", path):
+            if state.over_capacity():
+                return self._rate_limited()
+
+        if path == "/v1/chat/completions":
+            state.count("chat.completions")
+            with state.lock:
+                state.busy += 1
+            try:
+                time.sleep(state.model_latency())
+            finally:
+                with state.lock:
+                    state.busy -= 1
+            prompt = sum(_tokens(m.get("content") or "") + 4 for m in body.get("messages", []))
+            return self._json({
+                "id": _id("chatcmpl"),
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "fake"),
+                "choices": [{
+                    "index": 0,
+                    "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": state.reply},
+                }],
+                "usage": state.usage(prompt, _tokens(state.reply)),
+            })
+
+        if path == "/v1/threads":
+            state.count("threads.create")
+            return self._json(state.new_thread())
+
+        if path == "/v1/threads/runs":
+            state.count("threads.create_and_run")
+            thread = state.new_thread()
+            for message in (body.get("thread") or {}).get("messages") or []:
+                state.add_message(thread["id"], message.get("role", "user"), message.get("content", ""))
+            run = state.new_run(thread["id"], body)
+            if body.get("stream"):
+                return self._stream_run(run, thread)
+            return self._json(_public(run))
+
+        m = re.fullmatch(r"/v1/threads/([^/]+)/messages", path)
+        if m:
+            state.count("messages.create")
+            return self._json(state.add_message(m.group(1), body.get("role", "user"), body.get("content", "")))
+
+        m = re.fullmatch(r"/v1/threads/([^/]+)/runs", path)
+        if m:
+            state.count("runs.create")
+            run = state.new_run(m.group(1), body)
+            if body.get("stream"):
+                return self._stream_run(run)
+            return self._json(_public(run))
+
+        m = re.fullmatch(r"/v1/threads/([^/]+)/runs/([^/]+)/submit_tool_outputs", path)
+        if m:
+            state.count("runs.submit_tool_outputs")
+            run = state.runs.get(m.group(2))
+            if not run or run["status"] != "requires_action":
+                return self._json({"error": {"message": "run is not waiting for tool outputs"}}, 400)
+            state.submit_tool_outputs(run, body.get("tool_outputs") or [])
+            if body.get("stream"):
+                return self._stream_run(run, resumed=True)
+            return self._json(_public(run))
+
+        m = re.fullmatch(r"/v1/threads/([^/]+)/runs/([^/]+)/cancel", path)
+        if m:
+            state.count("runs.cancel")
+            run = state.runs.get(m.group(2))
+            if run:
+                run["status"] = "cancelled"
+                return self._json(_public(run))
+            return self._json({"error": {"message": "run not found"}}, 404)
+
+        if path == "/_reset":
+            state.calls.clear()
+            state.tokens.clear()
+            return self._json({})
+
+        self._json({"error": {"message": f"unknown route {path}"}}, 404)
+
+
+    def do_DELETE(self):
+        state = self.state
+        path = self.path.split("?")[0]
+        time.sleep(state.rtt)
+
+        m = re.fullmatch(r"/v1/threads/([^/]+)", path)
+        if m:
+            state.count("threads.delete")
+            with state.lock:
+                state.threads.pop(m.group(1), None)
+            return self._json({"id": m.group(1), "object": "thread.deleted", "deleted": True})
+
+        self._json({"error": {"message": f"unknown route {path}"}}, 404)
+
+
+class _Server(ThreadingHTTPServer):
+    request_queue_size = 1024  # load tests open hundreds of connections at once
+
+
+class FakeOpenAIServer:
+    def __init__(self, host="127.0.0.1", port=0, **state_kwargs):
+        self.state = FakeOpenAIState(**state_kwargs)
+        handler = type("BoundFakeOpenAIHandler", (FakeOpenAIHandler,), {"state": self.state})
+        self.httpd = _Server((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+if __name__ == "__main__":
+    import os
+
+    port = int(os.getenv("FAKE_OPENAI_PORT", 8765))
+    latency = tuple(float(x) for x in os.getenv("FAKE_MODEL_LATENCY", "0.5,2.0").split(","))
+    server = FakeOpenAIServer(port=port, latency=latency).start()
+    print(f"🧪 Fake OpenAI API listening on {server.url}")
+    try:
+        server.thread.join()
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,98 @@
+# benchmarks/fake_sms.py
+#
+# Local stand-in for the Twilio and Telnyx send-message endpoints
+# (POST /2010-04-01/Accounts/<sid>/Messages.json, POST /v2/messages). Point
+# asgi_app.py at it with TWILIO_API_BASE / TELNYX_API_BASE = server.url.
+#
+# Each send takes a random provider latency (uniform between `latency` min and
+# max seconds) and an `error_rate` fraction fail with a 500. Accepted texts are
+# recorded per sending number (state.accepted: number -> [arrival times]) so
+# benchmarks can check them against the carrier's `carrier_rate` texts/s per
+# number; texts beyond it are counted as calls["over_limit"] (a real carrier
+# queues or filters them).
+
+import json
+import random
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+
+class FakeSmsState:
+    def __init__(self, latency=(0.1, 0.3), error_rate=0.0, carrier_rate=1.0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.carrier_rate = carrier_rate
+        self.accepted = defaultdict(list)
+        self.calls = Counter()
+        self.lock = threading.Lock()
+
+    def accept(self, number, now):
+        # `now`: when the send reached us, which is what the carrier paces
+        with self.lock:
+            sent = self.accepted[number]
+            # More than carrier_rate texts from this number in the last second
+            # (less 50ms of network jitter)
+            if sum(1 for t in sent if now - t < 0.95) + 1 > max(self.carrier_rate, 1):
+                self.calls["over_limit"] += 1
+            sent.append(now)
+            self.calls["accepted"] += 1
+
+
+class FakeSmsHandler(BaseHTTPRequestHandler):
+    state = None  # set on the bound subclass
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, payload, status=200):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        state = self.state
+        raw = self.rfile.read(int(self.headers.get("Content-Length") or 0)).decode()
+        if self.path.endswith("/Messages.json"):
+            number = dict(parse_qsl(raw)).get("From")
+        elif self.path == "/v2/messages":
+            number = json.loads(raw or "{}").get("from")
+        else:
+            return self._json({"error": "not found"}, 404)
+
+        arrived = time.monotonic()
+        time.sleep(random.uniform(*state.latency))
+        if random.random() < state.error_rate:
+            with state.lock:
+                state.calls["errors"] += 1
+            return self._json({"message": "Internal error"}, 500)
+        state.accept(number, arrived)
+        return self._json({"sid": f"SM{uuid.uuid4().hex}", "status": "queued"}, 201)
+
+
+class FakeSmsServer:
+    def __init__(self, host="127.0.0.1", port=0, **state_kwargs):
+        self.state = FakeSmsState(**state_kwargs)
+        handler = type("BoundFakeSmsHandler", (FakeSmsHandler,), {"state": self.state})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,144 @@
+# calculator.py
+#
+# The assistant's safe_calculate tool. The old version stripped characters
+# with a regex and called eval(), so inputs like "9**9**9" got through and
+# could pin a CPU for minutes; tool arguments were also parsed with eval()
+# instead of JSON.
+#
+# Expressions are parsed with ast and only numbers, + - * / // % ** and
+# parentheses are accepted; "x" / "×" / "÷" / "^", "$" and thousands
+# separators are rewritten first, and any other character is refused rather
+# than dropped ("sqrt(16)" used to come out as 16, "2^10" as 210).
+# Evaluation is bounded: at most CALC_MAX_LENGTH characters and MAX_NODES
+# operations, every operand and intermediate result within CALC_MAX_VALUE,
+# exponents within MAX_EXPONENT and checked against the result size *before*
+# computing, and a CALC_TIME_BUDGET deadline on top. Results are memoized
+# (an LRU of CALC_CACHE_SIZE expressions) since the assistant tends to ask
+# for the same quotes ("45 * 12") again.
+#
+#   CALC_MAX_LENGTH     max expression length in characters (default 200)
+#   CALC_MAX_VALUE      max magnitude of any operand or result (default 1e15)
+#   CALC_TIME_BUDGET    seconds per evaluation (default 0.05)
+#   CALC_CACHE_SIZE     memoized expressions (default 1024)
+
+import ast
+import math
+import operator
+import os
+import re
+import time
+from functools import lru_cache
+
+CALC_MAX_LENGTH = int(os.getenv("CALC_MAX_LENGTH", "200"))
+CALC_MAX_VALUE = float(os.getenv("CALC_MAX_VALUE", "1e15"))
+CALC_TIME_BUDGET = float(os.getenv("CALC_TIME_BUDGET", "0.05"))
+CALC_CACHE_SIZE = int(os.getenv("CALC_CACHE_SIZE", "1024"))
+
+MAX_NODES = 100
+MAX_EXPONENT = 64
+
+BINARY = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: operator.pow,
+}
+UNARY = {ast.UAdd: operator.pos, ast.USub: operator.neg}
+
+_ALLOWED = set("0123456789.+-*/%() \t\n")
+_EXPONENT = re.compile(r"(?<=[\d.])e(?=[+\-]?\d)")  # the e of 1e6
+
+
+class CalculationError(ValueError):
+    pass
+
+
+def _check(value):
+    if isinstance(value, complex) or not math.isfinite(value) or abs(value) > CALC_MAX_VALUE:
+        raise CalculationError("number too large")
+    return value
+
+
+def _power(base, exponent):
+    # Refuse before computing anything whose size we can't bound
+    if abs(exponent) > MAX_EXPONENT:
+        raise CalculationError("exponent too large")
+    if base not in (0, 1, -1) and exponent > 0 and exponent * math.log10(abs(base)) > math.log10(CALC_MAX_VALUE):
+        raise CalculationError("number too large")
+    return base ** exponent
+
+
+def _compile(node, budget):
+    # Validated AST -> closure evaluating it against a deadline; `budget`
+    # counts the nodes still allowed
+    budget[0] -= 1
+    if budget[0] < 0:
+        raise CalculationError("expression too long")
+    if isinstance(node, ast.Expression):
+        return _compile(node.body, budget)
+    if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+        value = _check(node.value)
+        return lambda deadline: value
+    if isinstance(node, ast.UnaryOp) and type(node.op) in UNARY:
+        op, operand = UNARY[type(node.op)], _compile(node.operand, budget)
+        return lambda deadline: op(operand(deadline))
+    if isinstance(node, ast.BinOp) and type(node.op) in BINARY:
+        op = _power if isinstance(node.op, ast.Pow) else BINARY[type(node.op)]
+        left, right = _compile(node.left, budget), _compile(node.right, budget)
+
+        def binary(deadline):
+            a, b = left(deadline), right(deadline)
+            if time.monotonic() > deadline:
+                raise CalculationError("took too long")
+            try:
+                return _check(op(a, b))
+            except ZeroDivisionError:
+                raise CalculationError("division by zero")
+            except OverflowError:
+                raise CalculationError("number too large")
+        return binary
+    raise CalculationError("only numbers and + - * / // % ** ( ) are allowed")
+
+
+def _clean(expression):
+    # "$1,200 x 3" -> "1200 * 3", "2^10" -> "2**10". Anything else outside
+    # the grammar is refused, not dropped: "sqrt(16)" must not become 16
+    expression = str(expression).lower().replace("÷", "/").replace("^", "**").replace("$", "")
+    expression = re.sub(r"(?<=\d),(?=\d{3}\b)", "", expression)
+    expression = re.sub(r"(?<=[\d)\s])[x×](?=[\s\d(])", "*", expression)
+    unsupported = sorted(set(_EXPONENT.sub("", expression)) - _ALLOWED)
+    if unsupported:
+        raise CalculationError(f"unsupported characters: {' '.join(unsupported)}")
+    return expression.strip()
+
+
+@lru_cache(maxsize=CALC_CACHE_SIZE)
+def _evaluate(cleaned):
+    if not cleaned:
+        raise CalculationError("empty expression")
+    if len(cleaned) > CALC_MAX_LENGTH:
+        raise CalculationError("expression too long")
+    try:
+        tree = ast.parse(cleaned, mode="eval")
+    except SyntaxError:
+        raise CalculationError("not a valid expression")
+    evaluate = _compile(tree, [MAX_NODES])
+    result = evaluate(time.monotonic() + CALC_TIME_BUDGET)
+    if isinstance(result, float):
+        # 0.1 + 0.2 -> 0.3, 7.0 -> 7
+        result = round(result, 10)
+        if result.is_integer():
+            result = int(result)
+    return result
+
+
+def safe_calculate(expression):
+    # The number, or "Could not calculate: <reason>" for the assistant to relay
+    try:
+        return _evaluate(_clean(expression))
+    except CalculationError as e:
+        return f"Could not calculate: {e}"
+
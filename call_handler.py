@@ -0,0 +1,335 @@
+# call_handler.py
+#
+# The call handler as one application. app.py … app5.py, test.py and
+# telnyx-test.py grew as copies of each other, and each imported twilio,
+# openai, gspread and oauth2client and built every client as it was
+# imported, which made cold starts slow on autoscaled instances.
+# create_app(config) builds any of them from feature flags, and defers the
+# heavy work until something needs it:
+#
+#   - the OpenAI, Twilio and Telnyx clients are LazyClients, built after the
+#     app is up (or on first use), so e.g. the openai package isn't imported
+#     before the app can answer /voice; the thread pool starts with them
+#   - modules only some flags need (chat_engine, the tools, the Sheets
+#     writers, the completion fast path, twiml_templates for Twilio) are
+#     imported only when selected
+#   - gspread/oauth2client load on the first Sheets write (sheets_session.py)
+#
+# Flags come from the config passed in, falling back to the environment:
+#
+#   CARRIERS          "twilio", "telnyx" or "twilio,telnyx" (default: the
+#                     ones with credentials set, else twilio)
+#   REPLY_ENGINE      "assistants": an Assistants thread per caller (default)
+#                     "stateless": a new thread for every text
+#                     "chat": chat completions with local history (chat_engine.py)
+#                     "completion": one completion over the business facts,
+#                     with the local fast path and reply cache
+#   SHEETS_LOG        "monthly": SheetLogWriter on SPREADSHEET_ID (default)
+#                     "transcript": TranscriptLogWriter on SHEETS_SPREADSHEET_NAME
+#                     (on SPREADSHEET_ID when the name is set empty)
+#                     "off"; which sinks get turns at all is LOG_SINKS (log_sinks.py)
+#   ASSISTANT_TOOLS   "on" or "off" (default): the calculator tool
+#   COALESCE_TEXTS    "on" (default) or "off": texts in quick succession get
+#                     one run (run_coordinator.py)
+#   LAZY_INIT         "background" (default): create_app returns at once and a
+#                     background thread builds the clients and fills the pool,
+#                     so the first text usually finds them ready
+#                     "on": build each client when it is first used
+#                     "off": build every client in create_app
+#
+# Everything create_app builds is on app.extensions["call_handler"].
+#
+#   gunicorn 'call_handler:create_app()'
+#   app = create_app({"CARRIERS": "telnyx", "REPLY_ENGINE": "chat"})
+
+from dotenv import load_dotenv
+load_dotenv()  # before the modules below read their settings
+
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+from flask import Flask, request, Response
+
+import metrics
+import resilience
+from log_sinks import LOG_SINKS, make_turn_log
+from messaging import (MessagePipeline, TelnyxAdapter, TwilioAdapter, assistant_answer,
+                       completion_answer)
+from run_completion import reply_in_thread
+from run_coordinator import RunCoordinator
+from sms_dispatcher import make_sms_dispatcher
+from webhook_dedup import dedup_webhooks, make_webhook_index
+
+MISSED_CALL_TEXT = "Hey! Sorry we missed your call. How can we help you today?"
+NO_ANSWER_TEXT = "We noticed you called but didn’t get through. Can we help?"
+
+CALCULATOR_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "safe_calculate",
+        "description": "Safely calculate a math expression like '100 * 20'",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "expression": {
+                    "type": "string",
+                    "description": "Math expression to evaluate"
+                }
+            },
+            "required": ["expression"]
+        }
+    }
+}
+
+
+def default_config():
+    # Flags and settings from the environment (read when the app is created)
+    carriers = [name for name, key in (("twilio", "TWILIO_SID"), ("telnyx", "TELNYX_API_KEY")) if os.getenv(key)]
+    return {
+        "CARRIERS": os.getenv("CARRIERS", ",".join(carriers) or "twilio"),
+        "REPLY_ENGINE": os.getenv("REPLY_ENGINE", "assistants"),
+        "SHEETS_LOG": os.getenv("SHEETS_LOG", "monthly"),
+        "ASSISTANT_TOOLS": os.getenv("ASSISTANT_TOOLS", "off"),
+        "COALESCE_TEXTS": os.getenv("COALESCE_TEXTS", "on"),
+        "LAZY_INIT": os.getenv("LAZY_INIT", "background"),
+        "LOG_SINKS": LOG_SINKS,
+        "ASSISTANT_ID": os.getenv("OPENAI_ASSISTANT_ID"),
+        "TWILIO_NUMBER": os.getenv("TWILIO_NUMBER"),
+        "TELNYX_NUMBER": os.getenv("TELNYX_NUMBER") if os.getenv("TELNYX_API_KEY") else None,
+        "OWNER_NUMBER": os.getenv("OWNER_NUMBER"),
+        "SPREADSHEET_ID": os.getenv("SPREADSHEET_ID"),
+        "SHEETS_SPREADSHEET_NAME": os.getenv("SHEETS_SPREADSHEET_NAME", "AI Conversation Logs"),
+        "GOOGLE_CREDENTIALS_JSON": os.getenv("GOOGLE_CREDENTIALS_JSON", "google-credentials.json"),
+        "HOME_MESSAGE": "AI Call Handler backend is running. Nothing to see here.",
+    }
+
+
+def _names(value):
+    if isinstance(value, str):
+        value = value.split(",")
+    return [name.strip().lower() for name in value if name.strip()]
+
+
+class LazyClient:
+    # Stands in for a client and builds it on first attribute access
+    def __init__(self, build):
+        self._build = build
+        self._client = None
+        self._lock = threading.Lock()
+
+    def resolve(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._build()
+        return self._client
+
+    def __getattr__(self, name):
+        return getattr(self.resolve(), name)
+
+
+# — clients
+
+def _openai():
+    from openai import OpenAI
+    return OpenAI(api_key=os.getenv("OPENAI_API_KEY"), timeout=resilience.OPENAI_TIMEOUT)
+
+
+def _twilio():
+    from twilio.rest import Client
+    return Client(os.getenv("TWILIO_SID"), os.getenv("TWILIO_AUTH"), http_client=resilience.twilio_http_client())
+
+
+def _telnyx():
+    import telnyx
+    telnyx.api_key = os.getenv("TELNYX_API_KEY")
+    resilience.install_telnyx(telnyx)
+    return telnyx
+
+
+def _sheets_writer(config):
+    # Builds the Sheets log sink; only called if LOG_SINKS includes "sheets"
+    mode = config["SHEETS_LOG"].lower()
+    if mode == "off":
+        return None
+
+    def build():
+        from sheets_session import SheetsSession
+        creds_path = config["GOOGLE_CREDENTIALS_JSON"]
+        if mode == "transcript":
+            from transcript_log import TranscriptLogWriter
+            name = config["SHEETS_SPREADSHEET_NAME"]
+            session = SheetsSession(spreadsheet_id=None if name else config["SPREADSHEET_ID"],
+                                    spreadsheet_name=name, creds_path=creds_path)
+            return TranscriptLogWriter(session).start()
+        from sheet_log_writer import SheetLogWriter
+        return SheetLogWriter(SheetsSession(spreadsheet_id=config["SPREADSHEET_ID"], creds_path=creds_path)).start()
+    return build
+
+
+def _tools():
+    # Tool handlers by name; a run step's calls run concurrently (each with
+    # its own timeout) and their outputs are submitted together
+    from calculator import safe_calculate
+    from tool_registry import ToolRegistry
+
+    tools = ToolRegistry()
+    tools.register(CALCULATOR_TOOL, lambda args: safe_calculate(args.get("expression", "")), timeout=1)
+    return {"tools": tools.definitions, "tool_handler": tools.handle}
+
+
+def _answer(config, client, handler):
+    # answer(number, text) for REPLY_ENGINE; sets up the engine's state on `handler`
+    engine = config["REPLY_ENGINE"].lower()
+    assistant_id = config["ASSISTANT_ID"]
+    if engine == "completion":
+        return completion_answer(client)
+    if engine == "chat":
+        from chat_engine import CHAT_MODEL, CHAT_HISTORY_TOKENS, ChatEngine
+        print(f"💬 Replying with chat completions ({CHAT_MODEL}, {CHAT_HISTORY_TOKENS}-token history)")
+        return ChatEngine(client).reply
+    # Only the Assistants engines run tools
+    run_kwargs = _tools() if config["ASSISTANT_TOOLS"].lower() == "on" else {}
+    if engine == "stateless":
+        return lambda from_number, text: reply_in_thread(client, None, assistant_id, text, **run_kwargs)[1]
+
+    from thread_pool import ThreadPool
+    from thread_store import make_thread_store
+    # Conversation thread per caller (bounded cache + SQLite shared by all
+    # workers), and pre-created threads for first-time callers
+    handler.thread_store = make_thread_store()
+    handler.thread_pool = ThreadPool(client)
+    answer = assistant_answer(client, assistant_id, handler.thread_store, handler.thread_pool, **run_kwargs)
+
+    def answer_and_refill(from_number, text):
+        handler.thread_pool.start()
+        return answer(from_number, text)
+    return answer_and_refill
+
+
+def _warm_up(clients, thread_pool):
+    start = time.perf_counter()
+    for lazy in clients:
+        try:
+            lazy.resolve()
+        except Exception as e:
+            # Built again on first use
+            print("⚠️ Could not build client ahead of time:", e)
+    if thread_pool:
+        thread_pool.start()
+    metrics.observe("startup.warm_up", time.perf_counter() - start)
+
+
+def create_app(config=None):
+    app = Flask(__name__)
+    app.config.from_mapping(default_config())
+    app.config.update(config or {})
+    config = app.config
+    carriers = _names(config["CARRIERS"])
+
+    # Upstream calls made for a webhook share its deadline (resilience.py)
+    resilience.request_deadlines(app)
+    # Redelivered webhooks get the first delivery's response instead of a rerun (webhook_dedup.py)
+    webhooks = make_webhook_index()
+    dedup_webhooks(app, webhooks)
+    client = LazyClient(_openai)
+    twilio_client = LazyClient(_twilio) if "twilio" in carriers else None
+    telnyx = LazyClient(_telnyx) if "telnyx" in carriers else None
+    handler = SimpleNamespace(client=client, webhooks=webhooks, twiml=None, thread_store=None, thread_pool=None)
+
+    # Outbound texts are queued and sent in the background, paced per number (sms_dispatcher.py)
+    handler.outbox = make_sms_dispatcher(twilio_client=twilio_client, telnyx=telnyx)
+    # Every turn goes to the configured log sinks: SQLite, the Sheets writer, the archive
+    handler.turn_log = make_turn_log(sheets=_sheets_writer(config), sinks=_names(config["LOG_SINKS"]))
+    # One reply pipeline for every carrier (messaging.py): parse the webhook,
+    # coalesce quick texts, generate, reply, log
+    handler.pipeline = MessagePipeline(
+        _answer(config, client, handler), handler.outbox, handler.turn_log,
+        coordinator=RunCoordinator() if config["COALESCE_TEXTS"].lower() != "off" else None,
+    )
+    if "twilio" in carriers:
+        # Static TwiML is rendered once, not rebuilt per call (twiml_templates.py);
+        # imported here so a Telnyx-only app never loads twilio.twiml
+        from twiml_templates import TwimlTemplates
+        handler.twiml = TwimlTemplates()
+        handler.pipeline.route(app, TwilioAdapter(config["TWILIO_NUMBER"], handler.twiml))
+        _voice_routes(app, config, handler)
+    if "telnyx" in carriers:
+        handler.pipeline.route(app, TelnyxAdapter(config["TELNYX_NUMBER"]))
+
+    clients = [lazy for lazy in (client, twilio_client, telnyx) if lazy is not None]
+    lazy_init = config["LAZY_INIT"].lower()
+    if lazy_init == "off":
+        # Everything up front, as the separate apps did
+        _warm_up(clients, handler.thread_pool)
+    elif lazy_init != "on":
+        threading.Thread(target=_warm_up, args=(clients, handler.thread_pool), name="warm-up", daemon=True).start()
+
+    @app.route("/test-gpt", methods=["GET"])
+    def test_gpt():
+        try:
+            if config["REPLY_ENGINE"].lower() == "completion":
+                response = client.chat.completions.create(
+                    model="gpt-3.5-turbo", messages=[{"role": "user", "content": "Say hi in 3 words"}])
+                return response.choices[0].message.content, 200
+            return reply_in_thread(client, None, config["ASSISTANT_ID"], "Say hi in 3 words")[1], 200
+        except Exception as e:
+            print("❌ GPT ERROR:", e)
+            return f"GPT error: {e}", 500
+
+    @app.route("/metrics", methods=["GET"])
+    def metrics_snapshot():
+        return metrics.snapshot(), 200
+
+    @app.route("/", methods=["GET", "HEAD"])
+    def home():
+        return config["HOME_MESSAGE"], 200
+
+    app.extensions["call_handler"] = handler
+    return app
+
+
+def _voice_routes(app, config, handler):
+    # Twilio voice webhooks: missed calls get a text, calls are forwarded
+    webhooks, outbox, twiml = handler.webhooks, handler.outbox, handler.twiml
+
+    def text_caller(from_number, message):
+        if not webhooks.allow_outreach(from_number):
+            return
+        if not outbox.send("twilio", config["TWILIO_NUMBER"], from_number, message):
+            webhooks.release_outreach(from_number)  # the next call for them may text again
+            return
+        # Their reply is likely coming: have a thread ready, with this text in it
+        if handler.thread_pool:
+            handler.thread_pool.start()
+            handler.thread_pool.assign(handler.thread_store, from_number, seed=message)
+
+    @app.route("/missed-call", methods=["POST"])
+    def missed_call():
+        text_caller(request.form.get("From"), MISSED_CALL_TEXT)
+        return Response(twiml.missed_call(), mimetype="application/xml")
+
+    @app.route("/voice", methods=["POST"])
+    def voice():
+        return Response(twiml.voice(), mimetype="application/xml")
+
+    @app.route("/handle-recording", methods=["POST"])
+    def handle_recording():
+        recording_url = request.form.get("RecordingUrl")
+        caller = request.form.get("From")
+        outbox.send("twilio", config["TWILIO_NUMBER"], config["OWNER_NUMBER"],
+                    f"Voicemail from {caller}: {recording_url}")
+        return ("", 200)
+
+    @app.route("/call-status", methods=["POST"])
+    def call_status():
+        if request.form.get("CallStatus") in ["no-answer", "busy", "failed", "canceled"]:
+            text_caller(request.form.get("From"), NO_ANSWER_TEXT)
+        return ("", 200)
+
+
+if __name__ == "__main__":
+    port = int(os.environ.get("PORT", 5000))
+    create_app().run(host="0.0.0.0", port=port)
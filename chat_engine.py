@@ -0,0 +1,387 @@
+# chat_engine.py
+#
+# Conversation engine on the plain chat-completions API, as an alternative to
+# Assistants threads. An Assistants reply costs four or five round-trips
+# (threads.create the first time, messages.create, runs.create, then polling
+# or a stream, then messages.list) and every run re-reads the whole thread.
+# Here the history lives locally (SQLite) and each reply is exactly one
+# chat.completions call:
+#
+#   system prompt + summary of older turns + recent turns (within
+#   CHAT_HISTORY_TOKENS) + the new message
+#
+# Turns that fall out of the window are folded into the running summary
+# incrementally, in the background, by a separate completion (previous
+# summary + the turns that dropped out -> new summary), so the customer
+# never waits for it and the prompt size stays bounded however long the
+# conversation gets. Each summary picks up from the last summarized message,
+# SUMMARY_BATCH messages at a time, so a backlog (summaries that failed, or
+# more turns than a reply loads) is caught up over the next replies rather
+# than skipped.
+#
+# Replies for the same number run one at a time (a lock per number), so two
+# texts can't interleave their history; with COALESCE_TEXTS=off nothing else
+# serializes them.
+#
+# Token counts use tiktoken when it is installed (imported on the first
+# count), otherwise ~4 characters per token.
+#
+# Completions hold an admission slot (admission.py): a customer's first
+# message ahead of ongoing chats, summaries last. They go through the
+# "openai" circuit breaker and are timed out by the request's deadline
+# (resilience.py).
+#
+# Metrics: chat.completion (latency), chat.prompt_tokens,
+# chat.completion_tokens, chat.summaries, chat.summary_errors,
+# chat.summaries_skipped (no OpenAI capacity in time; retried next reply).
+#
+#   REPLY_ENGINE          "assistants" (default) or "chat"
+#   CHAT_MODEL            default gpt-3.5-turbo
+#   CHAT_HISTORY_TOKENS   budget for the verbatim recent turns (default 1500)
+#   CHAT_SUMMARY_TOKENS   max length of the running summary (default 300)
+#   CHAT_DB_PATH          SQLite file (default: LOG_DB_PATH, conversations.db)
+#   CHAT_SYSTEM_PROMPT    instructions (default: built from the business facts)
+
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+
+import admission
+import metrics
+import resilience
+from intent_router import business_facts, facts_prompt
+from log_sinks import LOG_DB_PATH
+from sqlite_db import per_thread_connection
+from thread_store import normalize_number
+
+REPLY_ENGINE = os.getenv("REPLY_ENGINE", "assistants").lower()
+CHAT_MODEL = os.getenv("CHAT_MODEL", "gpt-3.5-turbo")
+CHAT_HISTORY_TOKENS = int(os.getenv("CHAT_HISTORY_TOKENS", "1500"))
+CHAT_SUMMARY_TOKENS = int(os.getenv("CHAT_SUMMARY_TOKENS", "300"))
+CHAT_DB_PATH = os.getenv("CHAT_DB_PATH", LOG_DB_PATH)
+CHAT_SYSTEM_PROMPT = os.getenv("CHAT_SYSTEM_PROMPT")
+
+LOAD_LIMIT = 200       # most recent unsummarized messages read per reply
+SUMMARY_BATCH = 50     # oldest unsummarized messages folded in per summary
+MESSAGE_OVERHEAD = 4   # tokens the API adds per message
+
+SUMMARY_INSTRUCTIONS = (
+    "You keep a running summary of an SMS conversation between a customer and a "
+    "blue-collar business. Update the summary with the new messages. Keep the "
+    "customer's name, address, the services they asked about, dates and times, "
+    "prices quoted and anything promised to them. Reply with the summary only, "
+    "in at most {words} words."
+)
+
+
+def default_system_prompt():
+    calendly_link = os.getenv("CALENDLY_LINK") or "https://calendly.com/caleb-yohannes2003"
+    return (
+        "You are an assistant for a blue-collar business, texting with customers over SMS. "
+        "Keep replies short. Use the info below to answer questions."
+        + facts_prompt(business_facts(calendly_link))
+    )
+
+
+_encoding = None  # tiktoken's, loaded on the first count; False if it isn't installed
+
+
+def count_tokens(text):
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except ImportError:  # token counts are estimated instead
+            _encoding = False
+    if not _encoding:
+        return len(text) // 4 + 1
+    return len(_encoding.encode(text))
+
+
+class ChatHistoryStore:
+    def __init__(self, path=CHAT_DB_PATH):
+        self.path = path
+        self._db = per_thread_connection(path)
+        db = self._db()
+        db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS chat_messages (
+                id          INTEGER PRIMARY KEY AUTOINCREMENT,
+                number      TEXT NOT NULL,
+                role        TEXT NOT NULL,
+                content     TEXT NOT NULL,
+                tokens      INTEGER NOT NULL,
+                created_at  REAL NOT NULL
+            )
+            """
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS chat_messages_by_number ON chat_messages (number, id)")
+        db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS chat_summaries (
+                number      TEXT PRIMARY KEY,
+                summary     TEXT NOT NULL,
+                through_id  INTEGER NOT NULL
+            )
+            """
+        )
+
+    def load(self, number):
+        # (summary or None, [(id, role, content, tokens)] not yet summarized, oldest first)
+        db = self._db()
+        row = db.execute("SELECT summary, through_id FROM chat_summaries WHERE number = ?", (number,)).fetchone()
+        summary, through_id = row if row else (None, 0)
+        messages = db.execute(
+            "SELECT id, role, content, tokens FROM chat_messages WHERE number = ? AND id > ? "
+            "ORDER BY id DESC LIMIT ?",
+            (number, through_id, LOAD_LIMIT),
+        ).fetchall()
+        return summary, messages[::-1]
+
+    def unsummarized(self, number, through_id, limit=SUMMARY_BATCH):
+        # (summary or None, the oldest [(id, role, content, tokens)] after the
+        # summary, up to `through_id`)
+        db = self._db()
+        row = db.execute("SELECT summary, through_id FROM chat_summaries WHERE number = ?", (number,)).fetchone()
+        summary, summarized = row if row else (None, 0)
+        messages = db.execute(
+            "SELECT id, role, content, tokens FROM chat_messages WHERE number = ? AND id > ? AND id <= ? "
+            "ORDER BY id LIMIT ?",
+            (number, summarized, through_id, limit),
+        ).fetchall()
+        return summary, messages
+
+    def append(self, number, turns):
+        # turns: [(role, content)], written together
+        db = self._db()
+        now = time.time()
+        with db:
+            db.executemany(
+                "INSERT INTO chat_messages (number, role, content, tokens, created_at) VALUES (?, ?, ?, ?, ?)",
+                [(number, role, content, count_tokens(content), now) for role, content in turns],
+            )
+
+    def save_summary(self, number, summary, through_id):
+        self._db().execute(
+            "INSERT INTO chat_summaries (number, summary, through_id) VALUES (?, ?, ?) "
+            "ON CONFLICT (number) DO UPDATE SET summary = excluded.summary, through_id = excluded.through_id",
+            (number, summary, through_id),
+        )
+
+
+class _NumberLocks:
+    # A lock per number (`factory`: threading.Lock or asyncio.Lock), kept
+    # only while someone holds or waits for it
+    def __init__(self, factory):
+        self.factory = factory
+        self.locks = {}  # number -> [lock, holders + waiters]
+        self.guard = threading.Lock()
+
+    def _enter(self, number):
+        with self.guard:
+            entry = self.locks.setdefault(number, [self.factory(), 0])
+            entry[1] += 1
+            return entry[0]
+
+    def _leave(self, number):
+        with self.guard:
+            entry = self.locks[number]
+            entry[1] -= 1
+            if not entry[1]:
+                del self.locks[number]
+
+    @contextmanager
+    def hold(self, number):
+        lock = self._enter(number)
+        try:
+            with lock:
+                yield
+        finally:
+            self._leave(number)
+
+    @asynccontextmanager
+    async def ahold(self, number):
+        lock = self._enter(number)
+        try:
+            async with lock:
+                yield
+        finally:
+            self._leave(number)
+
+
+def _priority(messages):
+    # Just the system prompt and the new message: nothing said before
+    if len(messages) <= 2:
+        return admission.FIRST_CONTACT
+    return admission.ONGOING
+
+
+class ChatEngine:
+    def __init__(self, client, model=CHAT_MODEL, system_prompt=None, store=None,
+                 history_tokens=CHAT_HISTORY_TOKENS, summary_tokens=CHAT_SUMMARY_TOKENS):
+        self.client = client
+        self.model = model
+        self.system_prompt = system_prompt or CHAT_SYSTEM_PROMPT or default_system_prompt()
+        self.store = store or ChatHistoryStore()
+        self.history_tokens = history_tokens
+        self.summary_tokens = summary_tokens
+        self.replying = _NumberLocks(threading.Lock)
+        self.areplying = _NumberLocks(asyncio.Lock)
+        self.summarizing = set()
+        self.summarizing_lock = threading.Lock()
+        self.summarizer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chat-summary")
+        self.tasks = set()  # asyncio summary tasks, referenced until done
+
+    # — building the prompt
+
+    def _prepare(self, number, user_msg):
+        # (messages to send, turns that no longer fit the window, current summary)
+        summary, history = self.store.load(number)
+        kept = len(history)
+        used = 0
+        while kept > 0 and used + history[kept - 1][3] + MESSAGE_OVERHEAD <= self.history_tokens:
+            kept -= 1
+            used += history[kept][3] + MESSAGE_OVERHEAD
+        overflow, recent = history[:kept], history[kept:]
+
+        messages = [{"role": "system", "content": self.system_prompt}]
+        if summary:
+            messages.append({"role": "system", "content": f"Summary of the earlier conversation with this customer:\n{summary}"})
+        messages += [{"role": role, "content": content} for _, role, content, _ in recent]
+        messages.append({"role": "user", "content": user_msg})
+        return messages, overflow, summary
+
+    def _finish(self, number, user_msg, completion, seconds):
+        reply = completion.choices[0].message.content.strip()
+        metrics.observe("chat.completion", seconds)
+        usage = getattr(completion, "usage", None)
+        if usage is not None:
+            metrics.inc("chat.prompt_tokens", usage.prompt_tokens)
+            metrics.inc("chat.completion_tokens", usage.completion_tokens)
+        self.store.append(number, [("user", user_msg), ("assistant", reply)])
+        return reply
+
+    def _claim_summary(self, number, overflow):
+        # Only one summary per number in flight; the next reply retries
+        if not overflow:
+            return False
+        with self.summarizing_lock:
+            if number in self.summarizing:
+                return False
+            self.summarizing.add(number)
+            return True
+
+    def _summary_request(self, summary, overflow):
+        transcript = "\n".join(
+            f"{'Customer' if role == 'user' else 'Business'}: {content}" for _, role, content, _ in overflow
+        )
+        return {
+            "model": self.model,
+            "max_tokens": self.summary_tokens,
+            "messages": [
+                {"role": "system", "content": SUMMARY_INSTRUCTIONS.format(words=self.summary_tokens * 3 // 4)},
+                {"role": "user", "content": f"Current summary:\n{summary or '(none yet)'}\n\nNew messages:\n{transcript}"},
+            ],
+        }
+
+    def _summary_done(self, number, overflow, completion):
+        self.store.save_summary(number, completion.choices[0].message.content.strip(), overflow[-1][0])
+        metrics.inc("chat.summaries")
+
+    def _summary_failed(self, error):
+        # Nothing is lost: the turns stay unsummarized and are retried next reply
+        if isinstance(error, admission.AdmissionRejected):
+            metrics.inc("chat.summaries_skipped")
+            return
+        metrics.inc("chat.summary_errors")
+        print("⚠️ Could not summarize conversation:", error)
+
+    def _summarize(self, number, through_id):
+        # Fold the oldest unsummarized messages, up to `through_id`, into the summary
+        try:
+            summary, overflow = self.store.unsummarized(number, through_id)
+            if not overflow:
+                return
+            with admission.slot(admission.BACKGROUND):
+                completion = resilience.breaker("openai").call(
+                    lambda: self.client.chat.completions.create(**self._summary_request(summary, overflow)))
+            self._summary_done(number, overflow, completion)
+        except Exception as e:
+            self._summary_failed(e)
+        finally:
+            with self.summarizing_lock:
+                self.summarizing.discard(number)
+
+    async def _asummarize(self, number, through_id):
+        resilience.clear_deadline()  # the task outlives the webhook it came from
+        try:
+            summary, overflow = await asyncio.to_thread(self.store.unsummarized, number, through_id)
+            if not overflow:
+                return
+            async with admission.aslot(admission.BACKGROUND):
+                completion = await resilience.breaker("openai").acall(
+                    lambda: self.client.chat.completions.create(**self._summary_request(summary, overflow)))
+            await asyncio.to_thread(self._summary_done, number, overflow, completion)
+        except Exception as e:
+            self._summary_failed(e)
+        finally:
+            with self.summarizing_lock:
+                self.summarizing.discard(number)
+
+    # — replies
+
+    def reply(self, number, user_msg):
+        number = normalize_number(number)
+        with self.replying.hold(number):
+            return self._reply(number, user_msg)
+
+    def _reply(self, number, user_msg):
+        messages, overflow, _ = self._prepare(number, user_msg)
+        start = []
+
+        def complete():
+            start.append(time.perf_counter())
+            return resilience.for_deadline(self.client).chat.completions.create(
+                model=self.model, messages=messages, timeout=resilience.timeout_for(resilience.OPENAI_TIMEOUT))
+
+        completion = resilience.breaker("openai").call(lambda: admission.call(complete, _priority(messages)))
+        reply = self._finish(number, user_msg, completion, time.perf_counter() - start[-1])
+        if self._claim_summary(number, overflow):
+            self.summarizer.submit(self._summarize, number, overflow[-1][0])
+        return reply
+
+    async def areply(self, number, user_msg):
+        # Same as reply() for an AsyncOpenAI client; the SQLite history is
+        # read and written in a worker thread, off the event loop
+        number = normalize_number(number)
+        async with self.areplying.ahold(number):
+            return await self._areply(number, user_msg)
+
+    async def _areply(self, number, user_msg):
+        messages, overflow, _ = await asyncio.to_thread(self._prepare, number, user_msg)
+        start = []
+
+        async def complete():
+            start.append(time.perf_counter())
+            return await resilience.for_deadline(self.client).chat.completions.create(
+                model=self.model, messages=messages, timeout=resilience.timeout_for(resilience.OPENAI_TIMEOUT))
+
+        completion = await resilience.breaker("openai").acall(lambda: admission.acall(complete, _priority(messages)))
+        reply = await asyncio.to_thread(self._finish, number, user_msg, completion, time.perf_counter() - start[-1])
+        if self._claim_summary(number, overflow):
+            task = asyncio.create_task(self._asummarize(number, overflow[-1][0]))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+        return reply
+
+
+def make_reply_engine(client):
+    # A ChatEngine when REPLY_ENGINE=chat, else None (use Assistants threads)
+    if REPLY_ENGINE != "chat":
+        return None
+    print(f"💬 Replying with chat completions ({CHAT_MODEL}, {CHAT_HISTORY_TOKENS}-token history)")
+    return ChatEngine(client)
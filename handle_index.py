@@ -0,0 +1,130 @@
+# handle_index.py
+#
+# In-memory index of the handles already present in each monthly tab, so the
+# "🟢 New conversation" check is a set lookup instead of downloading all of
+# column C (O(rows), slower every day of the month) for every message.
+#
+# Each tab's index is loaded once from column C and then updated as we append
+# rows. We also track how many rows the tab should have; each Sheets append
+# response says where the rows actually landed, so if someone adds or deletes
+# rows by hand the mismatch marks the index stale and it is reloaded before
+# the next write. (Appends from concurrent requests can finish in any order,
+# so the exact check waits until none are in flight.) As a backstop against
+# in-place edits, which don't move rows, an index is also reloaded after
+# HANDLE_INDEX_MAX_AGE seconds.
+#
+# A failed append may or may not have landed, so callers invalidate() the tab
+# and it is reloaded on the next write.
+#
+# The index is keyed by tab title and never talks to Sheets itself, so the
+# gspread loggers (ensure() loads through the worksheet) and the async REST
+# logger in asgi_app.py (fetches column C itself and calls load()) share it.
+
+import os
+import re
+import threading
+import time
+
+import metrics
+
+HANDLE_INDEX_MAX_AGE = float(os.getenv("HANDLE_INDEX_MAX_AGE", "3600"))
+
+_FIRST_ROW = re.compile(r"![A-Z]+(\d+)")
+
+
+def normalize_handle(handle):
+    return (handle or "").strip().lower()
+
+
+def first_row(response):
+    # Row number the values.append reply says our rows started at, or None
+    updated = (response or {}).get("updates", {}).get("updatedRange", "")
+    match = _FIRST_ROW.search(updated)
+    return int(match.group(1)) if match else None
+
+
+class TabIndex:
+    def __init__(self, handles, row_count):
+        self.handles = handles
+        self.row_count = row_count   # rows the tab should have, header included
+        self.last_row = row_count    # highest row an append has landed on
+        self.in_flight = 0
+        self.loaded_at = time.monotonic()
+        self.stale = False
+
+
+class HandleIndex:
+    def __init__(self, max_age=HANDLE_INDEX_MAX_AGE):
+        self.max_age = max_age
+        self.tabs = {}  # tab title -> TabIndex
+        self.lock = threading.Lock()
+
+    def needs_load(self, title):
+        tab = self.tabs.get(title)
+        return tab is None or tab.stale or time.monotonic() - tab.loaded_at > self.max_age
+
+    def load(self, title, column):
+        # `column` is column C as read from the sheet, header included, so
+        # its length is also the last used row
+        handles = {normalize_handle(h) for h in column[1:] if h}
+        with self.lock:
+            self.tabs[title] = TabIndex(handles, len(column))
+        metrics.inc("sheets.handle_index_loads")
+        print(f"📇 Indexed {len(handles)} handles in '{title}'")
+
+    def row_count(self, title):
+        # Rows the tab had at the last load/append, header included
+        with self.lock:
+            tab = self.tabs.get(title)
+            return tab.row_count if tab else 0
+
+    def ensure(self, sheet):
+        # gspread worksheets: (re)load column C only when needed
+        if self.needs_load(sheet.title):
+            self.load(sheet.title, sheet.col_values(3))
+
+    def claim_new(self, title, handle):
+        # True the first time `handle` is seen in this tab (the caller writes
+        # the section header); marks it as seen either way
+        key = normalize_handle(handle)
+        with self.lock:
+            tab = self.tabs.get(title)
+            if tab is None:
+                return True  # invalidated mid-request; a repeated header beats a lost turn
+            handles = tab.handles
+            if key in handles:
+                return False
+            handles.add(key)
+            return True
+
+    def appending(self, title):
+        # Call before each append to the tab, then appended() once it's done
+        with self.lock:
+            tab = self.tabs.get(title)
+            if tab:
+                tab.in_flight += 1
+
+    def appended(self, title, response, row_count):
+        # Record a successful append; `response` is the values.append reply
+        row = first_row(response)
+        with self.lock:
+            tab = self.tabs.get(title)
+            if tab is None:
+                return
+            tab.in_flight = max(tab.in_flight - 1, 0)
+            tab.row_count += row_count
+            if row is None:
+                tab.stale = True
+                return
+            tab.last_row = max(tab.last_row, row + row_count - 1)
+            if tab.last_row > tab.row_count or (not tab.in_flight and tab.last_row != tab.row_count):
+                print(f"🔄 '{title}' was edited outside the service, re-indexing handles")
+                metrics.inc("sheets.handle_index_resyncs")
+                tab.stale = True
+
+    def invalidate(self, title=None):
+        with self.lock:
+            if title is None:
+                self.tabs.clear()
+            else:
+                self.tabs.pop(title, None)
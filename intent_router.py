@@ -0,0 +1,325 @@
+# intent_router.py
+#
+# Answers the business-fact questions (hours, service area, booking link,
+# services offered) locally, in English or French, before app.py calls the
+# model. Everything else still goes to the model.
+#
+# A message is answered locally only when both of these agree:
+#   - a precompiled keyword automaton (one regex alternation, one named
+#     group per intent) finds exactly one intent, and no "needs a human /
+#     the model" cue such as a price question
+#   - a small multinomial Naive Bayes classifier, trained at import on the
+#     examples below, puts that intent above INTENT_THRESHOLD
+# Long messages (over INTENT_MAX_WORDS) usually carry details the model
+# should see, so they always fall through, and so do messages about a
+# service, a place or a day the router doesn't know (_unknown_subject): "do
+# you do pool cleaning?", "... in Toronto?" or "open on christmas?" must not
+# get a template (the services list and booking link, or our weekly hours).
+# Holidays are vetoed outright.
+#
+# Replies are templates over the fact table (business_facts()), which is
+# also what app.py's system prompt is built from, so the two never disagree.
+#
+# Metrics: intent.answered.<intent>, intent.fallback, intent.route (latency).
+#
+#   INTENT_FASTPATH     "on" (default) or "off"
+#   INTENT_THRESHOLD    min classifier probability (default 0.8)
+#   INTENT_MAX_WORDS    longer messages go to the model (default 20)
+#
+# benchmarks/eval_intents.py measures precision and the share of traffic
+# answered locally on a held-out set.
+
+import math
+import os
+import re
+from collections import Counter, defaultdict
+
+import metrics
+from reply_cache import normalize_text
+
+INTENT_FASTPATH = os.getenv("INTENT_FASTPATH", "on").lower()
+INTENT_THRESHOLD = float(os.getenv("INTENT_THRESHOLD", "0.8"))
+INTENT_MAX_WORDS = int(os.getenv("INTENT_MAX_WORDS", "20"))
+
+INTENTS = ("hours", "area", "booking", "services")
+
+# — facts and reply templates
+
+def business_facts(calendly_link):
+    return {
+        "services": {
+            "en": "landscaping, snow removal, garden design, hardscaping",
+            "fr": "l'aménagement paysager, le déneigement, la conception de jardins et l'aménagement de surfaces dures",
+        },
+        "area": {"en": "Montreal & Laval", "fr": "Montréal et Laval"},
+        "booking": {"en": calendly_link, "fr": calendly_link},
+        "hours": {"en": "Mon–Sat 8am–6pm", "fr": "du lundi au samedi, de 8 h à 18 h"},
+    }
+
+
+def facts_prompt(facts):
+    # The fact lines of app.py's system prompt
+    return (
+        f"\n- Services: {facts['services']['en']}"
+        f"\n- Area: {facts['area']['en']}"
+        f"\n- Booking: send this link if asked to book → {facts['booking']['en']}"
+        f"\n- Hours: {facts['hours']['en']}\n"
+    )
+
+
+TEMPLATES = {
+    "hours": {
+        "en": "We're open {hours}. How can we help?",
+        "fr": "Nous sommes ouverts {hours}. Comment pouvons-nous vous aider?",
+    },
+    "area": {
+        "en": "We serve {area}. How can we help?",
+        "fr": "Nous desservons {area}. Comment pouvons-nous vous aider?",
+    },
+    "booking": {
+        "en": "You can book a time with us here: {booking}",
+        "fr": "Vous pouvez prendre rendez-vous ici : {booking}",
+    },
+    "services": {
+        "en": "We offer {services}. Want to book a visit? {booking}",
+        "fr": "Nous offrons {services}. Voulez-vous prendre rendez-vous? {booking}",
+    },
+}
+
+# — keyword automaton (matched against normalize_text() output: lowercase, no accents)
+
+PATTERNS = {
+    "hours": [
+        r"hours?", r"open(ing)?", r"clos(e|ed|es|ing)", r"what time", r"when are you",
+        r"heures?", r"horaires?", r"ouvert(e|s)?", r"ouverture", r"ferme(z|s)?", r"fermeture",
+    ],
+    "area": [
+        r"service areas?", r"areas?", r"serve", r"cover", r"come to", r"located", r"location", r"where are you",
+        r"montreal", r"laval", r"mtl",
+        r"secteurs?", r"region", r"desserv\w*", r"servez", r"venez", r"ou etes vous", r"ville",
+    ],
+    "booking": [
+        r"book(ing)?", r"appointments?", r"schedule", r"reserve", r"consultation", r"calendly",
+        r"rendez vous", r"rdv", r"reserv\w*",
+    ],
+    "services": [
+        r"services?", r"do you do", r"do you offer", r"offer", r"landscap\w*", r"snow", r"plow\w*",
+        r"garden\w*", r"hardscap\w*", r"lawn",
+        r"offrez", r"faites vous", r"amenagement", r"paysag\w*", r"deneig\w*", r"jardin\w*", r"pelouse",
+    ],
+}
+
+# Cues that the customer needs specifics only the model (or a person) can give
+VETO = [
+    r"how much", r"price", r"prices", r"pricing", r"cost", r"quote", r"estimate", r"\$",
+    r"combien", r"prix", r"tarifs?", r"cout\w*", r"soumission", r"estimation", r"devis",
+    r"cancel", r"annuler", r"complain\w*", r"plainte", r"refund", r"rembours\w*", r"damage\w*",
+    r"dommage\w*", r"emergency", r"urgence", r"not happy", r"pas content\w*",
+    # Holidays: the hours template would make up an answer for them
+    r"holidays?", r"stat", r"christmas", r"xmas", r"new years?", r"thanksgiving", r"easter",
+    r"good friday", r"halloween", r"boxing day", r"labou?r day", r"victoria day", r"canada day",
+    r"long weekend", r"noel", r"jour de l an", r"paques", r"action de graces?", r"st jean",
+    r"saint jean", r"feri\w*", r"conges?", r"fetes?",
+]
+
+# Things we know how to answer about. A service question about anything else
+# ("do you do pool cleaning?") or a question naming a place we don't know
+# ("... in Toronto?") goes to the model: the templates would otherwise tell
+# the customer we offer it there and send the booking link.
+SERVICE_WORDS = {
+    "service", "services", "work", "landscaping", "landscape", "snow", "removal", "plow", "plowing",
+    "driveway", "driveways", "garden", "gardens", "design", "hardscaping", "hardscape", "interlock",
+    "patio", "patios", "walkway", "walkways", "lawn", "lawns", "care", "mowing", "mow",
+    "deneigement", "entree", "entrees", "amenagement", "paysager", "paysagement", "conception",
+    "jardin", "jardins", "pelouse", "tonte", "surfaces", "dures",
+}
+FILLER_WORDS = {
+    "a", "an", "the", "any", "some", "you", "guys", "also", "your", "what", "kind", "of", "that",
+    "du", "de", "des", "la", "le", "les", "l", "d", "quoi",
+}
+SERVED_PLACES = {
+    "montreal", "mtl", "laval", "west", "island", "north", "south", "shore", "nord", "sud", "rive",
+    "area", "areas", "region", "city", "ville", "secteur", "neighborhood", "quartier",
+}
+KNOWN_WORDS = {
+    "monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday",
+    "lundi", "mardi", "mercredi", "jeudi", "vendredi", "samedi", "dimanche",
+    "today", "tonight", "tomorrow", "morning", "afternoon", "evening", "weekend",
+    "week", "month", "year", "season", "winter", "spring", "summer", "fall", "autumn",
+    "semaine", "mois", "annee", "saison", "hiver", "printemps", "ete", "automne", "matin", "soir",
+}
+KNOWN_WORDS |= {f"{word}s" for word in KNOWN_WORDS}
+# "do you do X", "offer X", "faites-vous X": X must be all SERVICE_WORDS
+_SERVICE_OBJECT = re.compile(
+    r"\b(?:do you (?:guys )?(?:do|offer|provide)|offer|offrez vous|faites vous|vous faites)\b((?: \w+)*)"
+)
+_OBJECT_END = {"in", "at", "for", "on", "near", "around", "this", "next", "and", "or",
+               "dans", "a", "pour", "en", "cet", "cette", "ce", "et", "ou"}
+# The word after these names a place (articles and possessives skipped)
+_PLACE_PREPOSITIONS = {"in", "to", "near", "around", "dans", "pres", "vers"}
+# ... and after these a day: "on christmas", "this 24th" aren't weekdays
+_DATE_PREPOSITIONS = {"on", "this", "next", "over", "during", "pendant", "ce", "cette"}
+_ARTICLES = {"the", "my", "your", "our", "la", "le", "les", "l", "ma", "mon", "votre"}
+
+_AUTOMATON = re.compile("|".join(
+    rf"(?P<{intent}>\b(?:{'|'.join(patterns)})\b)" for intent, patterns in PATTERNS.items()
+))
+_VETO = re.compile(rf"\b(?:{'|'.join(VETO)})\b|\$")
+
+# — language
+
+_FRENCH = {
+    "vous", "vos", "votre", "etes", "est", "quelles", "quelle", "quels", "quel", "je", "nous",
+    "bonjour", "salut", "merci", "les", "des", "une", "pour", "avec", "faites", "pouvez", "ou",
+    "quand", "heures", "horaires", "ouvert", "rendez", "offrez", "desservez", "servez", "le", "la",
+}
+_ENGLISH = {
+    "you", "your", "are", "what", "do", "the", "is", "i", "we", "hello", "hi", "thanks", "when",
+    "where", "can", "how", "for", "with", "open", "book", "hours",
+}
+
+
+def detect_language(words):
+    french = sum(w in _FRENCH for w in words)
+    english = sum(w in _ENGLISH for w in words)
+    return "fr" if french > english else "en"
+
+# — classifier
+
+TRAINING = {
+    "hours": [
+        "what are your hours", "what time do you open", "when do you close", "are you open today",
+        "are you open on saturday", "are you open sunday", "what time do you close tonight",
+        "hours of operation", "when are you open", "opening hours", "open tomorrow",
+        "what are your business hours", "till what time are you open",
+        "quelles sont vos heures", "quelles sont vos heures d ouverture", "etes vous ouvert samedi",
+        "a quelle heure fermez vous", "vous ouvrez a quelle heure", "horaires", "etes vous ouverts aujourd hui",
+        "vos horaires s il vous plait", "heures d ouverture",
+    ],
+    "area": [
+        "what area do you serve", "do you serve laval", "do you cover montreal", "do you come to my area",
+        "where are you located", "do you service the west island", "which cities do you cover",
+        "is laval in your area", "do you go to the south shore", "service area",
+        "quel secteur desservez vous", "desservez vous laval", "venez vous a montreal", "ou etes vous situes",
+        "vous servez quelle region", "est ce que vous venez sur la rive sud", "quelles villes desservez vous",
+    ],
+    "booking": [
+        "can i book an appointment", "how do i book", "i want to schedule a visit", "book a consultation",
+        "can i make a reservation", "i d like to book", "send me the booking link", "schedule an appointment",
+        "how can i set up an appointment", "i want to book a time",
+        "je veux prendre rendez vous", "comment reserver", "prendre un rdv", "je voudrais reserver",
+        "envoyez moi le lien pour reserver", "puis je prendre rendez vous",
+    ],
+    "services": [
+        "what services do you offer", "do you do snow removal", "do you do landscaping", "what do you do",
+        "do you offer garden design", "do you do hardscaping", "do you mow lawns", "what kind of work do you do",
+        "do you plow driveways", "list of services", "do you do interlock",
+        "quels services offrez vous", "faites vous du deneigement", "faites vous de l amenagement paysager",
+        "vous faites quoi", "offrez vous la conception de jardins", "faites vous le deneigement des entrees",
+    ],
+    "other": [
+        "how much for snow removal", "what are your prices", "can you give me a quote", "i have a question",
+        "my driveway was not cleared", "i want to cancel my appointment", "can you come today at 3",
+        "is the crew coming tomorrow", "thanks", "ok great", "hello", "hi there", "who is this",
+        "i need help with my yard it is a mess", "do you take credit cards", "are you hiring",
+        "can i pay by etransfer", "my neighbor recommended you", "yes please", "no thanks",
+        "combien pour le deneigement", "quel est le prix", "merci", "bonjour", "j ai une question",
+        "mon entree n a pas ete deneigee", "je veux annuler", "acceptez vous les cartes de credit",
+        "est ce que vous embauchez", "oui svp",
+    ],
+}
+
+
+def _features(words):
+    return words + [f"{a}_{b}" for a, b in zip(words, words[1:])]
+
+
+class NaiveBayes:
+    def __init__(self, examples):
+        self.classes = list(examples)
+        counts = {c: Counter() for c in self.classes}
+        for label, texts in examples.items():
+            for text in texts:
+                counts[label].update(_features(normalize_text(text).split()))
+        vocab = set().union(*counts.values())
+        total_docs = sum(len(t) for t in examples.values())
+        self.prior = {c: math.log(len(examples[c]) / total_docs) for c in self.classes}
+        self.loglik = defaultdict(dict)
+        self.unseen = {}
+        for c in self.classes:
+            denominator = sum(counts[c].values()) + len(vocab)
+            self.unseen[c] = math.log(1 / denominator)
+            for feature, n in counts[c].items():
+                self.loglik[feature][c] = math.log((n + 1) / denominator)
+        self.vocab = vocab
+
+    def probabilities(self, words):
+        scores = dict(self.prior)
+        for feature in _features(words):
+            if feature not in self.vocab:
+                continue  # unknown words carry no evidence either way
+            row = self.loglik[feature]
+            for c in self.classes:
+                scores[c] += row.get(c, self.unseen[c])
+        top = max(scores.values())
+        exp = {c: math.exp(s - top) for c, s in scores.items()}
+        total = sum(exp.values())
+        return {c: v / total for c, v in exp.items()}
+
+
+_CLASSIFIER = NaiveBayes(TRAINING)
+_KNOWN = _CLASSIFIER.vocab | SERVED_PLACES | KNOWN_WORDS | SERVICE_WORDS
+
+# — routing
+
+
+def classify(message):
+    # (intent or None, language, classifier probability); intent is None
+    # whenever the message should go to the model
+    normalized = normalize_text(message)
+    words = normalized.split()
+    language = detect_language(words)
+    if not words or len(words) > INTENT_MAX_WORDS or _VETO.search(normalized):
+        return None, language, 0.0
+    matched = {m.lastgroup for m in _AUTOMATON.finditer(normalized)}
+    if len(matched) != 1:
+        return None, language, 0.0
+    intent = matched.pop()
+    if _unknown_subject(message, words):
+        return None, language, 0.0
+    probability = _CLASSIFIER.probabilities(words)[intent]
+    if probability < INTENT_THRESHOLD:
+        return None, language, probability
+    return intent, language, probability
+
+
+def _unknown_subject(message, words):
+    # True if `message` asks about a service, or names a place or a day, we don't know
+    # Capitalized words after the first: a place or a name ("in Ottawa", "Hi Bob")
+    for token in re.findall(r"\w+", message)[1:]:
+        if token[:1].isupper() and token != "I" and normalize_text(token) not in _KNOWN:
+            return True
+    for i, word in enumerate(words):
+        if word in _PLACE_PREPOSITIONS or word in _DATE_PREPOSITIONS:
+            rest = [w for w in words[i + 1:] if w not in _ARTICLES]
+            if rest and rest[0] not in _KNOWN and rest[0] not in _PLACE_PREPOSITIONS:
+                return True
+    for match in _SERVICE_OBJECT.finditer(" ".join(words)):
+        for word in match.group(1).split():
+            if word in _OBJECT_END:
+                break
+            if word not in SERVICE_WORDS and word not in FILLER_WORDS:
+                return True
+    return False
+
+
+def answer(message, facts):
+    # Templated reply if `message` is a plain fact question, else None
+    with metrics.timer("intent.route"):
+        intent, language, _ = classify(message)
+    if intent is None:
+        metrics.inc("intent.fallback")
+        return None
+    metrics.inc(f"intent.answered.{intent}")
+    values = {key: value[language] for key, value in facts.items()}
+    return TEMPLATES[intent][language].format(**values)
@@ -0,0 +1,294 @@
+# log_sinks.py
+#
+# Where conversation turns are recorded. log_to_sheet hands each user/AI
+# turn to a TurnLog, which passes it to every configured sink:
+#
+#   sqlite    SQLiteSink: every turn in a local SQLite database, written
+#             synchronously (sub-millisecond); the system of record
+#   sheets    the app's Google Sheets writer (sheet_log_writer.py /
+#             transcript_log.py): a human-readable view, journaled and
+#             written in the background, optional
+#   archive   ArchiveSink: compressed Parquet files partitioned by month
+#             (month=2026-10/part-*.parquet), cheap to keep forever and fast
+#             to scan with pyarrow/pandas/duckdb; needs pyarrow
+#
+# BatchSink is the shared machinery for sinks that write in the background:
+# turns go into a turn journal (turn_journal.py) of their own, and a writer
+# thread drains it in month-sized batches, retrying failures and only
+# acknowledging a batch once it has been written.
+#
+#   LOG_SINKS               comma-separated (default "sqlite,sheets")
+#   LOG_DB_PATH             SQLite file (default conversations.db)
+#   LOG_ARCHIVE_DIR         archive root (default conversation_archive)
+#   ARCHIVE_FLUSH_SECONDS   how often the archive writes a part file (default 300)
+#   ARCHIVE_BATCH_SIZE      max turns per part file (default 10000)
+
+import atexit
+import os
+import random
+import threading
+import time
+import uuid
+from datetime import datetime
+
+import metrics
+from sheets_session import month_tab_name
+from sqlite_db import per_thread_connection
+from turn_journal import make_turn_queue
+
+LOG_SINKS = [s.strip() for s in os.getenv("LOG_SINKS", "sqlite,sheets").lower().split(",") if s.strip()]
+LOG_DB_PATH = os.getenv("LOG_DB_PATH", "conversations.db")
+LOG_ARCHIVE_DIR = os.getenv("LOG_ARCHIVE_DIR", "conversation_archive")
+ARCHIVE_FLUSH_SECONDS = float(os.getenv("ARCHIVE_FLUSH_SECONDS", "300"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "10000"))
+
+MAX_RETRIES = 5
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 32.0
+
+
+def make_turn(platform, handle, user_msg, ai_reply):
+    # (month tab, timestamp, platform, handle, user msg, AI reply, turn id);
+    # the id lets sinks that can store it make replays idempotent
+    now = datetime.now()
+    return (month_tab_name(now), now.strftime("%Y-%m-%d %H:%M"), platform, handle,
+            user_msg, ai_reply, uuid.uuid4().hex)
+
+
+def _turn_id(turn):
+    # Turns journaled before ids existed get a stable stand-in
+    return turn[6] if len(turn) > 6 else uuid.uuid5(uuid.NAMESPACE_OID, repr(turn[:6])).hex
+
+
+class BatchSink:
+    name = "sink"
+    label = "log sink"  # for error messages
+
+    def __init__(self, queue=None, flush_interval=2.0, batch_size=100):
+        self.queue = queue if queue is not None else make_turn_queue(self.name)
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.cond = threading.Condition()
+        self.running = False
+        self.thread = None
+        # Turns left over from a previous run may already have been written
+        self.recovering = len(self.queue) > 0
+        metrics.set_gauge(f"{self.name}.buffer_depth", lambda: len(self.queue))
+
+    def start(self):
+        if self.thread is None:
+            self.running = True
+            self.thread = threading.Thread(target=self._run, name=f"{self.name}-writer", daemon=True)
+            self.thread.start()
+            atexit.register(self.stop)
+        return self
+
+    def put(self, turn):
+        self.queue.put(turn)
+        if len(self.queue) >= self.batch_size:
+            with self.cond:
+                self.cond.notify()
+
+    def log_turn(self, platform, handle, user_msg, ai_reply):
+        self.put(make_turn(platform, handle, user_msg, ai_reply))
+
+    def _run(self):
+        while True:
+            with self.cond:
+                if self.running and len(self.queue) < self.batch_size:
+                    self.cond.wait(self.flush_interval)
+                stopping = not self.running
+            flushed = self.flush()
+            if stopping:
+                return
+            if not flushed:
+                time.sleep(self.flush_interval)  # destination is down; don't spin
+
+    def _take_batch(self):
+        # Oldest turns first, all from the same month
+        batch = self.queue.peek(self.batch_size)
+        month = batch[0][0]
+        for i, turn in enumerate(batch):
+            if turn[0] != month:
+                return month, batch[:i]
+        return month, batch
+
+    # — hooks for subclasses
+
+    def _write(self, month, batch):
+        # Write one batch; returns the number of rows written. While
+        # self.recovering the batch may already be (partly) there.
+        raise NotImplementedError
+
+    def _retryable(self, error):
+        return False
+
+    def _failed(self, month):
+        # A write failed and may or may not have landed
+        pass
+
+    def _gave_up(self):
+        # Retries exhausted; the batch stays queued for the next flush
+        pass
+
+    def flush(self):
+        # Write everything currently queued; returns when done or when a
+        # batch fails for good (it stays queued for the next attempt)
+        while len(self.queue):
+            month, batch = self._take_batch()
+            start = time.perf_counter()
+            delay = RETRY_BASE_DELAY
+            for attempt in range(MAX_RETRIES + 1):
+                try:
+                    rows = self._write(month, batch)
+                    break
+                except Exception as e:
+                    self._failed(month)
+                    self.recovering = True
+                    if attempt < MAX_RETRIES and self._retryable(e):
+                        metrics.inc(f"{self.name}.flush_retries")
+                        print(f"⏳ {self.label} busy ({e}), retrying in {delay:.1f}s")
+                        time.sleep(delay + random.uniform(0, delay / 2))
+                        delay = min(delay * 2, RETRY_MAX_DELAY)
+                        continue
+                    print(f"❌ Error logging to {self.label}:", e)
+                    self._gave_up()
+                    return False
+
+            if self.recovering:
+                metrics.inc(f"{self.name}.turns_replayed", len(batch))
+                self.recovering = False
+            self.queue.ack(batch)
+            metrics.observe(f"{self.name}.flush", time.perf_counter() - start)
+            metrics.inc(f"{self.name}.rows_flushed", rows)
+            print(f"✏️ Logged {len(batch)} turns ({rows} rows) to {self.label} '{month}'")
+        return True
+
+    def stop(self):
+        # Flush what's left before the process exits
+        if not self.running:
+            return
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+        self.thread.join(timeout=30)
+        self.queue.close()
+
+
+class SQLiteSink:
+    name = "sqlite"
+
+    def __init__(self, path=LOG_DB_PATH):
+        self.path = path
+        self._db = per_thread_connection(path)
+        db = self._db()
+        db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS turns (
+                id          TEXT PRIMARY KEY,
+                month       TEXT NOT NULL,
+                logged_at   TEXT NOT NULL,
+                platform    TEXT,
+                handle      TEXT,
+                user_msg    TEXT,
+                ai_reply    TEXT
+            )
+            """
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS turns_by_handle ON turns (handle, logged_at)")
+        db.execute("CREATE INDEX IF NOT EXISTS turns_by_month ON turns (month)")
+
+    def put(self, turn):
+        _, now, platform, handle, user_msg, ai_reply = turn[:6]
+        with metrics.timer("sqlite.put"):
+            self._db().execute(
+                "INSERT OR IGNORE INTO turns (id, month, logged_at, platform, handle, user_msg, ai_reply) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (_turn_id(turn), now[:7], now, platform, handle, user_msg, ai_reply),
+            )
+
+    def history(self, handle, limit=50):
+        # Most recent turns with `handle`, oldest first
+        rows = self._db().execute(
+            "SELECT logged_at, platform, user_msg, ai_reply FROM turns WHERE handle = ? "
+            "ORDER BY logged_at DESC, rowid DESC LIMIT ?",
+            (handle, limit),
+        ).fetchall()
+        return rows[::-1]
+
+    def close(self):
+        pass
+
+
+class ArchiveSink(BatchSink):
+    name = "archive"
+    label = "archive"
+
+    def __init__(self, root=LOG_ARCHIVE_DIR, queue=None, flush_interval=ARCHIVE_FLUSH_SECONDS,
+                 batch_size=ARCHIVE_BATCH_SIZE):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("the archive log sink needs pyarrow (pip install pyarrow)")
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.root = root
+        super().__init__(queue, flush_interval, batch_size)
+
+    def _write(self, month, batch):
+        # One Parquet file per batch, named after its first turn, so writing
+        # a replayed batch again replaces the file instead of duplicating it
+        columns = {"id": [], "logged_at": [], "platform": [], "handle": [], "user_msg": [], "ai_reply": []}
+        for turn in batch:
+            _, now, platform, handle, user_msg, ai_reply = turn[:6]
+            for key, value in zip(columns, (_turn_id(turn), now, platform, handle, user_msg, ai_reply)):
+                columns[key].append(value)
+        table = self.pa.table({key: self.pa.array(values, self.pa.string()) for key, values in columns.items()})
+
+        directory = os.path.join(self.root, f"month={batch[0][1][:7]}")
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"part-{_turn_id(batch[0])}.parquet")
+        self.pq.write_table(table, path + ".tmp", compression="zstd")
+        os.replace(path + ".tmp", path)
+        return len(batch)
+
+    def dataset(self):
+        # The whole archive as a pyarrow dataset, e.g.
+        #   sink.dataset().to_table(filter=pc.field("month") == "2026-10")
+        import pyarrow.dataset
+        return pyarrow.dataset.dataset(self.root, format="parquet", partitioning="hive")
+
+
+class TurnLog:
+    def __init__(self, sinks):
+        self.sinks = sinks
+
+    def log_turn(self, platform, handle, user_msg, ai_reply):
+        # Never raises: one sink failing doesn't stop the others or the reply
+        turn = make_turn(platform, handle, user_msg, ai_reply)
+        for sink in self.sinks:
+            try:
+                sink.put(turn)
+            except Exception as e:
+                metrics.inc(f"{sink.name}.put_errors")
+                print(f"❌ Error logging to {sink.name}:", e)
+
+
+def make_turn_log(sheets=None, sinks=LOG_SINKS):
+    # `sheets` builds the app's Sheets writer; it is only called (and its
+    # journal/thread only started) when "sheets" is one of the sinks
+    built = []
+    for name in sinks:
+        if name == "sqlite":
+            built.append(SQLiteSink())
+        elif name == "sheets" and sheets is not None:
+            built.append(sheets())
+        elif name == "archive":
+            try:
+                built.append(ArchiveSink().start())
+            except RuntimeError as e:
+                print(f"⚠️ Skipping archive log sink: {e}")
+        elif name != "sheets":
+            print(f"⚠️ Unknown log sink '{name}'")
+    return TurnLog(built)
@@ -0,0 +1,251 @@
+# messaging.py
+#
+# One inbound-text pipeline for every carrier. The Twilio apps (/sms-reply:
+# form-encoded, answered with TwiML) and the Telnyx ones (/sms-handler: JSON
+# events, answered by sending a text) each had their own copy of the reply
+# loop, the coordinator and worker-pool plumbing and the logging. Now a thin
+# provider adapter turns the webhook into an InboundText and the outcome back
+# into a webhook response, and MessagePipeline does the rest:
+#
+#   normalize   adapter.parse(form, payload): an InboundText, or the response
+#               for an event we don't answer (no raw body / header dumps)
+#   dedup       webhook_dedup.py, in front of every route (dedup_webhooks)
+#   generate    run_coordinator.py (texts in quick succession get one run),
+#               then the app's answer(number, text): thread lookup + model
+#   dispatch    in the webhook response where the carrier allows it (Twilio,
+#               REPLY_MODE=sync), otherwise through the SMS dispatcher
+#   log         every turn to the log sinks (log_sinks.py)
+#
+# With REPLY_MODE=async every carrier's webhook is acknowledged at once and a
+# ReplyWorkerPool generates the reply and texts it back. One pipeline can
+# serve several carriers from the same process: route() each adapter.
+#
+# Metrics: messages.<carrier> (texts taken in), messages.ignored (events we
+# don't answer, e.g. Telnyx delivery receipts).
+#
+#   pipeline = MessagePipeline(answer, outbox, turn_log, coordinator=RunCoordinator())
+#   pipeline.route(app, TwilioAdapter(TWILIO_NUMBER, twiml))   # POST /sms-reply
+#   pipeline.route(app, TelnyxAdapter(TELNYX_NUMBER))          # POST /sms-handler
+
+import os
+import time
+
+import admission
+import metrics
+import resilience
+from reply_workers import REPLY_MODE, ReplyWorkerPool
+from run_completion import reply_for_number
+from run_coordinator import combine_messages
+
+ERROR_REPLY = "Sorry, something went wrong. We'll get back to you shortly."
+BUSY_REPLY = "Thanks for your message! We're busy right now but will get back to you shortly."
+
+XML = {"Content-Type": "application/xml; charset=utf-8"}
+OK = ("OK", 200)
+
+
+class InboundText:
+    __slots__ = ("provider", "from_number", "text")
+
+    def __init__(self, provider, from_number, text):
+        self.provider = provider
+        self.from_number = from_number
+        self.text = text
+
+
+# — provider adapters: parse(form, payload), reply(text), ack()
+
+class TwilioAdapter:
+    name = "twilio"
+    path = "/sms-reply"
+    endpoint = "sms_reply"
+    replies_inline = True  # the reply can go back as TwiML in the webhook response
+
+    def __init__(self, number, twiml):
+        self.number = number
+        self.twiml = twiml
+
+    def parse(self, form, payload=None):
+        text = form.get("Body", "").strip()
+        if not text:
+            return self.twiml.not_understood(), 200, XML
+        return InboundText(self.name, form.get("From", "").strip(), text)
+
+    def reply(self, text):
+        return self.twiml.message(text), 200, XML
+
+    def ack(self):
+        # No message now (the reply follows by text, or another text's reply covers it)
+        return self.twiml.empty(), 200, XML
+
+
+class TelnyxAdapter:
+    name = "telnyx"
+    path = "/sms-handler"
+    endpoint = "sms_handler"
+    replies_inline = False  # Telnyx replies are always sent through the API
+
+    def __init__(self, number):
+        self.number = number
+
+    def parse(self, form, payload):
+        if not isinstance(payload, dict):
+            return "Bad JSON", 400
+        event = payload.get("data") or {}
+        if event.get("event_type") != "message.received":
+            return OK
+        message = event.get("payload") or {}
+        if message.get("direction") != "inbound":
+            return OK
+        text = message.get("text")
+        from_number = (message.get("from") or {}).get("phone_number")
+        if not text or not from_number:
+            return "Missing data", 400
+        return InboundText(self.name, from_number, text)
+
+    def reply(self, text):
+        return OK
+
+    def ack(self):
+        return OK
+
+
+class MessagePipeline:
+    def __init__(self, answer, outbox, turn_log=None, coordinator=None, reply_mode=REPLY_MODE):
+        self.answer = answer            # (number, text) -> reply: thread lookup + model
+        self.outbox = outbox
+        self.turn_log = turn_log
+        self.coordinator = coordinator  # None: every text gets its own run
+        self.workers = ReplyWorkerPool(self._reply_later).start() if reply_mode == "async" else None
+
+    def handle(self, adapter, form, payload=None):
+        # One webhook in, its response out
+        inbound = adapter.parse(form, payload)
+        if not isinstance(inbound, InboundText):
+            metrics.inc("messages.ignored")
+            return inbound
+        metrics.inc(f"messages.{adapter.name}")
+
+        if self.workers:
+            if self.workers.submit(adapter, inbound):
+                return adapter.ack()
+            return self._deliver(adapter, inbound, BUSY_REPLY)
+        reply = self.generate(adapter, inbound)
+        if reply is None:
+            return adapter.ack()
+        return self._deliver(adapter, inbound, reply)
+
+    def generate(self, adapter, inbound):
+        # The reply, or None when a newer text from the same caller will be
+        # answered together with this one, or the reply will be texted once
+        # the caller's run in flight is done (run_coordinator.py)
+        if self.coordinator is None:
+            return self._answer(inbound.from_number, [inbound.text])
+        return self.coordinator.submit(inbound.from_number, inbound.text,
+                                       lambda messages: self._answer(inbound.from_number, messages),
+                                       deliver=lambda reply: self.send(adapter, inbound.from_number, reply))
+
+    def _answer(self, from_number, messages):
+        # One run answering every text in `messages`
+        text = combine_messages(messages)
+        try:
+            reply = self.answer(from_number, text)
+            if self.turn_log:
+                # Recorded by every log sink (log_sinks.py); never blocks or fails the reply
+                self.turn_log.log_turn("SMS", from_number, text, reply)
+        except Exception as e:
+            print("❌ OpenAI error:", e)
+            reply = ERROR_REPLY
+        return reply
+
+    def _deliver(self, adapter, inbound, reply):
+        if adapter.replies_inline:
+            return adapter.reply(reply)
+        self.send(adapter, inbound.from_number, reply)
+        return adapter.ack()
+
+    def send(self, adapter, to, text):
+        if not adapter.number:
+            print(f"❌ Missing {adapter.name} number")
+            return False
+        return self.outbox.send(adapter.name, adapter.number, to, text)
+
+    def _reply_later(self, adapter, inbound):
+        # REPLY_MODE=async: generate in the background and text the reply back
+        reply = self.generate(adapter, inbound)
+        if reply is not None:
+            self.send(adapter, inbound.from_number, reply)
+
+    def route(self, app, adapter):
+        # POST adapter.path on a Flask app
+        from flask import request
+
+        def webhook():
+            payload = None if request.form else request.get_json(force=True, silent=True)
+            return self.handle(adapter, request.form, payload)
+
+        app.add_url_rule(adapter.path, adapter.endpoint, webhook, methods=["POST"])
+        return adapter
+
+
+def assistant_answer(client, assistant_id, thread_store, thread_pool=None, **run_kwargs):
+    # answer(number, text) for the Assistants apps: the caller's thread
+    def answer(from_number, text):
+        # Message + run in one request (create_and_run for a first-time caller)
+        return reply_for_number(client, thread_store, from_number, assistant_id, text,
+                                pool=thread_pool, **run_kwargs)
+    return answer
+
+
+def completion_answer(client, model="gpt-3.5-turbo"):
+    # answer(number, text) from one chat completion over the business facts
+    # (app.py): plain fact questions are answered locally, repeat questions
+    # from the reply cache, and neither needs the model
+    import intent_router
+    from reply_cache import make_reply_cache
+
+    reply_cache = make_reply_cache()
+    fastpath = intent_router.INTENT_FASTPATH != "off"
+    calendly_link = os.getenv("CALENDLY_LINK") or "https://calendly.com/caleb-yohannes2003"
+
+    def answer(from_number, user_msg):
+        facts = intent_router.business_facts(calendly_link)
+        business_facts = intent_router.facts_prompt(facts)
+        if fastpath:
+            reply = intent_router.answer(user_msg, facts)
+            if reply:
+                print("⚡ Reply answered locally")
+                return reply
+        if reply_cache:
+            reply_cache.set_facts(business_facts)
+            reply = reply_cache.get(user_msg)
+            if reply:
+                print("⚡ Reply served from cache")
+                return reply
+
+        system_msg = f"""
+You are an assistant for a blue-collar business. Use the info below to answer questions.{business_facts}
+
+Customer says: '{user_msg}'
+"""
+
+        def complete():
+            start = time.perf_counter()
+            completion = resilience.for_deadline(client).chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": system_msg},
+                    {"role": "user", "content": user_msg},
+                ],
+                timeout=resilience.timeout_for(resilience.OPENAI_TIMEOUT),
+            )
+            return completion, time.perf_counter() - start
+
+        # Waits for OpenAI capacity (admission.py) rather than failing with a 429
+        completion, model_seconds = resilience.breaker("openai").call(lambda: admission.call(complete))
+        reply = completion.choices[0].message.content.strip()
+        metrics.observe("openai.completion", model_seconds)
+        if reply_cache:
+            reply_cache.put(user_msg, reply, model_seconds)
+        return reply
+    return answer
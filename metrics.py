@@ -0,0 +1,78 @@
+# metrics.py
+#
+# Minimal in-process metrics registry: counters, gauges and timing
+# summaries. Apps expose snapshot() as JSON on /metrics.
+
+import threading
+import time
+from collections import defaultdict, deque
+
+TIMING_WINDOW = 1024  # most recent samples kept per timing
+
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_gauges = {}
+_timings = defaultdict(lambda: deque(maxlen=TIMING_WINDOW))
+
+
+def inc(name, amount=1):
+    with _lock:
+        _counters[name] += amount
+
+
+def set_gauge(name, value):
+    # `value` may be a number or a zero-argument callable read at snapshot time
+    with _lock:
+        _gauges[name] = value
+
+
+def observe(name, seconds):
+    with _lock:
+        _timings[name].append(seconds)
+
+
+class timer:
+    # with metrics.timer("openai.reply"): ...
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+        observe(self.name, self.elapsed)
+
+
+def reset():
+    # Forget everything recorded so far (benchmarks measure one mode at a time)
+    with _lock:
+        _counters.clear()
+        _timings.clear()
+
+
+def _summary(samples):
+    ordered = sorted(samples)
+    count = len(ordered)
+    return {
+        "count": count,
+        "mean": sum(ordered) / count,
+        "p50": ordered[int(0.50 * (count - 1))],
+        "p95": ordered[int(0.95 * (count - 1))],
+        "p99": ordered[int(0.99 * (count - 1))],
+        "max": ordered[-1],
+    }
+
+
+def snapshot():
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+        timings = {name: list(samples) for name, samples in _timings.items() if samples}
+
+    return {
+        "counters": counters,
+        "gauges": {name: (value() if callable(value) else value) for name, value in gauges.items()},
+        "timings": {name: _summary(samples) for name, samples in timings.items()},
+    }
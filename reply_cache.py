@@ -0,0 +1,248 @@
+# reply_cache.py
+#
+# Cache of model replies for the stateless chat-completions handler (app.py),
+# where the reply depends only on the customer's message and the business
+# facts in the system prompt. Most texts are the same few questions (hours,
+# area, booking, services), so most of them don't need a fresh completion.
+#
+# Two tiers:
+#   - exact: keyed on the normalized message (case, accents, punctuation and
+#     spacing ignored), an O(1) dict lookup
+#   - semantic (opt-in, needs numpy): each cached question is also stored
+#     as a vector (hashed word and character n-grams, computed locally: no
+#     embedding API call) in one matrix; a miss on the exact tier is looked up
+#     with a single matrix-vector product and served if the cosine similarity
+#     is at least REPLY_CACHE_THRESHOLD and both questions have the same
+#     anchors (numbers, places, weekdays, months, negations; anchors())
+#
+# The vectors measure shared spelling, not meaning: "Laval" / "Ottawa",
+# "Monday" / "Sunday" and "not happy" / "very happy" all score above 0.9.
+# The anchor check is what keeps a "yes, we serve you" or booking reply from
+# going to a different city, day or a negated question, and the tier is off
+# unless REPLY_CACHE_SEMANTIC=on. benchmarks/eval_reply_cache.py must report
+# 0 false hits on its near-miss pairs.
+#
+# Entries expire after REPLY_CACHE_TTL seconds and the least recently used
+# are evicted beyond REPLY_CACHE_SIZE. The cache remembers a fingerprint of
+# the business facts and empties itself whenever they change.
+#
+# Metrics: reply_cache.hits.exact, reply_cache.hits.semantic,
+# reply_cache.misses, reply_cache.anchor_mismatches (semantic near misses
+# refused), reply_cache.hit_rate (gauge), reply_cache.seconds_saved
+# (model time not spent), reply_cache.lookup (latency).
+#
+#   REPLY_CACHE             "on" (default) or "off"
+#   REPLY_CACHE_SIZE        max cached questions (default 1000)
+#   REPLY_CACHE_TTL         seconds (default 86400)
+#   REPLY_CACHE_SEMANTIC    "on" (needs numpy) or "off" (default)
+#   REPLY_CACHE_THRESHOLD   min cosine similarity for a semantic hit (default 0.9)
+
+import hashlib
+import os
+import re
+import threading
+import time
+import unicodedata
+import zlib
+from collections import OrderedDict
+
+import metrics
+
+numpy = None  # imported when the first semantic cache is built; the tier is optional
+
+REPLY_CACHE = os.getenv("REPLY_CACHE", "on").lower()
+REPLY_CACHE_SIZE = int(os.getenv("REPLY_CACHE_SIZE", "1000"))
+REPLY_CACHE_TTL = float(os.getenv("REPLY_CACHE_TTL", "86400"))
+REPLY_CACHE_SEMANTIC = os.getenv("REPLY_CACHE_SEMANTIC", "off").lower()
+REPLY_CACHE_THRESHOLD = float(os.getenv("REPLY_CACHE_THRESHOLD", "0.9"))
+
+VECTOR_DIM = 1024
+
+# Words that change the answer however close the rest of the question is
+# (matched against normalize_text() output, English and French)
+WEEKDAYS = {
+    "monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday",
+    "lundi", "mardi", "mercredi", "jeudi", "vendredi", "samedi", "dimanche",
+    "today", "tonight", "tomorrow", "weekend", "aujourd", "demain", "fin",
+}
+MONTHS = {
+    "january", "february", "march", "april", "may", "june", "july", "august", "september",
+    "october", "november", "december", "janvier", "fevrier", "mars", "avril", "mai", "juin",
+    "juillet", "aout", "septembre", "octobre", "novembre", "decembre",
+}
+NEGATIONS = {
+    "no", "not", "never", "none", "nothing", "nobody", "without", "cannot", "cant", "dont",
+    "doesnt", "didnt", "isnt", "arent", "wasnt", "wont", "t",  # "don't" normalizes to "don t"
+    "ne", "pas", "jamais", "aucun", "aucune", "sans", "rien", "personne",
+}
+PLACES = {
+    "montreal", "mtl", "laval", "longueuil", "brossard", "boucherville", "terrebonne", "repentigny",
+    "blainville", "mirabel", "gatineau", "quebec", "sherbrooke", "ottawa", "toronto", "vancouver",
+    "calgary", "verdun", "lachine", "lasalle", "outremont", "westmount", "anjou", "dorval",
+    "pointe", "kirkland", "beaconsfield", "pierrefonds", "west", "east", "north", "south",
+    "island", "shore", "rive", "nord", "sud", "ouest", "downtown", "plateau",  # not "est": "is" in French
+}
+_ANCHOR_WORDS = WEEKDAYS | MONTHS | NEGATIONS | PLACES
+# The two words after these name the place even when it's unknown and lowercase
+PLACE_PREPOSITIONS = {"in", "to", "at", "near", "around", "from", "dans", "pres", "vers"}
+
+
+def _load_numpy():
+    global numpy
+    if numpy is None:
+        try:
+            import numpy as np
+        except ImportError:
+            return False
+        numpy = np
+    return True
+
+
+def normalize_text(text):
+    # "What are your HOURS??" and "what are your hours" -> same key
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    return " ".join(re.findall(r"[a-z0-9]+", text))
+
+
+def anchors(message):
+    # Numbers, places, days, months and negations in `message`: two questions
+    # share a semantic-tier reply only if these are identical. Capitalized
+    # words after the first, and the words after "in", "to", ..., are taken
+    # as places too ("in Saint-Sauveur", "to st leonard").
+    words = normalize_text(message).split()
+    found = {w for w in words if w.isdigit() or w in _ANCHOR_WORDS}
+    for i, word in enumerate(words):
+        if word in PLACE_PREPOSITIONS:
+            found.update(f"{word} {place}" for place in words[i + 1:i + 3])
+    for token in re.findall(r"\w+", unicodedata.normalize("NFKD", message or ""))[1:]:
+        if token[:1].isupper() and token.lower() != "i":
+            found.add(normalize_text(token))
+    return frozenset(found)
+
+
+def text_vector(normalized, dim=VECTOR_DIM):
+    # Unit vector of hashed word unigrams/bigrams and character trigrams, so
+    # rewordings and typos ("wat r ur hours") land close together
+    words = normalized.split()
+    features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    padded = f" {normalized} "
+    features += [padded[i:i + 3] for i in range(len(padded) - 2)]
+    vec = numpy.zeros(dim, dtype=numpy.float32)
+    for feature in features:
+        h = zlib.crc32(feature.encode())
+        vec[h % dim] += 1.0 if h & 0x80000000 else -1.0
+    norm = numpy.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+
+class ReplyCache:
+    def __init__(self, maxsize=REPLY_CACHE_SIZE, ttl=REPLY_CACHE_TTL,
+                 semantic=REPLY_CACHE_SEMANTIC != "off", threshold=REPLY_CACHE_THRESHOLD):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.threshold = threshold
+        self.semantic = semantic and _load_numpy()
+        if semantic and not self.semantic:
+            print("⚠️ numpy not installed, reply cache is exact-match only")
+        self.lock = threading.Lock()
+        self.facts = None
+        self.hits = 0
+        self.lookups = 0
+        self._clear()
+        metrics.set_gauge("reply_cache.hit_rate", lambda: self.hits / self.lookups if self.lookups else 0.0)
+        metrics.set_gauge("reply_cache.size", lambda: len(self.entries))
+
+    def _clear(self):
+        self.entries = OrderedDict()  # key -> (reply, stored_at, model_seconds, slot)
+        if self.semantic:
+            self.vectors = numpy.zeros((self.maxsize, VECTOR_DIM), dtype=numpy.float32)
+            self.slot_keys = [None] * self.maxsize
+            self.slot_anchors = [None] * self.maxsize
+            self.free_slots = list(range(self.maxsize - 1, -1, -1))
+
+    def set_facts(self, facts):
+        # Call with the current business facts; a change empties the cache
+        fingerprint = hashlib.sha256(facts.encode()).hexdigest()
+        if fingerprint != self.facts:
+            with self.lock:
+                if self.facts is not None:
+                    print("🧹 Business facts changed, clearing reply cache")
+                    metrics.inc("reply_cache.invalidations")
+                self.facts = fingerprint
+                self._clear()
+
+    def _drop(self, key):
+        _, _, _, slot = self.entries.pop(key)
+        if slot is not None:
+            self.vectors[slot] = 0.0
+            self.slot_keys[slot] = None
+            self.slot_anchors[slot] = None
+            self.free_slots.append(slot)
+
+    def _fresh(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry[1] > self.ttl:
+            self._drop(key)
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def get(self, message):
+        # Cached reply for `message`, or None
+        key = normalize_text(message)
+        if not key:
+            return None
+        with metrics.timer("reply_cache.lookup"), self.lock:
+            self.lookups += 1
+            tier = "exact"
+            entry = self._fresh(key)
+            if entry is None and self.semantic and self.entries:
+                entry = self._similar(key, anchors(message))
+                tier = "semantic"
+            if entry is None:
+                metrics.inc("reply_cache.misses")
+                return None
+            self.hits += 1
+        metrics.inc(f"reply_cache.hits.{tier}")
+        metrics.inc("reply_cache.seconds_saved", entry[2])
+        return entry[0]
+
+    def _similar(self, key, wanted):
+        # Closest cached question above the threshold with the same anchors
+        scores = self.vectors @ text_vector(key)
+        candidates = numpy.flatnonzero(scores >= self.threshold)
+        for slot in candidates[numpy.argsort(-scores[candidates])]:
+            if self.slot_keys[slot] is None:
+                continue
+            if self.slot_anchors[slot] != wanted:
+                metrics.inc("reply_cache.anchor_mismatches")
+                continue
+            return self._fresh(self.slot_keys[slot])
+        return None
+
+    def put(self, message, reply, model_seconds=0.0):
+        # Remember `reply`; `model_seconds` is what producing it cost
+        key = normalize_text(message)
+        if not key or not reply:
+            return
+        with self.lock:
+            if key in self.entries:
+                self._drop(key)
+            while len(self.entries) >= self.maxsize:
+                self._drop(next(iter(self.entries)))
+            slot = None
+            if self.semantic:
+                slot = self.free_slots.pop()
+                self.vectors[slot] = text_vector(key)
+                self.slot_keys[slot] = key
+                self.slot_anchors[slot] = anchors(message)
+            self.entries[key] = (reply, time.time(), model_seconds, slot)
+
+
+def make_reply_cache():
+    if REPLY_CACHE == "off":
+        return None
+    return ReplyCache()
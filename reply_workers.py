@@ -0,0 +1,124 @@
+# reply_workers.py
+#
+# Async reply mode: webhooks put a job on a bounded queue and return right
+# away, and a pool of worker threads does the slow OpenAI + logging + send
+# work. Enable with REPLY_MODE=async.
+#
+#   REPLY_WORKERS        worker threads (default 4)
+#   REPLY_QUEUE_SIZE     max queued jobs before webhooks are turned away (default 100)
+#   REPLY_DRAIN_SECONDS  how long shutdown waits for queued jobs to finish (default 20)
+
+import atexit
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+
+import metrics
+
+REPLY_MODE = os.getenv("REPLY_MODE", "sync").lower()
+REPLY_WORKERS = int(os.getenv("REPLY_WORKERS", "4"))
+REPLY_QUEUE_SIZE = int(os.getenv("REPLY_QUEUE_SIZE", "100"))
+REPLY_DRAIN_SECONDS = float(os.getenv("REPLY_DRAIN_SECONDS", "20"))
+
+_STOP = object()
+
+
+class ReplyWorkerPool:
+    def __init__(self, handler, workers=REPLY_WORKERS, queue_size=REPLY_QUEUE_SIZE, name="reply"):
+        self.handler = handler
+        self.workers = workers
+        self.name = name
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.threads = []
+        self.accepting = False
+        self.busy = 0
+        self._busy_lock = threading.Lock()
+
+        metrics.set_gauge(f"{name}.queue_depth", self.queue.qsize)
+        metrics.set_gauge(f"{name}.busy_workers", lambda: self.busy)
+
+    def start(self):
+        if self.threads:
+            return self
+        self.accepting = True
+        for i in range(self.workers):
+            t = threading.Thread(target=self._run, name=f"{self.name}-worker-{i}", daemon=True)
+            t.start()
+            self.threads.append(t)
+        atexit.register(self.shutdown)
+        _exit_on_sigterm()
+        print(f"🧵 Started {self.workers} {self.name} workers (queue size {self.queue.maxsize})")
+        return self
+
+    def submit(self, *args):
+        # Returns False if the pool is full or shutting down; the caller
+        # decides how to answer the webhook in that case
+        if not self.accepting:
+            metrics.inc(f"{self.name}.rejected")
+            return False
+        try:
+            self.queue.put_nowait((time.monotonic(), args))
+        except queue.Full:
+            print(f"⚠️ {self.name} queue full, rejecting job")
+            metrics.inc(f"{self.name}.rejected")
+            return False
+        metrics.inc(f"{self.name}.submitted")
+        return True
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is _STOP:
+                    return
+                queued_at, args = item
+                metrics.observe(f"{self.name}.queue_wait", time.monotonic() - queued_at)
+                with self._busy_lock:
+                    self.busy += 1
+                try:
+                    with metrics.timer(f"{self.name}.job"):
+                        self.handler(*args)
+                    metrics.inc(f"{self.name}.completed")
+                except Exception as e:
+                    print(f"❌ {self.name} worker error:", e)
+                    metrics.inc(f"{self.name}.failed")
+                finally:
+                    with self._busy_lock:
+                        self.busy -= 1
+            finally:
+                self.queue.task_done()
+
+    def shutdown(self, timeout=REPLY_DRAIN_SECONDS):
+        # Stop taking new jobs, let queued ones finish (up to `timeout`),
+        # then stop the workers
+        if not self.accepting:
+            return
+        self.accepting = False
+        print(f"🛑 Draining {self.queue.qsize()} queued {self.name} jobs...")
+
+        deadline = time.monotonic() + timeout
+        while self.queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+        if self.queue.unfinished_tasks:
+            print(f"⚠️ {self.queue.unfinished_tasks} {self.name} jobs still pending at shutdown")
+
+        for _ in self.threads:
+            try:
+                self.queue.put_nowait(_STOP)
+            except queue.Full:
+                break
+        for t in self.threads:
+            t.join(timeout=max(deadline - time.monotonic(), 0.1))
+
+
+def _exit_on_sigterm():
+    # Plain `python app.py` dies on SIGTERM without running atexit hooks, so
+    # turn it into a normal exit. Leave the handler alone if a server such as
+    # gunicorn has already installed its own.
+    if threading.current_thread() is not threading.main_thread():
+        return
+    if signal.getsignal(signal.SIGTERM) is signal.SIG_DFL:
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
@@ -0,0 +1,447 @@
+# resilience.py
+#
+# Timeouts, circuit breakers and hedged reads for the upstream APIs (OpenAI,
+# Twilio, Telnyx, Google Sheets). Without them a hung upstream call held a
+# worker for as long as the socket stayed open.
+#
+# Deadlines: each webhook gets REQUEST_DEADLINE_SECONDS (Twilio gives up on
+# us after 15s) via request_deadlines(app), or `with deadline(seconds)`. The
+# deadline lives in a context variable, and every upstream call made on
+# behalf of the request is given timeout_for(<upstream timeout>): the
+# upstream's own cap or whatever is left of the request, whichever is less.
+# Once it has passed, timeout_for() raises DeadlineExceeded instead of
+# starting a call that can't finish in time. Under a deadline OpenAI clients
+# are used through for_deadline(), without the client's own retries (which
+# would re-send a timed-out request with the same timeout and overshoot).
+#
+# Circuit breakers: breaker(name) per upstream. After RESILIENCE_FAILURES
+# consecutive failures it opens and calls fail immediately with CircuitOpen
+# (the apps answer with their canned reply) for RESILIENCE_RESET_SECONDS;
+# then one trial call is let through, and its outcome closes or re-opens it.
+#
+# Hedged reads: hedged(fn, name) runs an idempotent read and, if it hasn't
+# answered within the p95 of that read's recent latencies, sends the same
+# read again and takes whichever answers first. Hedges are capped at
+# RESILIENCE_HEDGE_BUDGET of reads so a slow upstream isn't hit twice as hard.
+# Reads run on a pool of HEDGE_WORKERS threads so the caller can race them,
+# but never wait for one: when every worker is busy the read runs on the
+# calling thread, unhedged, and a hedge is only sent to an idle worker, so a
+# busy pool can't turn queueing time into extra hedges.
+#
+# Twilio, Telnyx and gspread each send every request through one HTTP client
+# object, so twilio_http_client(), install_telnyx() and SheetsSession
+# (sheets_session.py) put the breaker and the timeout there; asgi_app.py
+# wraps its httpx calls in aguarded(). OpenAI calls are wrapped where they're
+# made (run_completion.py, chat_engine.py, app.py).
+#
+# Metrics: breaker.<name> (gauge: 0 closed, 1 half-open, 2 open),
+# breaker.<name>.opened, breaker.<name>.rejected, hedge.<name>.sent,
+# hedge.<name>.won, hedge.<name>.inline (no idle worker: ran unhedged),
+# hedge.<name>.busy (hedge skipped, no idle worker), resilience.deadline_exceeded.
+#
+#   RESILIENCE                 "on" (default) or "off"
+#   REQUEST_DEADLINE_SECONDS   per-webhook budget (default 12)
+#   OPENAI_TIMEOUT             seconds per OpenAI request (default 20)
+#   TWILIO_TIMEOUT             seconds per Twilio request (default 10)
+#   TELNYX_TIMEOUT             seconds per Telnyx request (default 10)
+#   SHEETS_TIMEOUT             seconds per Google Sheets request (default 20)
+#   RESILIENCE_FAILURES        consecutive failures that open a breaker (default 5)
+#   RESILIENCE_RESET_SECONDS   how long a breaker stays open (default 30)
+#   RESILIENCE_HEDGE_AFTER     hedge delay until a read has latency history (default 1.0)
+#   RESILIENCE_HEDGE_BUDGET    max hedges as a fraction of reads (default 0.1)
+
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+
+import metrics
+
+RESILIENCE = os.getenv("RESILIENCE", "on").lower()
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "12"))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "20"))
+TWILIO_TIMEOUT = float(os.getenv("TWILIO_TIMEOUT", "10"))
+TELNYX_TIMEOUT = float(os.getenv("TELNYX_TIMEOUT", "10"))
+SHEETS_TIMEOUT = float(os.getenv("SHEETS_TIMEOUT", "20"))
+RESILIENCE_FAILURES = int(os.getenv("RESILIENCE_FAILURES", "5"))
+RESILIENCE_RESET_SECONDS = float(os.getenv("RESILIENCE_RESET_SECONDS", "30"))
+RESILIENCE_HEDGE_AFTER = float(os.getenv("RESILIENCE_HEDGE_AFTER", "1.0"))
+RESILIENCE_HEDGE_BUDGET = float(os.getenv("RESILIENCE_HEDGE_BUDGET", "0.1"))
+
+enabled = RESILIENCE != "off"
+
+MIN_TIMEOUT = 0.1      # never hand an upstream a timeout it can't possibly meet
+HEDGE_MIN_DELAY = 0.05
+HEDGE_HISTORY = 200    # recent latencies kept per read
+HEDGE_WARMUP = 20      # samples needed before the p95 is trusted
+HEDGE_WORKERS = 16
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+class Rejected(RuntimeError):
+    # Refused locally, without reaching the upstream
+    pass
+
+
+class CircuitOpen(Rejected):
+    pass
+
+
+# — deadlines
+
+_deadline = contextvars.ContextVar("request_deadline", default=None)
+
+
+@contextmanager
+def deadline(seconds):
+    # Calls inside must finish within `seconds` (or an enclosing deadline, if sooner)
+    at = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(at if current is None else min(at, current))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def clear_deadline():
+    # For work that outlives the request it started in (it copied the context)
+    _deadline.set(None)
+
+
+def remaining():
+    # Seconds left for the current request, or None without a deadline
+    at = _deadline.get()
+    return None if at is None else at - time.monotonic()
+
+
+def deadline_at(seconds):
+    # Monotonic time by which something allowed `seconds` must finish,
+    # brought forward to the request deadline
+    at = time.monotonic() + seconds
+    current = _deadline.get() if enabled else None
+    return at if current is None else min(at, current)
+
+
+def timeout_for(cap, until=None):
+    # Timeout for one upstream call: `cap`, or less if the request (or
+    # `until`, a monotonic deadline) is about to run out
+    left = remaining() if enabled else None
+    if until is not None:
+        left = until - time.monotonic() if left is None else min(left, until - time.monotonic())
+    if left is None:
+        return cap
+    if left <= 0:
+        metrics.inc("resilience.deadline_exceeded")
+        raise DeadlineExceeded("Request deadline passed")
+    return max(min(cap, left), MIN_TIMEOUT)
+
+
+def for_deadline(client):
+    # `client` (OpenAI or AsyncOpenAI) for a call under a request deadline
+    if remaining() is None or not enabled:
+        return client
+    return client.with_options(max_retries=0)
+
+
+def request_deadlines(app, seconds=REQUEST_DEADLINE_SECONDS):
+    # Give every Flask request `seconds` for its upstream calls
+    @app.before_request
+    def _start_deadline():
+        _deadline.set(time.monotonic() + seconds)
+
+    @app.teardown_request
+    def _clear_deadline(error=None):
+        # Worker threads are reused between requests
+        clear_deadline()
+
+
+# — circuit breakers
+
+CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+
+
+class CircuitBreaker:
+    def __init__(self, name, failures=RESILIENCE_FAILURES, reset_after=RESILIENCE_RESET_SECONDS):
+        self.name = name
+        self.failures = failures
+        self.reset_after = reset_after
+        self.state = CLOSED
+        self.consecutive = 0
+        self.opened_at = 0.0
+        self.trial = False
+        self.lock = threading.Lock()
+        metrics.set_gauge(f"breaker.{name}", lambda: self.state)
+
+    def allow(self):
+        # Raises CircuitOpen if the call shouldn't be made
+        if not enabled:
+            return
+        with self.lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_after:
+                self.state = HALF_OPEN
+                self.trial = False
+            if self.state == CLOSED:
+                return
+            if self.state == HALF_OPEN and not self.trial:
+                self.trial = True  # this call finds out whether it's back
+                return
+        metrics.inc(f"breaker.{self.name}.rejected")
+        raise CircuitOpen(f"{self.name} is unavailable (circuit open)")
+
+    def record(self, error=None):
+        if not enabled:
+            return
+        if isinstance(error, (Rejected, DeadlineExceeded)) or getattr(error, "status_code", None) == 429:
+            # Never reached the upstream, or only hit the rate limit (that's
+            # admission.py's job); a trial call gets another go
+            with self.lock:
+                self.trial = False
+            return
+        with self.lock:
+            if error is None:
+                self.state = CLOSED
+                self.consecutive = 0
+                return
+            self.consecutive += 1
+            if self.state == HALF_OPEN or self.consecutive >= self.failures:
+                if self.state != OPEN:
+                    metrics.inc(f"breaker.{self.name}.opened")
+                    print(f"🔌 {self.name} circuit opened after {self.consecutive} failures: {error}")
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def call(self, fn):
+        self.allow()
+        try:
+            result = fn()
+        except Exception as e:
+            self.record(e)
+            raise
+        self.record()
+        return result
+
+    async def acall(self, fn):
+        self.allow()
+        try:
+            result = await fn()
+        except Exception as e:
+            self.record(e)
+            raise
+        self.record()
+        return result
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker(name, **kwargs):
+    # The process-wide breaker for upstream `name`
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name, **kwargs)
+        return _breakers[name]
+
+
+# — hedged reads
+
+class _ReadStats:
+    def __init__(self):
+        self.latencies = deque(maxlen=HEDGE_HISTORY)
+        self.reads = 0
+        self.hedges = 0
+        self.lock = threading.Lock()
+
+    def begin(self):
+        # Count a read; how long to give it before hedging
+        with self.lock:
+            self.reads += 1
+            if len(self.latencies) < HEDGE_WARMUP:
+                return RESILIENCE_HEDGE_AFTER
+            ordered = sorted(self.latencies)
+        return max(ordered[int(0.95 * (len(ordered) - 1))], HEDGE_MIN_DELAY)
+
+    def observe(self, seconds):
+        with self.lock:
+            self.latencies.append(seconds)
+
+    def may_hedge(self):
+        with self.lock:
+            if self.hedges + 1 > RESILIENCE_HEDGE_BUDGET * self.reads:
+                return False
+            self.hedges += 1
+            return True
+
+
+_reads = {}
+_hedge_pool = None
+_idle = None          # hedge workers not running a read
+_hedge_lock = threading.Lock()
+
+
+def _stats(name):
+    with _hedge_lock:
+        return _reads.setdefault(name, _ReadStats())
+
+
+def _pool():
+    global _hedge_pool, _idle
+    with _hedge_lock:
+        if _hedge_pool is None:
+            _hedge_pool = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="hedge")
+            _idle = threading.BoundedSemaphore(HEDGE_WORKERS)
+        return _hedge_pool, _idle
+
+
+def _timed(fn, stats, idle=None):
+    # Runs in a hedge worker, under a copy of the caller's context (deadline);
+    # frees its worker slot when done
+    context = contextvars.copy_context()
+
+    def run():
+        started = time.monotonic()
+        try:
+            result = context.copy().run(fn)
+        finally:
+            if idle is not None:
+                idle.release()
+        stats.observe(time.monotonic() - started)
+        return result
+    return run
+
+
+def hedged(fn, name):
+    # fn() for an idempotent read; a second copy races it if it's slow.
+    # Reads never queue for a hedge worker: with none idle the read runs on
+    # the calling thread, unhedged, and a hedge is only sent to an idle one.
+    if not enabled:
+        return fn()
+    stats = _stats(name)
+    pool, idle = _pool()
+    if not idle.acquire(blocking=False):
+        metrics.inc(f"hedge.{name}.inline")
+        stats.begin()
+        return _timed(fn, stats)()
+    first = pool.submit(_timed(fn, stats, idle))
+    done, _ = wait([first], timeout=stats.begin())
+    if done or not stats.may_hedge():
+        return first.result()
+    if not idle.acquire(blocking=False):
+        metrics.inc(f"hedge.{name}.busy")
+        return first.result()
+    metrics.inc(f"hedge.{name}.sent")
+    second = pool.submit(_timed(fn, stats, idle))
+    racing = {first, second}
+    while racing:
+        done, racing = wait(racing, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                if future is second:
+                    metrics.inc(f"hedge.{name}.won")
+                return future.result()
+    return first.result()  # both failed: raise the original read's error
+
+
+async def ahedged(fn, name):
+    # hedged() for a coroutine function
+    if not enabled:
+        return await fn()
+    stats = _stats(name)
+
+    async def timed():
+        started = time.monotonic()
+        result = await fn()
+        stats.observe(time.monotonic() - started)
+        return result
+
+    first = asyncio.ensure_future(timed())
+    done, _ = await asyncio.wait({first}, timeout=stats.begin())
+    if done or not stats.may_hedge():
+        return await first
+    metrics.inc(f"hedge.{name}.sent")
+    second = asyncio.ensure_future(timed())
+    racing = {first, second}
+    try:
+        while racing:
+            done, racing = await asyncio.wait(racing, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is second:
+                        metrics.inc(f"hedge.{name}.won")
+                    return task.result()
+        return first.result()
+    finally:
+        for task in racing:
+            task.cancel()
+
+
+# — upstream clients
+
+def _record_status(upstream, status):
+    upstream.record(RuntimeError(f"{upstream.name} HTTP {status}") if status >= 500 else None)
+
+
+def guarded(name, send, status_of):
+    # send() (an HTTP request) through breaker `name`; network errors and
+    # 5xx responses count as failures, 4xx don't
+    upstream = breaker(name)
+    upstream.allow()
+    try:
+        response = send()
+    except Exception as e:
+        upstream.record(e)
+        raise
+    _record_status(upstream, status_of(response))
+    return response
+
+
+async def aguarded(name, send, status_of):
+    # guarded() for a coroutine function
+    upstream = breaker(name)
+    upstream.allow()
+    try:
+        response = await send()
+    except Exception as e:
+        upstream.record(e)
+        raise
+    _record_status(upstream, status_of(response))
+    return response
+
+
+def twilio_http_client():
+    # For twilio.rest.Client(..., http_client=...): every request gets the
+    # "twilio" breaker and a deadline-bounded timeout
+    from twilio.http.http_client import TwilioHttpClient
+
+    class ResilientTwilioHttpClient(TwilioHttpClient):
+        def request(self, method, url, params=None, data=None, headers=None, auth=None,
+                    timeout=None, allow_redirects=False):
+            send = lambda: super(ResilientTwilioHttpClient, self).request(
+                method, url, params=params, data=data, headers=headers, auth=auth,
+                timeout=timeout_for(timeout or TWILIO_TIMEOUT), allow_redirects=allow_redirects,
+            )
+            return guarded("twilio", send, lambda response: response.status_code)
+
+    return ResilientTwilioHttpClient(timeout=TWILIO_TIMEOUT)
+
+
+def install_telnyx(telnyx):
+    # Route the telnyx module's requests through the "telnyx" breaker, with
+    # TELNYX_TIMEOUT instead of its 80s default
+    from telnyx.http_client import RequestsClient
+
+    class ResilientTelnyxClient(RequestsClient):
+        def request(self, *args, **kwargs):
+            # Returns (content, status code, headers)
+            send = lambda: super(ResilientTelnyxClient, self).request(*args, **kwargs)
+            return guarded("telnyx", send, lambda response: response[1])
+
+    telnyx.default_http_client = ResilientTelnyxClient(timeout=TELNYX_TIMEOUT)
@@ -0,0 +1,427 @@
+# run_completion.py
+#
+# Shared "start a run and wait for the assistant's reply" engine used by every
+# route that talks to the Assistants API. Replaces the old
+# `while True: runs.retrieve(...); time.sleep(1)` loops.
+#
+# Two modes:
+#   - streaming (default): consume the run's server-sent events and return the
+#     reply as soon as the run finishes, with no polling at all
+#   - polling (RUN_STREAMING=0): poll runs.retrieve with adaptive sub-second
+#     backoff instead of a fixed 1s sleep
+# Both modes enforce a hard deadline (RUN_DEADLINE_SECONDS) and cancel the run
+# if it is exceeded, so a stuck run can never hold a worker forever.
+#
+# reply_in_thread() posts the customer's message and starts the run in one
+# request: threads.create_and_run for a new conversation (instead of
+# threads.create + messages.create + runs.create), runs.create with
+# additional_messages for an existing one. When the reply has to be read back
+# (polling, or a stream that ended early) only the run's own newest message is
+# fetched (limit=1, run_id=...), not a page of history. reply_for_number()
+# does the same for a thread-per-caller ThreadStore (optionally drawing new
+# threads from a warm ThreadPool); a first-time caller's thread is created
+# empty under the store's claim, then posted to and run like any other.
+#
+# Every reply holds an admission slot (admission.py) while it runs: first
+# contact (no thread yet) ahead of ongoing conversations. A reply whose run
+# was refused with a 429 goes back through the admission queue; once a run
+# has started it is never retried, so a message is never posted twice.
+#
+# Every request gets a timeout (OPENAI_TIMEOUT, cut short by the reply's
+# deadline, which is itself cut short by the webhook's, see resilience.py),
+# the reads (runs.retrieve, messages.list) are hedged, and a reply goes
+# through the "openai" circuit breaker, failing at once while it is open.
+#
+# Stage timings: assistant.start (request until the run exists),
+# assistant.run (run created until completed), assistant.fetch (reading the
+# reply back, when needed), assistant.reply (total); assistant.new_threads.
+#
+# areply_in_thread() is the same engine for
+# AsyncOpenAI clients.
+
+import asyncio
+import os
+import time
+
+import admission
+import metrics
+import resilience
+
+RUN_STREAMING = os.getenv("RUN_STREAMING", "1") != "0"
+RUN_DEADLINE_SECONDS = float(os.getenv("RUN_DEADLINE_SECONDS", "30"))
+
+# Polling backoff: start fast (most short replies finish in well under a
+# second), then back off so long runs don't hammer runs.retrieve
+POLL_INITIAL_DELAY = 0.1
+POLL_MAX_DELAY = 0.5
+POLL_BACKOFF = 1.5
+
+FAILED_STATUSES = {"failed", "cancelled", "expired", "incomplete"}
+
+CANCEL_TIMEOUT = 5.0
+
+
+class RunFailed(Exception):
+    pass
+
+
+class RunTimeout(RunFailed):
+    pass
+
+
+def _message_text(message):
+    return message.content[0].text.value.strip()
+
+
+def _call_timeout(deadline):
+    # One request's timeout: OPENAI_TIMEOUT, or what's left before `deadline`
+    return max(min(resilience.OPENAI_TIMEOUT, deadline - time.monotonic()), resilience.MIN_TIMEOUT)
+
+
+def _cancel_quietly(client, thread_id, run_id):
+    try:
+        client.beta.threads.runs.cancel(thread_id=thread_id, run_id=run_id, timeout=CANCEL_TIMEOUT)
+    except Exception as e:
+        print("⚠️ Could not cancel run:", e)
+
+
+def _tool_outputs(tool_handler, run):
+    if tool_handler is None:
+        raise RunFailed("Run requires tool outputs but no tool handler was given")
+    tool_calls = run.required_action.submit_tool_outputs.tool_calls
+    return tool_handler(tool_calls)
+
+
+def wait_for_run(client, thread_id, run, tool_handler=None, deadline=None):
+    # Poll an already-created run until it reaches a terminal state.
+    # Returns the completed run object.
+    if deadline is None:
+        deadline = resilience.deadline_at(RUN_DEADLINE_SECONDS)
+    delay = POLL_INITIAL_DELAY
+
+    while True:
+        if run.status == "completed":
+            return run
+        if run.status in FAILED_STATUSES:
+            raise RunFailed(f"Run failed with status: {run.status}")
+        if run.status == "requires_action":
+            run = client.beta.threads.runs.submit_tool_outputs(
+                thread_id=thread_id,
+                run_id=run.id,
+                tool_outputs=_tool_outputs(tool_handler, run),
+                timeout=_call_timeout(deadline),
+            )
+            delay = POLL_INITIAL_DELAY
+            continue
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            _cancel_quietly(client, thread_id, run.id)
+            raise RunTimeout(f"Run {run.id} did not finish within the deadline")
+
+        time.sleep(min(delay, remaining))
+        delay = min(delay * POLL_BACKOFF, POLL_MAX_DELAY)
+        run = resilience.hedged(lambda: client.beta.threads.runs.retrieve(
+            thread_id=thread_id, run_id=run.id, timeout=_call_timeout(deadline)), "openai.runs")
+
+
+class _Stages:
+    # Per-stage timings for one reply
+    def __init__(self):
+        self.started = self.mark = time.perf_counter()
+        self.run_started = False
+
+    def done(self, stage):
+        if stage == "start":
+            self.run_started = True
+        now = time.perf_counter()
+        metrics.observe(f"assistant.{stage}", now - self.mark)
+        self.mark = now
+
+    def finish(self):
+        metrics.observe("assistant.reply", time.perf_counter() - self.started)
+
+
+def _user_message(message):
+    return {"role": "user", "content": message}
+
+
+def _start_kwargs(thread_id, run_kwargs, message):
+    # Arguments for the one request that posts `message` and starts the run
+    if message is None:
+        return {"thread_id": thread_id, **run_kwargs}
+    if thread_id is None:
+        metrics.inc("assistant.new_threads")
+        return {"thread": {"messages": [_user_message(message)]}, **run_kwargs}
+    return {"thread_id": thread_id, "additional_messages": [_user_message(message)], **run_kwargs}
+
+
+def _latest_reply(client, thread_id, run_id, stages, deadline):
+    # Just the run's newest message, not a page of the thread
+    messages = resilience.hedged(lambda: client.beta.threads.messages.list(
+        thread_id=thread_id, run_id=run_id, limit=1, order="desc", timeout=_call_timeout(deadline)), "openai.messages")
+    stages.done("fetch")
+    return _message_text(messages.data[0])
+
+
+def _poll_reply(client, thread_id, run_kwargs, tool_handler, deadline, message, stages):
+    kwargs = _start_kwargs(thread_id, run_kwargs, message)
+    if "thread" in kwargs:
+        run = client.beta.threads.create_and_run(timeout=_call_timeout(deadline), **kwargs)
+    else:
+        run = client.beta.threads.runs.create(timeout=_call_timeout(deadline), **kwargs)
+    stages.done("start")
+    wait_for_run(client, run.thread_id, run, tool_handler=tool_handler, deadline=deadline)
+    stages.done("run")
+    return run.thread_id, _latest_reply(client, run.thread_id, run.id, stages, deadline)
+
+
+def _stream_reply(client, thread_id, run_kwargs, tool_handler, deadline, message, stages):
+    reply = None
+    run_id = None
+    kwargs = _start_kwargs(thread_id, run_kwargs, message)
+    timeout = max(deadline - time.monotonic(), 0.1)
+    if "thread" in kwargs:
+        manager = client.beta.threads.create_and_run_stream(timeout=timeout, **kwargs)
+    else:
+        manager = client.beta.threads.runs.stream(timeout=timeout, **kwargs)
+
+    # Each pass consumes one stream; a requires_action event ends the current
+    # stream and we continue on the stream returned by submit_tool_outputs
+    while manager is not None:
+        with manager as stream:
+            manager = None
+            for event in stream:
+                if time.monotonic() > deadline:
+                    if run_id:
+                        _cancel_quietly(client, thread_id, run_id)
+                    raise RunTimeout(f"Run {run_id} did not finish within the deadline")
+
+                kind = event.event
+                if kind.startswith("thread.run.") and not kind.startswith("thread.run.step"):
+                    if run_id is None:
+                        stages.done("start")
+                    run_id = event.data.id
+                    thread_id = event.data.thread_id
+
+                if kind == "thread.message.completed":
+                    reply = _message_text(event.data)
+                elif kind == "thread.run.requires_action":
+                    manager = client.beta.threads.runs.submit_tool_outputs_stream(
+                        thread_id=thread_id,
+                        run_id=run_id,
+                        tool_outputs=_tool_outputs(tool_handler, event.data),
+                        timeout=max(deadline - time.monotonic(), 0.1),
+                    )
+                    break
+                elif kind == "thread.run.completed":
+                    break
+                elif kind in ("thread.run.failed", "thread.run.cancelled",
+                              "thread.run.expired", "thread.run.incomplete"):
+                    raise RunFailed(f"Run failed with status: {event.data.status}")
+                elif kind == "error":
+                    raise RunFailed(f"Run stream error: {event.data}")
+
+    stages.done("run")
+    if reply is None:
+        # Stream ended without a message event (e.g. connection dropped after
+        # completion) — fall back to reading the thread
+        if run_id is None:
+            raise RunFailed("Run stream ended before the run started")
+        return thread_id, _latest_reply(client, thread_id, run_id, stages, deadline)
+    return thread_id, reply
+
+
+def _priority(thread_id, message, priority):
+    if priority is not None:
+        return priority
+    if thread_id is None and message is not None:
+        return admission.FIRST_CONTACT
+    return admission.ONGOING
+
+
+def _run_kwargs(assistant_id, tools):
+    run_kwargs = {"assistant_id": assistant_id}
+    if tools:
+        run_kwargs["tools"] = tools
+    return run_kwargs
+
+
+def reply_in_thread(client, thread_id, assistant_id, message, tools=None,
+                    tool_handler=None, stream=None, timeout=None, priority=None):
+    # Post `message` to `thread_id` (None: start a new thread with it), run
+    # the assistant and return (thread_id, reply text).
+    # `tool_handler(tool_calls)` must return a list of
+    # {"tool_call_id": ..., "output": ...} dicts; all outputs for a step are
+    # submitted together. `priority` overrides the admission priority.
+    if stream is None:
+        stream = RUN_STREAMING
+    client = resilience.for_deadline(client)
+    engine = _stream_reply if stream else _poll_reply
+    attempts = []
+
+    def attempt():
+        attempts.append(_Stages())
+        deadline = resilience.deadline_at(timeout or RUN_DEADLINE_SECONDS)
+        return engine(client, thread_id, _run_kwargs(assistant_id, tools), tool_handler, deadline, message, attempts[-1])
+
+    result = resilience.breaker("openai").call(lambda: admission.call(
+        attempt, _priority(thread_id, message, priority), retryable=lambda error: not attempts[-1].run_started))
+    attempts[-1].finish()
+    return result
+
+
+def reply_for_number(client, thread_store, number, assistant_id, message, pool=None, **kwargs):
+    # reply_in_thread() for the caller's thread in `thread_store`. A first
+    # message takes a ready thread from `pool` (thread_pool.py) if there is
+    # one, else creates an empty thread. Only getting the thread id happens
+    # under the store's lock and claim, so concurrent texts still can't
+    # create two threads, while the post and the run (which can take up to
+    # RUN_DEADLINE_SECONDS) don't hold up other numbers or outlive the claim.
+    created = []
+
+    def start():
+        created.append(True)
+        thread_id = pool.take() if pool else None
+        if thread_id:
+            return thread_id
+        metrics.inc("assistant.new_threads")
+        return resilience.breaker("openai").call(lambda: admission.call(
+            lambda: resilience.for_deadline(client).beta.threads.create(
+                timeout=resilience.timeout_for(resilience.OPENAI_TIMEOUT)).id,
+            admission.FIRST_CONTACT))
+
+    thread_id = thread_store.get_or_create(number, start)
+    if created:
+        kwargs.setdefault("priority", admission.FIRST_CONTACT)
+    return reply_in_thread(client, thread_id, assistant_id, message, **kwargs)[1]
+
+
+# — asyncio variants for AsyncOpenAI (used by asgi_app.py)
+
+async def await_run(client, thread_id, run, tool_handler=None, deadline=None):
+    if deadline is None:
+        deadline = resilience.deadline_at(RUN_DEADLINE_SECONDS)
+    delay = POLL_INITIAL_DELAY
+
+    while True:
+        if run.status == "completed":
+            return run
+        if run.status in FAILED_STATUSES:
+            raise RunFailed(f"Run failed with status: {run.status}")
+        if run.status == "requires_action":
+            run = await client.beta.threads.runs.submit_tool_outputs(
+                thread_id=thread_id,
+                run_id=run.id,
+                tool_outputs=_tool_outputs(tool_handler, run),
+                timeout=_call_timeout(deadline),
+            )
+            delay = POLL_INITIAL_DELAY
+            continue
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            await _acancel_quietly(client, thread_id, run.id)
+            raise RunTimeout(f"Run {run.id} did not finish within the deadline")
+
+        await asyncio.sleep(min(delay, remaining))
+        delay = min(delay * POLL_BACKOFF, POLL_MAX_DELAY)
+        run = await resilience.ahedged(lambda: client.beta.threads.runs.retrieve(
+            thread_id=thread_id, run_id=run.id, timeout=_call_timeout(deadline)), "openai.runs")
+
+
+async def _acancel_quietly(client, thread_id, run_id):
+    try:
+        await client.beta.threads.runs.cancel(thread_id=thread_id, run_id=run_id, timeout=CANCEL_TIMEOUT)
+    except Exception as e:
+        print("⚠️ Could not cancel run:", e)
+
+
+async def _alatest_reply(client, thread_id, run_id, stages, deadline):
+    messages = await resilience.ahedged(lambda: client.beta.threads.messages.list(
+        thread_id=thread_id, run_id=run_id, limit=1, order="desc", timeout=_call_timeout(deadline)), "openai.messages")
+    stages.done("fetch")
+    return _message_text(messages.data[0])
+
+
+async def _apoll_reply(client, thread_id, run_kwargs, tool_handler, deadline, message, stages):
+    kwargs = _start_kwargs(thread_id, run_kwargs, message)
+    if "thread" in kwargs:
+        run = await client.beta.threads.create_and_run(timeout=_call_timeout(deadline), **kwargs)
+    else:
+        run = await client.beta.threads.runs.create(timeout=_call_timeout(deadline), **kwargs)
+    stages.done("start")
+    await await_run(client, run.thread_id, run, tool_handler=tool_handler, deadline=deadline)
+    stages.done("run")
+    return run.thread_id, await _alatest_reply(client, run.thread_id, run.id, stages, deadline)
+
+
+async def _astream_reply(client, thread_id, run_kwargs, tool_handler, deadline, message, stages):
+    reply = None
+    run_id = None
+    kwargs = _start_kwargs(thread_id, run_kwargs, message)
+    timeout = max(deadline - time.monotonic(), 0.1)
+    if "thread" in kwargs:
+        manager = client.beta.threads.create_and_run_stream(timeout=timeout, **kwargs)
+    else:
+        manager = client.beta.threads.runs.stream(timeout=timeout, **kwargs)
+
+    while manager is not None:
+        async with manager as stream:
+            manager = None
+            async for event in stream:
+                if time.monotonic() > deadline:
+                    if run_id:
+                        await _acancel_quietly(client, thread_id, run_id)
+                    raise RunTimeout(f"Run {run_id} did not finish within the deadline")
+
+                kind = event.event
+                if kind.startswith("thread.run.") and not kind.startswith("thread.run.step"):
+                    if run_id is None:
+                        stages.done("start")
+                    run_id = event.data.id
+                    thread_id = event.data.thread_id
+
+                if kind == "thread.message.completed":
+                    reply = _message_text(event.data)
+                elif kind == "thread.run.requires_action":
+                    manager = client.beta.threads.runs.submit_tool_outputs_stream(
+                        thread_id=thread_id,
+                        run_id=run_id,
+                        tool_outputs=_tool_outputs(tool_handler, event.data),
+                        timeout=max(deadline - time.monotonic(), 0.1),
+                    )
+                    break
+                elif kind == "thread.run.completed":
+                    break
+                elif kind in ("thread.run.failed", "thread.run.cancelled",
+                              "thread.run.expired", "thread.run.incomplete"):
+                    raise RunFailed(f"Run failed with status: {event.data.status}")
+                elif kind == "error":
+                    raise RunFailed(f"Run stream error: {event.data}")
+
+    stages.done("run")
+    if reply is None:
+        if run_id is None:
+            raise RunFailed("Run stream ended before the run started")
+        return thread_id, await _alatest_reply(client, thread_id, run_id, stages, deadline)
+    return thread_id, reply
+
+
+async def areply_in_thread(client, thread_id, assistant_id, message, tools=None,
+                           tool_handler=None, stream=None, timeout=None, priority=None):
+    if stream is None:
+        stream = RUN_STREAMING
+    client = resilience.for_deadline(client)
+    engine = _astream_reply if stream else _apoll_reply
+    attempts = []
+
+    async def attempt():
+        attempts.append(_Stages())
+        deadline = resilience.deadline_at(timeout or RUN_DEADLINE_SECONDS)
+        return await engine(client, thread_id, _run_kwargs(assistant_id, tools), tool_handler, deadline, message, attempts[-1])
+
+    result = await resilience.breaker("openai").acall(lambda: admission.acall(
+        attempt, _priority(thread_id, message, priority), retryable=lambda error: not attempts[-1].run_started))
+    attempts[-1].finish()
+    return result
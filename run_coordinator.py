@@ -0,0 +1,160 @@
+# run_coordinator.py
+#
+# Customers often send a thought over two or three texts ("hi" / "do you do
+# snow removal" / "in laval?"). With one assistant run per text, the second
+# run either collides with the one still active on the thread or produces a
+# redundant reply. The RunCoordinator sits between the webhook and the run:
+#
+#   - every text is held until the number has been quiet for
+#     RUN_DEBOUNCE_SECONDS (but never more than RUN_DEBOUNCE_MAX_SECONDS
+#     after the first held text), so a burst of texts costs one run
+#   - texts that arrive while a run is in flight are held too, and handed to
+#     the next run together; runs for the same number never overlap
+#   - a batch with no run in flight starts early rather than let its
+#     webhook's deadline run out (see below)
+#
+# Only the newest waiting text's caller runs the batch and gets the reply;
+# the calls for the older texts return None right away ("superseded"), so
+# their webhooks answer with no message instead of a redundant one.
+#
+# A held text never waits past its webhook's deadline (resilience.py): its
+# batch starts no later than RUN_REPLY_RESERVE_SECONDS before it, debounced
+# or not. If a run is still in flight then, submit() returns None so the
+# webhook is acknowledged, and a background thread waits for that run, runs
+# the batch and passes the reply to deliver() (the pipeline texts it back).
+# Callers with no deadline (REPLY_MODE=async workers) just wait.
+#
+# This coordinates the threads of one process; with several worker processes
+# the same number can still land on two of them at once.
+#
+# Metrics: runs.batches, runs.coalesced (texts answered by someone else's
+# run), runs.handed_off (replies sent by text after the webhook was
+# answered), runs.batch_size, runs.debounce_wait (latency), runs.active (gauge).
+#
+#   RUN_DEBOUNCE_SECONDS        quiet time before a held batch runs (default 1.5)
+#   RUN_DEBOUNCE_MAX_SECONDS    max extra wait for a busy sender (default 5)
+#   RUN_REPLY_RESERVE_SECONDS   webhook time kept for the run itself (default 8)
+
+import os
+import threading
+import time
+
+import metrics
+import resilience
+from thread_store import normalize_number
+
+RUN_DEBOUNCE_SECONDS = float(os.getenv("RUN_DEBOUNCE_SECONDS", "1.5"))
+RUN_DEBOUNCE_MAX_SECONDS = float(os.getenv("RUN_DEBOUNCE_MAX_SECONDS", "5"))
+RUN_REPLY_RESERVE_SECONDS = float(os.getenv("RUN_REPLY_RESERVE_SECONDS", "8"))
+
+_HAND_OFF = object()
+
+
+class _Conversation:
+    def __init__(self, lock):
+        self.cond = threading.Condition(lock)
+        self.pending = []      # texts not yet handed to a run
+        self.first_at = None   # when the oldest pending text arrived
+        self.last_at = None    # when the newest one arrived
+        self.leader = None     # token of the caller that will run them
+        self.running = False
+
+
+class RunCoordinator:
+    def __init__(self, debounce=RUN_DEBOUNCE_SECONDS, max_wait=RUN_DEBOUNCE_MAX_SECONDS,
+                 reserve=RUN_REPLY_RESERVE_SECONDS):
+        self.debounce = debounce
+        self.max_wait = max_wait
+        self.reserve = reserve
+        self.lock = threading.Lock()
+        self.conversations = {}
+        self.active = 0
+        metrics.set_gauge("runs.active", lambda: self.active)
+
+    def submit(self, number, message, run, deliver=None):
+        # Queue `message` for `number`. Returns run(messages) if this call ended
+        # up running the batch, or None if a later text took over or the batch
+        # was handed off (its reply then goes to deliver(reply)).
+        key = normalize_number(number)
+        token = object()
+        arrived = time.monotonic()
+        budget = resilience.remaining() if deliver else None
+        give_up_at = None if budget is None else arrived + budget - self.reserve
+        with self.lock:
+            conversation = self.conversations.get(key)
+            if conversation is None:
+                conversation = self.conversations[key] = _Conversation(self.lock)
+            if not conversation.pending:
+                conversation.first_at = arrived
+            conversation.pending.append(message)
+            conversation.last_at = arrived
+            conversation.leader = token
+            conversation.cond.notify_all()
+            batch = self._wait_turn(conversation, token, give_up_at)
+
+        if batch is None:
+            return None
+        if batch is _HAND_OFF:
+            # The webhook can't wait any longer: answer it now and text the
+            # reply once the run in flight is done
+            metrics.inc("runs.handed_off")
+            threading.Thread(target=self._follow_up, args=(key, conversation, token, arrived, run, deliver),
+                             name="run-follow-up", daemon=True).start()
+            return None
+        return self._run(key, conversation, batch, arrived, run)
+
+    def _wait_turn(self, conversation, token, give_up_at=None):
+        # Under self.lock: the batch to run, None if a later text took over,
+        # or _HAND_OFF if a run is still in flight at give_up_at. With no run
+        # in flight the batch starts once debounced, or at give_up_at.
+        while True:
+            if conversation.leader is not token:
+                metrics.inc("runs.coalesced")
+                return None
+            now = time.monotonic()
+            if conversation.running:
+                if give_up_at is not None and now >= give_up_at:
+                    return _HAND_OFF
+                wake_at = give_up_at
+            else:
+                wake_at = min(conversation.last_at + self.debounce, conversation.first_at + self.max_wait)
+                if give_up_at is not None:
+                    wake_at = min(wake_at, give_up_at)
+                if now >= wake_at:
+                    break
+            conversation.cond.wait(None if wake_at is None else wake_at - now)
+
+        batch = conversation.pending
+        conversation.pending = []
+        conversation.leader = None
+        conversation.running = True
+        self.active += 1
+        return batch
+
+    def _follow_up(self, key, conversation, token, arrived, run, deliver):
+        with self.lock:
+            batch = self._wait_turn(conversation, token)
+        if batch is not None:
+            reply = self._run(key, conversation, batch, arrived, run)
+            if reply is not None:
+                deliver(reply)
+
+    def _run(self, key, conversation, batch, arrived, run):
+        metrics.observe("runs.debounce_wait", time.monotonic() - arrived)
+        metrics.observe("runs.batch_size", len(batch))
+        metrics.inc("runs.batches")
+        try:
+            return run(batch)
+        finally:
+            with self.lock:
+                conversation.running = False
+                self.active -= 1
+                if conversation.pending:
+                    conversation.cond.notify_all()
+                else:
+                    del self.conversations[key]
+
+
+def combine_messages(messages):
+    # Several texts as the one user message the run answers
+    return "\n".join(messages)
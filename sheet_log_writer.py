@@ -0,0 +1,108 @@
+# sheet_log_writer.py
+#
+# Background writer for the row-per-turn conversation log (app4 / app4.5 /
+# app5). log_to_sheet used to make up to three append_row calls per message
+# inline on the request path; now the turn is queued and a single writer
+# thread flushes everything queued from all conversations with one
+# append_rows call per monthly tab, every SHEETS_FLUSH_SECONDS or as soon as
+# SHEETS_BATCH_SIZE turns are waiting.
+#
+# This is the "sheets" log sink (log_sinks.py): turns are queued in its own
+# turn journal first, so a Sheets outage or a restart delays the sheet instead
+# of losing turns. When it isn't certain whether the last write landed (after
+# a restart with turns still queued, or an error mid-write) the writer first
+# checks the end of the tab and skips turns that are already there, so
+# replaying is idempotent.
+#
+# Rows are written strictly in the order they were queued (one writer, a
+# failed batch is retried from the front), so each handle's header/User/AI
+# rows stay in order. 429s and 5xx are retried with exponential backoff.
+#
+# Whether a handle needs its "🟢 New conversation" header comes from a
+# HandleIndex (handle_index.py) rather than re-reading column C every batch.
+#
+# Metrics: sheets.buffer_depth (gauge), sheets.flush (latency),
+# sheets.calls_per_message, sheets.rows_flushed, sheets.flush_retries,
+# sheets.turns_replayed, sheets.turns_dropped.
+
+import os
+
+import metrics
+from handle_index import HandleIndex, normalize_handle
+from log_sinks import BatchSink
+from sheets_session import thread_call_count
+
+SHEETS_FLUSH_SECONDS = float(os.getenv("SHEETS_FLUSH_SECONDS", "2"))
+SHEETS_BATCH_SIZE = int(os.getenv("SHEETS_BATCH_SIZE", "100"))
+
+REPLAY_CHECK_ROWS = 300  # extra rows checked for already-written turns (other workers append too)
+
+
+def _retryable(error):
+    from gspread.exceptions import APIError
+
+    if not isinstance(error, APIError):
+        return False
+    status = getattr(error.response, "status_code", None)
+    return status == 429 or (status is not None and status >= 500)
+
+
+class SheetLogWriter(BatchSink):
+    name = "sheets"
+    label = "Google Sheets"
+
+    def __init__(self, session, queue=None, flush_interval=SHEETS_FLUSH_SECONDS, batch_size=SHEETS_BATCH_SIZE):
+        super().__init__(queue, flush_interval, batch_size)
+        self.session = session
+        self.handles = HandleIndex()
+
+    def _unwritten(self, sheet, batch):
+        # Drop turns whose User row is already near the end of the tab
+        self.handles.ensure(sheet)
+        last_row = self.handles.row_count(sheet.title)
+        first_row = max(2, last_row - 3 * len(batch) - REPLAY_CHECK_ROWS)
+        written = {
+            (row[0], normalize_handle(row[2]), row[3])
+            for row in sheet.get(f"A{first_row}:D{last_row}")
+            if len(row) >= 4
+        }
+        unwritten = [
+            turn for turn in batch
+            if (turn[1], normalize_handle(turn[3]), f"User: {turn[4]}") not in written
+        ]
+        if len(unwritten) < len(batch):
+            print(f"↩️ Skipping {len(batch) - len(unwritten)} turns already in '{sheet.title}'")
+        return unwritten
+
+    def _write(self, month, batch):
+        calls_before = thread_call_count()
+        sheet = self.session.worksheet(month)
+        rows = self._write_sheet(sheet, self._unwritten(sheet, batch) if self.recovering else batch)
+        metrics.observe("sheets.calls_per_message", (thread_call_count() - calls_before) / len(batch))
+        return rows
+
+    def _write_sheet(self, sheet, batch):
+        # Write turns to their monthly tab; returns the number of rows written
+        if not batch:
+            return 0
+        self.handles.ensure(sheet)
+        rows = []
+        for _, now, platform, handle, user_msg, ai_reply, *_ in batch:
+            if self.handles.claim_new(sheet.title, handle):
+                rows.append([now, platform, handle, f"🟢 New conversation with {handle}"])
+            rows.append([now, platform, handle, f"User: {user_msg}"])
+            rows.append([now, platform, handle, f"AI: {ai_reply}"])
+        self.handles.appending(sheet.title)
+        response = sheet.append_rows(rows)
+        self.handles.appended(sheet.title, response, len(rows))
+        return len(rows)
+
+    def _retryable(self, error):
+        return _retryable(error)
+
+    def _failed(self, month):
+        # Whatever we cached about the tab may be wrong now
+        self.handles.invalidate(month)
+
+    def _gave_up(self):
+        self.session.reset()
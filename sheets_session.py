@@ -0,0 +1,141 @@
+# sheets_session.py
+#
+# Long-lived Google Sheets connection shared by every log_to_sheet call.
+# The old code re-read google-credentials.json, ran gspread.authorize,
+# opened the spreadsheet and looked up the monthly tab on *every* message —
+# an OAuth token exchange plus several HTTPS round-trips before the first
+# row was written. SheetsSession does all of that once:
+#
+#   - authorizes once; the underlying AuthorizedSession refreshes the
+#     access token only when it has expired
+#   - caches the spreadsheet and the current month's worksheet; when the
+#     month changes (a local clock check, no API call) it switches to the
+#     new tab, creating it with the header row if needed
+#   - counts Sheets API calls, in total and per logged message, so the
+#     savings show up on /metrics ("sheets.api_calls",
+#     "sheets.calls_per_message")
+#   - gives every request SHEETS_TIMEOUT and the "sheets" circuit breaker
+#     (resilience.py); 429s, 5xx and network errors count as failures
+#
+# gspread and oauth2client are imported on the first connect, not with this
+# module, so apps that never log to Sheets don't pay for them at startup.
+
+import threading
+from datetime import datetime
+
+import metrics
+import resilience
+
+SCOPE = [
+    "https://spreadsheets.google.com/feeds",
+    "https://www.googleapis.com/auth/drive",
+]
+HEADER_ROW = ["Date/Time", "Source", "Username/Handle", "Conversation"]
+
+_calls = threading.local()
+
+
+_http_client_class = None
+
+
+def counting_http_client():
+    # gspread HTTPClient subclass every Sheets/Drive API request goes through
+    global _http_client_class
+    if _http_client_class is not None:
+        return _http_client_class
+    from gspread.exceptions import APIError
+    from gspread.http_client import HTTPClient
+
+    class CountingHTTPClient(HTTPClient):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.set_timeout(resilience.SHEETS_TIMEOUT)
+
+        def request(self, *args, **kwargs):
+            upstream = resilience.breaker("sheets")
+            upstream.allow()
+            _calls.count = getattr(_calls, "count", 0) + 1
+            metrics.inc("sheets.api_calls")
+            try:
+                response = super().request(*args, **kwargs)
+            except APIError as e:
+                status = getattr(e.response, "status_code", 500)
+                upstream.record(e if status == 429 or status >= 500 else None)
+                raise
+            except Exception as e:
+                upstream.record(e)
+                raise
+            upstream.record()
+            return response
+
+    _http_client_class = CountingHTTPClient
+    return CountingHTTPClient
+
+
+def thread_call_count():
+    # API calls made so far by the current thread
+    return getattr(_calls, "count", 0)
+
+
+def month_tab_name(now=None):
+    return (now or datetime.now()).strftime("%B %Y")
+
+
+class SheetsSession:
+    def __init__(self, spreadsheet_id=None, spreadsheet_name=None, creds_path="google-credentials.json"):
+        self.spreadsheet_id = spreadsheet_id
+        self.spreadsheet_name = spreadsheet_name
+        self.creds_path = creds_path
+        self.lock = threading.RLock()
+        self.gclient = None
+        self.sheet_file = None
+        self.sheet = None
+
+    def client(self):
+        with self.lock:
+            if self.gclient is None:
+                import gspread
+                from oauth2client.service_account import ServiceAccountCredentials
+
+                creds = ServiceAccountCredentials.from_json_keyfile_name(self.creds_path, SCOPE)
+                self.gclient = gspread.authorize(creds, http_client=counting_http_client())
+                print("🔑 Authorized Google Sheets session")
+            return self.gclient
+
+    def spreadsheet(self):
+        with self.lock:
+            if self.sheet_file is None:
+                if self.spreadsheet_id:
+                    self.sheet_file = self.client().open_by_key(self.spreadsheet_id)
+                else:
+                    self.sheet_file = self.client().open(self.spreadsheet_name)
+            return self.sheet_file
+
+    def worksheet(self, month_name=None):
+        # Current month's tab, created with a header row the first time
+        from gspread.exceptions import WorksheetNotFound
+
+        month_name = month_name or month_tab_name()
+        with self.lock:
+            if self.sheet is not None and self.sheet.title == month_name:
+                return self.sheet
+
+            sheet_file = self.spreadsheet()
+            try:
+                sheet = sheet_file.worksheet(month_name)
+                print(f"🔍 Found sheet tab '{month_name}'")
+            except WorksheetNotFound:
+                print(f"➕ Creating sheet tab '{month_name}'")
+                # Just the header row: appends insert rows as they go, so the
+                # tab never carries empty pre-allocated cells
+                sheet = sheet_file.add_worksheet(title=month_name, rows=1, cols=4)
+                sheet.append_row(HEADER_ROW)
+            self.sheet = sheet
+            return sheet
+
+    def reset(self):
+        # Drop cached handles (e.g. after a tab was deleted by hand); the
+        # next call re-opens them. Keeps the authorized client.
+        with self.lock:
+            self.sheet_file = None
+            self.sheet = None
@@ -0,0 +1,287 @@
+# sms_dispatcher.py
+#
+# Outbound texts (missed-call follow-ups, voicemail alerts, replies sent by
+# API) used to be sent inline from the webhook: the handler waited on Twilio
+# or Telnyx, nothing paced texts from one number, and a failed send was only
+# printed. Now the webhook calls outbox.send(...) and returns; the
+# dispatcher:
+#
+#   - journals every text first (a turn journal of its own, turn_journal.py,
+#     TURN_JOURNAL_DIR/sms), so a provider outage or a restart delays texts
+#     instead of losing them. Delivery is at-least-once: a text sent just
+#     before a crash, but not yet acknowledged, is sent again on restart
+#   - paces each sending number with a token bucket matched to the carrier's
+#     limit: SMS_RATE texts/s (1 for a long code), or per number with
+#     SMS_NUMBER_RATES="+18005550100=3,+15145550100=1". Buckets are per
+#     process; with several gunicorn workers divide the rate between them
+#   - sends from SMS_WORKERS threads over the provider clients' pooled
+#     keep-alive sessions, texts from one number in the order queued
+#   - retries network errors, 429s and 5xx with exponential backoff plus
+#     jitter, up to SMS_MAX_ATTEMPTS (a 429 also pauses that number); other
+#     errors (a bad "to" number) fail at once
+#
+# Metrics: sms.latency (queued to accepted by the provider, end to end),
+# sms.send (one provider call), sms.sent, sms.retries, sms.failed;
+# sms.queue_depth, sms.in_flight (gauges).
+#
+#   SMS_DISPATCH        "on" (default) or "off" (send inline, the old behaviour)
+#   SMS_WORKERS         concurrent sends (default 4)
+#   SMS_RATE            texts per second per sending number (default 1)
+#   SMS_BURST           texts a number may send back to back (default 1)
+#   SMS_NUMBER_RATES    per-number overrides, "number=rate,..." (default none)
+#   SMS_MAX_ATTEMPTS    sends per text before giving up (default 5)
+#   SMS_RETRY_SECONDS   first retry delay, doubled each time up to 60s (default 1)
+#   SMS_DRAIN_SECONDS   how long shutdown waits for queued texts (default 10)
+#
+#   outbox = make_sms_dispatcher(twilio_client=twilio_client)
+#   outbox.send("twilio", TWILIO_NUMBER, caller, "Sorry we missed your call!")
+
+import atexit
+import os
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from admission import TokenBucket
+from turn_journal import make_turn_queue
+
+SMS_DISPATCH = os.getenv("SMS_DISPATCH", "on").lower()
+SMS_WORKERS = int(os.getenv("SMS_WORKERS", "4"))
+SMS_RATE = float(os.getenv("SMS_RATE", "1"))
+SMS_BURST = float(os.getenv("SMS_BURST", "1"))
+SMS_NUMBER_RATES = os.getenv("SMS_NUMBER_RATES", "")
+SMS_MAX_ATTEMPTS = int(os.getenv("SMS_MAX_ATTEMPTS", "5"))
+SMS_RETRY_SECONDS = float(os.getenv("SMS_RETRY_SECONDS", "1"))
+SMS_DRAIN_SECONDS = float(os.getenv("SMS_DRAIN_SECONDS", "10"))
+
+RETRY_MAX_DELAY = 60.0
+WINDOW = 1000  # queued texts looked at (and held in memory) at once
+IDLE_WAIT = 1.0
+
+
+def _parse_rates(spec):
+    rates = {}
+    for item in spec.split(","):
+        number, _, rate = item.partition("=")
+        if number.strip() and rate.strip():
+            rates[number.strip()] = float(rate)
+    return rates
+
+
+def _status(error):
+    # HTTP status of a provider error (Twilio: .status, Telnyx: .http_status,
+    # httpx: .response.status_code), or None for a network error
+    for attr in ("status", "http_status", "status_code"):
+        status = getattr(error, attr, None)
+        if isinstance(status, int):
+            return status
+    return getattr(getattr(error, "response", None), "status_code", None)
+
+
+def _retryable(error):
+    if isinstance(error, (TypeError, ValueError, KeyError)):
+        return False  # a bug or bad input, not the provider
+    status = _status(error)
+    return status is None or status == 429 or status >= 500
+
+
+def twilio_sender(twilio_client):
+    return lambda from_, to, body: twilio_client.messages.create(body=body, from_=from_, to=to)
+
+
+def telnyx_sender(telnyx):
+    return lambda from_, to, body: telnyx.Message.create(from_=from_, to=to, text=body)
+
+
+class SmsDispatcher:
+    def __init__(self, senders, queue=None, workers=SMS_WORKERS, rate=SMS_RATE, burst=SMS_BURST,
+                 rates=None, max_attempts=SMS_MAX_ATTEMPTS, retry_delay=SMS_RETRY_SECONDS,
+                 enabled=SMS_DISPATCH != "off"):
+        self.senders = senders  # provider -> send(from_, to, body)
+        self.enabled = enabled
+        self.queue = queue if queue is not None or not enabled else make_turn_queue("sms")
+        self.workers = workers
+        self.rate = rate
+        self.burst = burst
+        self.rates = _parse_rates(SMS_NUMBER_RATES) if rates is None else rates
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+
+        # Owned by the dispatch thread
+        self.lanes = {}       # from number -> deque of texts waiting, oldest first
+        self.buckets = {}     # from number -> TokenBucket
+        self.tracked = set()  # ids of queued texts in a lane, in flight or finished
+        self.finished = set()
+        self.attempts = {}
+        self.not_before = {}  # id -> monotonic time of its next retry
+        self.in_flight = 0
+
+        self.results = deque()  # (text, error) from the send threads
+        self.arrived = True     # new texts in the queue (including any left from a previous run)
+        self.wake = threading.Event()
+        self.running = False
+        self.drain_until = 0.0
+        self.thread = None
+        self.pool = None
+
+        if self.enabled:
+            metrics.set_gauge("sms.queue_depth", lambda: len(self.queue))
+            metrics.set_gauge("sms.in_flight", lambda: self.in_flight)
+
+    def start(self):
+        if self.enabled and self.thread is None:
+            self.running = True
+            self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="sms-send")
+            self.thread = threading.Thread(target=self._run, name="sms-dispatch", daemon=True)
+            self.thread.start()
+            atexit.register(self.stop)
+        return self
+
+    def send(self, provider, from_, to, body):
+        # Queue a text; returns at once (SMS_DISPATCH=off: sends it now).
+        # False if it couldn't be queued or sent.
+        if provider not in self.senders:
+            print(f"❌ No {provider} sender configured")
+            return False
+        if not self.enabled:
+            try:
+                with metrics.timer("sms.send"):
+                    self.senders[provider](from_, to, body)
+                metrics.inc("sms.sent")
+                return True
+            except Exception as e:
+                metrics.inc("sms.failed")
+                print(f"❌ SMS to {to} failed:", e)
+                return False
+        try:
+            self.queue.put((uuid.uuid4().hex, provider, from_, to, body, time.time()))
+        except OSError as e:
+            print(f"❌ Could not queue SMS to {to}:", e)
+            return False
+        self.arrived = True
+        self.wake.set()
+        return True
+
+    # — dispatch thread
+
+    def _run(self):
+        wait = 0.0
+        while self.running or (len(self.queue) and time.monotonic() < self.drain_until):
+            self.wake.wait(wait)
+            self.wake.clear()
+            self._collect()
+            wait = self._dispatch()
+
+    def _collect(self):
+        # Take in new texts and send results; acknowledge finished texts
+        # from the front of the queue
+        while self.results:
+            text, error = self.results.popleft()
+            self.in_flight -= 1
+            self._finish(text, error)
+        if not (self.arrived or self.finished):
+            return
+        self.arrived = False
+        window = self.queue.peek(WINDOW)
+        done = 0
+        for i, text in enumerate(window):
+            if text[0] in self.finished:
+                if done == i:
+                    done += 1
+            elif text[0] not in self.tracked:
+                self.tracked.add(text[0])
+                self.lanes.setdefault(text[2], deque()).append(text)
+        if done:
+            self.queue.ack(window[:done])
+            for text in window[:done]:
+                self.finished.discard(text[0])
+                self.tracked.discard(text[0])
+
+    def _bucket(self, number):
+        if number not in self.buckets:
+            rate = self.rates.get(number, self.rate)
+            self.buckets[number] = TokenBucket(rate, max(self.burst, 1))
+        return self.buckets[number]
+
+    def _dispatch(self):
+        # Start every text whose number has a token; seconds until the next could go
+        wait = IDLE_WAIT
+        now = time.monotonic()
+        for number, lane in list(self.lanes.items()):
+            while lane and self.in_flight < self.workers:
+                retry_at = self.not_before.get(lane[0][0], 0.0)
+                delay = max(retry_at - now, self._bucket(number).delay())
+                if delay > 0:
+                    wait = min(wait, delay)
+                    break
+                try:
+                    self.pool.submit(self._send, lane[0])
+                except RuntimeError:
+                    return wait  # shut down mid-drain; what's left stays queued
+                self._bucket(number).take()
+                lane.popleft()
+                self.in_flight += 1
+            if not lane:
+                del self.lanes[number]
+        return wait
+
+    def _send(self, text):
+        _, provider, from_, to, body, _ = text
+        error = None
+        try:
+            with metrics.timer("sms.send"):
+                self.senders[provider](from_, to, body)
+        except Exception as e:
+            error = e
+        self.results.append((text, error))
+        self.wake.set()
+
+    def _finish(self, text, error):
+        text_id, provider, from_, to, _, queued_at = text
+        attempts = self.attempts.get(text_id, 0) + 1
+        if error is None:
+            metrics.inc("sms.sent")
+            metrics.observe("sms.latency", time.time() - queued_at)
+        elif attempts < self.max_attempts and _retryable(error):
+            self.attempts[text_id] = attempts
+            delay = min(self.retry_delay * 2 ** (attempts - 1), RETRY_MAX_DELAY)
+            delay += random.uniform(0, delay / 2)
+            self.not_before[text_id] = time.monotonic() + delay
+            if _status(error) == 429:
+                self._bucket(from_).pause(delay)
+            # Back to the front of its number's lane, so texts stay in order
+            self.lanes.setdefault(from_, deque()).appendleft(text)
+            metrics.inc("sms.retries")
+            print(f"⏳ SMS to {to} via {provider} failed ({error}), retrying in {delay:.1f}s")
+            return
+        else:
+            metrics.inc("sms.failed")
+            print(f"❌ SMS to {to} via {provider} failed after {attempts} attempts:", error)
+        self.attempts.pop(text_id, None)
+        self.not_before.pop(text_id, None)
+        self.finished.add(text_id)
+
+    def stop(self, timeout=SMS_DRAIN_SECONDS):
+        # Give queued texts a chance to go out before the process exits
+        if not self.running:
+            return
+        self.drain_until = time.monotonic() + timeout
+        self.running = False
+        self.wake.set()
+        self.thread.join(timeout + IDLE_WAIT)
+        self.pool.shutdown(wait=False)
+        self.queue.close()
+
+
+def make_sms_dispatcher(twilio_client=None, telnyx=None):
+    # One dispatcher per process, for whichever providers the app uses
+    senders = {}
+    if twilio_client is not None:
+        senders["twilio"] = twilio_sender(twilio_client)
+    if telnyx is not None:
+        senders["telnyx"] = telnyx_sender(telnyx)
+    return SmsDispatcher(senders).start()
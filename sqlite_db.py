@@ -0,0 +1,29 @@
+# sqlite_db.py
+#
+# Connections for the SQLite files shared by threads and gunicorn workers
+# (thread_store.py, webhook_dedup.py, log_sinks.py, chat_engine.py). A
+# sqlite3 connection can't be used from two threads at once, so each thread
+# gets its own: autocommit, and WAL so readers never block the writer.
+#
+#   self._db = per_thread_connection(path)
+#   self._db().execute("SELECT ...")
+
+import sqlite3
+import threading
+
+BUSY_TIMEOUT = 5  # seconds a write waits for another connection's lock
+
+
+def per_thread_connection(path):
+    # connection() -> the calling thread's connection to `path`, opened on first use
+    local = threading.local()
+
+    def connection():
+        conn = getattr(local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            local.conn = conn
+        return conn
+    return connection
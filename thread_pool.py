@@ -0,0 +1,147 @@
+# thread_pool.py
+#
+# Pool of pre-created, empty OpenAI threads so a first-time caller's reply
+# doesn't wait for thread creation. take() is O(1) and never touches the
+# network; a background thread keeps THREAD_POOL_SIZE threads ready and
+# replaces any older than THREAD_POOL_MAX_AGE. reply_for_number()
+# (run_completion.py) takes from the pool before falling back to
+# threads.create.
+#
+# assign() gives a caller a thread speculatively, as soon as /missed-call or
+# /call-status fires for them, so their first text goes straight to
+# runs.create. The courtesy SMS we just sent is added to the thread as an
+# assistant message, so the assistant knows what the customer is replying to.
+# The thread is made and seeded before anyone can see it, without holding
+# the thread store's locks, then published with thread_store.add(); if the
+# caller's first text got them a thread in the meantime, ours is deleted.
+#
+# Thread creation waits behind customer replies for OpenAI capacity
+# (admission.BACKGROUND).
+#
+# Metrics: thread_pool.size (gauge), thread_pool.hits, thread_pool.misses,
+# thread_pool.created, thread_pool.expired, thread_pool.speculative,
+# thread_pool.speculative_lost (the caller got a thread first).
+#
+#   THREAD_POOL_SIZE          threads kept ready per process (default 5, 0 disables)
+#   THREAD_POOL_MAX_AGE       seconds before an unused thread is replaced (default 86400)
+#   THREAD_POOL_SPECULATIVE   "on" (default) or "off": assign threads on missed calls
+
+import os
+import threading
+import time
+from collections import deque
+
+import admission
+import metrics
+
+THREAD_POOL_SIZE = int(os.getenv("THREAD_POOL_SIZE", "5"))
+THREAD_POOL_MAX_AGE = float(os.getenv("THREAD_POOL_MAX_AGE", "86400"))
+THREAD_POOL_SPECULATIVE = os.getenv("THREAD_POOL_SPECULATIVE", "on").lower()
+
+REFILL_RETRY_DELAY = 5.0
+
+
+class ThreadPool:
+    def __init__(self, client, size=THREAD_POOL_SIZE, max_age=THREAD_POOL_MAX_AGE,
+                 speculative=THREAD_POOL_SPECULATIVE != "off"):
+        self.client = client
+        self.size = size
+        self.max_age = max_age
+        self.speculative = speculative
+        self.threads = deque()  # (thread_id, created_at), newest on the right
+        self.lock = threading.Lock()
+        self.wanted = threading.Event()
+        self.refiller = None
+        metrics.set_gauge("thread_pool.size", lambda: len(self.threads))
+
+    def start(self):
+        # Safe to call from any thread, as often as you like (apps with lazy
+        # clients start the pool on the first text)
+        with self.lock:
+            if self.size > 0 and self.refiller is None:
+                self.refiller = threading.Thread(target=self._refill, name="thread-pool", daemon=True)
+                self.refiller.start()
+                self.wanted.set()
+        return self
+
+    def take(self):
+        # A ready thread id, or None if the pool is empty
+        now = time.time()
+        with self.lock:
+            while self.threads:
+                thread_id, created_at = self.threads.pop()
+                if now - created_at <= self.max_age:
+                    metrics.inc("thread_pool.hits")
+                    self.wanted.set()
+                    return thread_id
+                # The newest one is stale, so the rest are too
+                self.threads.append((thread_id, created_at))
+                break
+        metrics.inc("thread_pool.misses")
+        self.wanted.set()
+        return None
+
+    def _expired(self):
+        cutoff = time.time() - self.max_age
+        expired = []
+        with self.lock:
+            while self.threads and self.threads[0][1] < cutoff:
+                expired.append(self.threads.popleft()[0])
+        return expired
+
+    def _refill(self):
+        while True:
+            self.wanted.wait(timeout=min(self.max_age / 4, 300))
+            self.wanted.clear()
+            for thread_id in self._expired():
+                metrics.inc("thread_pool.expired")
+                try:
+                    self.client.beta.threads.delete(thread_id)
+                except Exception:
+                    pass  # an empty thread left behind costs nothing
+            while len(self.threads) < self.size:
+                try:
+                    with admission.slot(admission.BACKGROUND):
+                        thread_id = self.client.beta.threads.create().id
+                except Exception as e:
+                    print("⚠️ Could not pre-create thread:", e)
+                    time.sleep(REFILL_RETRY_DELAY)
+                    break
+                metrics.inc("thread_pool.created")
+                with self.lock:
+                    self.threads.append((thread_id, time.time()))
+
+    def create(self):
+        # A thread id for a new conversation: from the pool, else made now
+        thread_id = self.take()
+        if thread_id:
+            return thread_id
+        with admission.slot(admission.BACKGROUND):
+            return self.client.beta.threads.create().id
+
+    def assign(self, thread_store, number, seed=None):
+        # Give `number` a thread now, in the background; `seed` is the text we
+        # just sent them, recorded in the thread as the assistant's
+        if not self.speculative or not number:
+            return
+        threading.Thread(target=self._assign, args=(thread_store, number, seed), daemon=True).start()
+
+    def _assign(self, thread_store, number, seed):
+        if thread_store.get(number):
+            return  # an ongoing conversation: leave its thread alone
+        try:
+            thread_id = self.create()
+            if seed:
+                self.client.beta.threads.messages.create(thread_id=thread_id, role="assistant", content=seed)
+        except Exception as e:
+            # Their first text will get a thread the usual way
+            print("⚠️ Could not assign thread ahead of time:", e)
+            return
+        if thread_store.add(number, thread_id):
+            metrics.inc("thread_pool.speculative")
+            return
+        metrics.inc("thread_pool.speculative_lost")
+        try:
+            self.client.beta.threads.delete(thread_id)
+        except Exception:
+            pass  # an unused thread left behind costs nothing
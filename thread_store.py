@@ -0,0 +1,314 @@
+# thread_store.py
+#
+# Maps (tenant, phone number) -> OpenAI thread id. Replaces the per-process
+# `user_threads = {}` dicts, which grew forever, were lost on restart and
+# weren't shared between gunicorn workers.
+#
+# Two tiers:
+#   - an in-process LRU cache with a TTL (bounded memory, O(1) lookups)
+#   - SQLite on disk, shared by every worker on the host and kept across
+#     restarts (THREAD_STORE=memory skips it)
+#
+# get_or_create() is atomic across threads *and* worker processes: the first
+# caller claims the row, creates the thread and fills it in; anyone else
+# waits for that thread instead of creating a second one. add() is a
+# compare-and-set for a thread made elsewhere (thread_pool.py's speculative
+# threads): it only lands if the number has no thread and no claim. Rows idle longer
+# than THREAD_TTL_SECONDS are deleted every PRUNE_EVERY new conversations.
+#
+#   THREAD_STORE          "sqlite" (default) or "memory"
+#   THREAD_STORE_PATH     SQLite file (default threads.db)
+#   THREAD_CACHE_SIZE     max numbers kept in the in-process tier (default 10000)
+#   THREAD_TTL_SECONDS    start a fresh thread after this much inactivity (default 30 days)
+#   TENANT_ID             default tenant key (default "default")
+
+import itertools
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from sqlite_db import per_thread_connection
+
+THREAD_STORE = os.getenv("THREAD_STORE", "sqlite").lower()
+THREAD_STORE_PATH = os.getenv("THREAD_STORE_PATH", "threads.db")
+THREAD_CACHE_SIZE = int(os.getenv("THREAD_CACHE_SIZE", "10000"))
+THREAD_TTL_SECONDS = float(os.getenv("THREAD_TTL_SECONDS", str(30 * 24 * 3600)))
+TENANT_ID = os.getenv("TENANT_ID", "default")
+
+CLAIM_TIMEOUT = 30      # a claim older than this is assumed abandoned (worker died)
+TOUCH_INTERVAL = 3600   # write last-used time to SQLite at most this often
+LOCK_STRIPES = 64
+PRUNE_EVERY = 1000      # new rows between sweeps of expired SQLite rows
+
+
+def normalize_number(number):
+    # "whatsapp:+1 (514) 555-0000" and "15145550000" both -> "+15145550000"
+    number = (number or "").strip().lower()
+    if ":" in number:
+        number = number.split(":", 1)[1]
+    digits = re.sub(r"\D", "", number)
+    if len(digits) == 10:  # North American number without country code
+        digits = "1" + digits
+    return "+" + digits if digits else number
+
+
+class LRUTTLCache:
+    def __init__(self, maxsize=THREAD_CACHE_SIZE, ttl=THREAD_TTL_SECONDS):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data = OrderedDict()  # key -> (value, stored_at)
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            item = self.data.get(key)
+            if item is None:
+                return None
+            value, stored_at = item
+            if time.time() - stored_at > self.ttl:
+                del self.data[key]
+                return None
+            self.data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = (value, time.time())
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def pop(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+    def __len__(self):
+        return len(self.data)
+
+
+class MemoryThreadStore:
+    def __init__(self, maxsize=THREAD_CACHE_SIZE, ttl=THREAD_TTL_SECONDS):
+        self.cache = LRUTTLCache(maxsize, ttl)
+        # Striped locks guard the short dict and row updates; a thread is
+        # created under a lock of its own number, so a slow threads.create
+        # only holds up that number
+        self.locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        self.creating = {}  # key -> [lock, holders + waiters]
+
+    def _key(self, number, tenant):
+        return (tenant or TENANT_ID, normalize_number(number))
+
+    def _lock(self, key):
+        return self.locks[hash(key) % LOCK_STRIPES]
+
+    @contextmanager
+    def _number_lock(self, key):
+        # A lock per number, kept only while someone holds or waits for it
+        with self._lock(key):
+            entry = self.creating.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock(key):
+                entry[1] -= 1
+                if not entry[1]:
+                    del self.creating[key]
+
+    def _cached(self, key):
+        # Sliding TTL: every use pushes expiry back
+        thread_id = self.cache.get(key)
+        if thread_id:
+            self.cache.set(key, thread_id)
+        return thread_id
+
+    def get(self, number, tenant=None):
+        return self._cached(self._key(number, tenant))
+
+    def set(self, number, thread_id, tenant=None):
+        self.cache.set(self._key(number, tenant), thread_id)
+
+    def forget(self, number, tenant=None):
+        self.cache.pop(self._key(number, tenant))
+
+    def add(self, number, thread_id, tenant=None):
+        # Compare-and-set: store `thread_id` only if `number` has no thread
+        # and nobody is creating one; True if it was stored
+        key = self._key(number, tenant)
+        with self._lock(key):
+            if key in self.creating or self._cached(key):
+                return False
+            self.cache.set(key, thread_id)
+            return True
+
+    def get_or_create(self, number, create, tenant=None):
+        # `create()` makes a new OpenAI thread and returns its id
+        key = self._key(number, tenant)
+        thread_id = self._cached(key)
+        if thread_id:
+            return thread_id
+        with self._number_lock(key):
+            thread_id = self._cached(key)
+            if not thread_id:
+                thread_id = create()
+                self.cache.set(key, thread_id)
+            return thread_id
+
+
+class SQLiteThreadStore(MemoryThreadStore):
+    def __init__(self, path=THREAD_STORE_PATH, maxsize=THREAD_CACHE_SIZE, ttl=THREAD_TTL_SECONDS):
+        # Cached entries are re-checked against SQLite every TOUCH_INTERVAL so
+        # last_used stays current for the other workers
+        super().__init__(maxsize, min(ttl, TOUCH_INTERVAL))
+        self.path = path
+        self.ttl = ttl
+        self._db = per_thread_connection(path)
+        self.created = itertools.count(1)  # new rows, for PRUNE_EVERY
+        self._db().execute(
+            """
+            CREATE TABLE IF NOT EXISTS threads (
+                tenant      TEXT NOT NULL,
+                number      TEXT NOT NULL,
+                thread_id   TEXT,
+                claimed_at  REAL,
+                last_used   REAL NOT NULL,
+                PRIMARY KEY (tenant, number)
+            )
+            """
+        )
+
+    def _row(self, key):
+        return self._db().execute(
+            "SELECT thread_id, claimed_at, last_used FROM threads WHERE tenant = ? AND number = ?", key
+        ).fetchone()
+
+    def _touch(self, key, thread_id, last_used):
+        now = time.time()
+        if now - last_used > TOUCH_INTERVAL / 2:
+            self._db().execute(
+                "UPDATE threads SET last_used = ? WHERE tenant = ? AND number = ?", (now, *key)
+            )
+        self.cache.set(key, thread_id)
+
+    def get(self, number, tenant=None):
+        key = self._key(number, tenant)
+        thread_id = self.cache.get(key)
+        if thread_id:
+            return thread_id
+        row = self._row(key)
+        if row and row[0] and time.time() - row[2] <= self.ttl:
+            self._touch(key, row[0], row[2])
+            return row[0]
+        return None
+
+    def set(self, number, thread_id, tenant=None):
+        key = self._key(number, tenant)
+        self._db().execute(
+            "INSERT OR REPLACE INTO threads (tenant, number, thread_id, claimed_at, last_used) VALUES (?, ?, ?, NULL, ?)",
+            (*key, thread_id, time.time()),
+        )
+        self.cache.set(key, thread_id)
+        self._new_row()
+
+    def forget(self, number, tenant=None):
+        key = self._key(number, tenant)
+        self._db().execute("DELETE FROM threads WHERE tenant = ? AND number = ?", key)
+        self.cache.pop(key)
+
+    def add(self, number, thread_id, tenant=None):
+        # Only replaces an expired thread or an abandoned claim; a live
+        # thread or a claim in progress (another worker creating one) wins
+        key = self._key(number, tenant)
+        now = time.time()
+        with self._lock(key):
+            cur = self._db().execute(
+                """
+                INSERT INTO threads (tenant, number, thread_id, claimed_at, last_used) VALUES (?, ?, ?, NULL, ?)
+                ON CONFLICT (tenant, number) DO UPDATE SET
+                    thread_id = excluded.thread_id, claimed_at = NULL, last_used = excluded.last_used
+                WHERE (thread_id IS NULL AND claimed_at < ?) OR (thread_id IS NOT NULL AND last_used < ?)
+                """,
+                (*key, thread_id, now, now - CLAIM_TIMEOUT, now - self.ttl),
+            )
+            if cur.rowcount != 1:
+                return False
+            self.cache.set(key, thread_id)
+        self._new_row()
+        return True
+
+    def _claim(self, key):
+        # True if this process now owns creating the thread for `key`
+        db = self._db()
+        now = time.time()
+        cur = db.execute(
+            "INSERT OR IGNORE INTO threads (tenant, number, thread_id, claimed_at, last_used) VALUES (?, ?, NULL, ?, ?)",
+            (*key, now, now),
+        )
+        if cur.rowcount == 1:
+            self._new_row()
+            return True
+        # Take over an abandoned claim or an expired thread
+        cur = db.execute(
+            """
+            UPDATE threads SET thread_id = NULL, claimed_at = ?, last_used = ?
+            WHERE tenant = ? AND number = ?
+              AND ((thread_id IS NULL AND claimed_at < ?) OR (thread_id IS NOT NULL AND last_used < ?))
+            """,
+            (now, now, *key, now - CLAIM_TIMEOUT, now - self.ttl),
+        )
+        return cur.rowcount == 1
+
+    def get_or_create(self, number, create, tenant=None):
+        key = self._key(number, tenant)
+        thread_id = self.cache.get(key)
+        if thread_id:
+            return thread_id
+
+        with self._number_lock(key):
+            deadline = time.time() + CLAIM_TIMEOUT
+            while True:
+                row = self._row(key)
+                if row and row[0] and time.time() - row[2] <= self.ttl:
+                    self._touch(key, row[0], row[2])
+                    return row[0]
+
+                if self._claim(key):
+                    try:
+                        thread_id = create()
+                    except Exception:
+                        self._db().execute(
+                            "DELETE FROM threads WHERE tenant = ? AND number = ? AND thread_id IS NULL", key
+                        )
+                        raise
+                    self._db().execute(
+                        "UPDATE threads SET thread_id = ?, claimed_at = NULL, last_used = ? WHERE tenant = ? AND number = ?",
+                        (thread_id, time.time(), *key),
+                    )
+                    self.cache.set(key, thread_id)
+                    return thread_id
+
+                # Another worker is creating this thread right now
+                if time.time() > deadline:
+                    raise TimeoutError(f"Timed out waiting for thread for {key[1]}")
+                time.sleep(0.05)
+
+    def _new_row(self):
+        # Sweep expired rows every PRUNE_EVERY new conversations, so the
+        # table tracks the active callers rather than everyone who ever texted
+        if next(self.created) % PRUNE_EVERY == 0:
+            self.prune()
+
+    def prune(self):
+        # Drop rows for conversations idle longer than the TTL
+        cur = self._db().execute("DELETE FROM threads WHERE last_used < ?", (time.time() - self.ttl,))
+        return cur.rowcount
+
+
+def make_thread_store():
+    if THREAD_STORE == "memory":
+        return MemoryThreadStore()
+    return SQLiteThreadStore()
@@ -0,0 +1,124 @@
+# tool_registry.py
+#
+# Function tools for assistant runs. Each tool is registered with its OpenAI
+# definition (the entries of an app's TOOLS list) and a handler taking the
+# call's parsed JSON arguments as a dict. handle() is the `tool_handler` for
+# run_completion.py: every tool call in a run step starts at once on a shared
+# thread pool, each is given its own timeout, and the outputs come back as
+# one list, which run_completion submits in a single submit_tool_outputs
+# request. A step with three lookups costs the slowest lookup, not the sum.
+#
+# A tool that raises, times out or isn't registered gets an "Error: ..."
+# output instead of failing the run, so the assistant can still answer. A
+# timed-out handler can't be interrupted; it finishes in the background on
+# its worker and its result is dropped.
+#
+#   tools = ToolRegistry()
+#   tools.register(TOOLS[0], lambda args: safe_calculate(args.get("expression", "")))
+#   reply_in_thread(..., tools=tools.definitions, tool_handler=tools.handle)
+#
+# Metrics: tools.calls, tools.errors, tools.timeouts, tools.<name> (timer).
+#
+#   TOOL_WORKERS   threads running tool handlers, per process (default 8)
+#   TOOL_TIMEOUT   default seconds per tool call (default 5)
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+import metrics
+
+TOOL_WORKERS = int(os.getenv("TOOL_WORKERS", "8"))
+TOOL_TIMEOUT = float(os.getenv("TOOL_TIMEOUT", "5"))
+
+
+class Tool:
+    def __init__(self, definition, handler, timeout):
+        self.definition = definition
+        self.name = definition["function"]["name"]
+        self.handler = handler
+        self.timeout = timeout
+
+    def __call__(self, arguments):
+        with metrics.timer(f"tools.{self.name}"):
+            return self.handler(arguments)
+
+
+def parse_tool_arguments(arguments):
+    # A tool call's JSON arguments as a dict ({} if they aren't valid JSON)
+    try:
+        parsed = json.loads(arguments or "{}")
+    except (TypeError, ValueError):
+        return {}
+    return parsed if isinstance(parsed, dict) else {}
+
+
+def _output(result):
+    if isinstance(result, str):
+        return result
+    if isinstance(result, (dict, list)):
+        return json.dumps(result)
+    return str(result)
+
+
+class ToolRegistry:
+    def __init__(self, workers=TOOL_WORKERS, timeout=TOOL_TIMEOUT):
+        self.workers = workers
+        self.timeout = timeout
+        self.tools = {}
+        self.executor = None
+        self.lock = threading.Lock()
+
+    def register(self, definition, handler, timeout=None):
+        # `definition` is the OpenAI tool dict ({"type": "function", ...});
+        # `handler(arguments)` returns the output (str, number or JSON-able)
+        tool = Tool(definition, handler, timeout or self.timeout)
+        self.tools[tool.name] = tool
+        return tool
+
+    @property
+    def definitions(self):
+        return [tool.definition for tool in self.tools.values()]
+
+    def _pool(self):
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="tool")
+            return self.executor
+
+    def handle(self, tool_calls):
+        # Outputs for every call in a run step, in call order
+        pool = self._pool()
+        started = time.monotonic()
+        pending = []
+        for tool_call in tool_calls:
+            metrics.inc("tools.calls")
+            tool = self.tools.get(tool_call.function.name)
+            if tool is None:
+                pending.append((tool_call, None, f"Error: unknown tool {tool_call.function.name}"))
+                continue
+            future = pool.submit(tool, parse_tool_arguments(tool_call.function.arguments))
+            pending.append((tool_call, tool, future))
+
+        outputs = []
+        for tool_call, tool, future in pending:
+            if tool is None:
+                metrics.inc("tools.errors")
+                output = future
+            else:
+                # Timeouts count from when the step started, so calls that ran
+                # side by side don't wait on each other's budgets
+                try:
+                    output = _output(future.result(timeout=max(started + tool.timeout - time.monotonic(), 0)))
+                except FutureTimeout:
+                    metrics.inc("tools.timeouts")
+                    output = f"Error: {tool.name} timed out"
+                except Exception as e:
+                    metrics.inc("tools.errors")
+                    print(f"⚠️ Tool {tool.name} failed:", e)
+                    output = f"Error: {tool.name} failed"
+            outputs.append({"tool_call_id": tool_call.id, "output": output})
+        return outputs
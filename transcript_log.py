@@ -0,0 +1,148 @@
+# transcript_log.py
+#
+# Writer for the "one row per conversation" sheet layout used by app3,
+# app3.5, app3.55 and test.py, where column D holds the running transcript.
+#
+# The old log_to_sheet called get_all_records() on every message to find the
+# caller's row (downloading the whole tab), then read that cell and wrote it
+# back with the new turn on the end: O(rows) + O(transcript) per message, and
+# it failed outright once the cell hit Sheets' 50,000-character limit.
+#
+# Now:
+#   - a (source, handle) -> row index per monthly tab is loaded once (columns
+#     B:C only) and kept current as rows are appended; appends outside the
+#     service are detected the same way as handle_index.py and trigger a reload
+#   - the text of each conversation's last cell is cached, so adding a turn
+#     is a single write with no read (a cache miss reads just that one cell).
+#     Sheets has no "append to cell" call, so the write still carries the
+#     whole cell, but that cell is bounded, see below
+#   - once a cell would go past TRANSCRIPT_CELL_LIMIT characters the
+#     conversation rolls over to a continuation row, which becomes the one
+#     new turns go to
+#
+# TranscriptLogWriter puts this layout behind SheetLogWriter, so these apps
+# get the same journaled, background, retrying writes as app4.5/app5.
+#
+#   TRANSCRIPT_CELL_LIMIT    max characters per transcript cell (default 45000)
+#   TRANSCRIPT_CACHE_SIZE    conversations whose last cell is kept in memory (default 2000)
+
+import os
+import threading
+
+import metrics
+from handle_index import HANDLE_INDEX_MAX_AGE, HandleIndex, TabIndex, first_row, normalize_handle
+from sheet_log_writer import SheetLogWriter
+from thread_store import LRUTTLCache
+
+TRANSCRIPT_CELL_LIMIT = int(os.getenv("TRANSCRIPT_CELL_LIMIT", "45000"))
+TRANSCRIPT_CACHE_SIZE = int(os.getenv("TRANSCRIPT_CACHE_SIZE", "2000"))
+
+CONTINUED = "(continued)\n"
+LOCK_STRIPES = 64
+
+
+def _key(source, handle):
+    return (normalize_handle(str(source)), normalize_handle(str(handle)))
+
+
+class RowIndex(HandleIndex):
+    # Like HandleIndex, but remembers each conversation's last row
+
+    def load(self, title, rows):
+        # `rows` is columns B:C as read from the sheet, header included
+        tails = {}
+        for row_number, row in enumerate(rows[1:], start=2):
+            if len(row) >= 2:
+                tails[_key(row[0], row[1])] = row_number
+        with self.lock:
+            self.tabs[title] = TabIndex(tails, len(rows))
+        metrics.inc("sheets.handle_index_loads")
+        print(f"📇 Indexed {len(tails)} conversations in '{title}'")
+
+    def ensure(self, sheet):
+        if self.needs_load(sheet.title):
+            self.load(sheet.title, sheet.get("B:C"))
+
+    def tail(self, title, key):
+        with self.lock:
+            tab = self.tabs.get(title)
+            return tab.handles.get(key) if tab else None
+
+    def set_tail(self, title, key, row):
+        with self.lock:
+            tab = self.tabs.get(title)
+            if tab:
+                tab.handles[key] = row
+
+
+class TranscriptLog:
+    def __init__(self, cell_limit=TRANSCRIPT_CELL_LIMIT, cache_size=TRANSCRIPT_CACHE_SIZE):
+        self.cell_limit = cell_limit
+        self.rows = RowIndex()
+        self.cells = LRUTTLCache(cache_size, HANDLE_INDEX_MAX_AGE)  # (title, row) -> cell text
+        # One writer per conversation at a time, or two turns could both
+        # extend the same old text and one would be lost
+        self.locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+
+    def _append(self, sheet, row):
+        self.rows.appending(sheet.title)
+        response = sheet.append_rows([row])
+        self.rows.appended(sheet.title, response, 1)
+        return first_row(response)
+
+    def log(self, sheet, platform, handle, now, entry, dedupe=False):
+        # Add `entry` to the conversation's transcript in `sheet`; with
+        # `dedupe`, skip it if it's already there (replaying after an error)
+        entry = entry[: self.cell_limit - len(CONTINUED)]  # a single huge turn still has to fit
+        key = _key(platform, handle)
+        with self.locks[hash(key) % LOCK_STRIPES]:
+            self.rows.ensure(sheet)
+            row = self.rows.tail(sheet.title, key)
+
+            if row is None:
+                row = self._append(sheet, [now, platform, handle, entry])
+                print(f"🆕 New conversation row for {handle}")
+            else:
+                text = self.cells.get((sheet.title, row))
+                if text is None:
+                    text = sheet.cell(row, 4).value or ""
+                if dedupe and entry in text:
+                    return
+                if len(text) + len(entry) <= self.cell_limit:
+                    text += entry
+                    sheet.update_cell(row, 4, text)
+                    self.cells.set((sheet.title, row), text)
+                    return
+                self.cells.pop((sheet.title, row))
+                row = self._append(sheet, [now, platform, handle, CONTINUED + entry])
+                print(f"📄 Transcript for {handle} continued on a new row")
+                entry = CONTINUED + entry
+
+            if row is not None:
+                self.rows.set_tail(sheet.title, key, row)
+                self.cells.set((sheet.title, row), entry)
+
+    def invalidate(self):
+        # After an error: re-index and re-read cells on the next message
+        self.rows.invalidate()
+        self.cells = LRUTTLCache(self.cells.maxsize, self.cells.ttl)
+
+
+class TranscriptLogWriter(SheetLogWriter):
+    def __init__(self, session, transcripts=None, **kwargs):
+        super().__init__(session, **kwargs)
+        self.transcripts = transcripts or TranscriptLog()
+
+    def _unwritten(self, sheet, batch):
+        return batch  # checked per turn by TranscriptLog.log(dedupe=True)
+
+    def _write_sheet(self, sheet, batch):
+        # One cell update per turn; a batch that fails part-way is replayed
+        # with dedupe so the turns that did land aren't written twice
+        for _, now, platform, handle, user_msg, ai_reply, *_ in batch:
+            entry = f"[{now}] User: {user_msg}\n[{now}] AI: {ai_reply}\n"
+            self.transcripts.log(sheet, platform, handle, now, entry, dedupe=self.recovering)
+        return len(batch)
+
+    def _failed(self, month):
+        self.transcripts.invalidate()
@@ -0,0 +1,266 @@
+# turn_journal.py
+#
+# Durable queue of conversation turns waiting to be written to a background
+# log sink (Google Sheets, the Parquet archive; see log_sinks.py). Every turn
+# is appended to a local JSONL segment file before anything talks to Sheets,
+# so a Sheets outage (or a crash/restart) delays the log instead of losing
+# it; the sink's writer drains the journal in order and only advances past a
+# batch once it has been written.
+#
+# Writes go to the OS straight away and a background thread fsyncs them every
+# TURN_JOURNAL_FSYNC_SECONDS, so logging never waits on the disk and one
+# fsync covers every turn queued in that window (a power loss can cost at
+# most that window). TURN_JOURNAL_FSYNC_SECONDS=0 fsyncs on every write.
+#
+# Layout: TURN_JOURNAL_DIR/<sink>/<pid>/ holds numbered segments (a new one every
+# TURN_JOURNAL_SEGMENT_BYTES) plus a checkpoint file with the read position;
+# fully-written segments are deleted. Each process owns its own directory
+# (gunicorn workers don't share a file) and holds a lock on it while alive; a
+# process that starts up adopts the journals of processes that died with
+# turns still queued.
+#
+#   TURN_JOURNAL                "on" (default) or "off" (in-memory queue only)
+#   TURN_JOURNAL_DIR            default "turn_journal"
+#   TURN_JOURNAL_FSYNC_SECONDS  default 0.05
+#   TURN_JOURNAL_SEGMENT_BYTES  default 8 MB
+#
+# MemoryTurnQueue is the non-durable version with the same interface (and
+# the old behaviour: bounded, oldest turns shed when full).
+
+import atexit
+import fcntl
+import json
+import os
+import shutil
+import threading
+import time
+from collections import deque
+from itertools import islice
+
+import metrics
+
+TURN_JOURNAL = os.getenv("TURN_JOURNAL", "on").lower()
+TURN_JOURNAL_DIR = os.getenv("TURN_JOURNAL_DIR", "turn_journal")
+TURN_JOURNAL_FSYNC_SECONDS = float(os.getenv("TURN_JOURNAL_FSYNC_SECONDS", "0.05"))
+TURN_JOURNAL_SEGMENT_BYTES = int(os.getenv("TURN_JOURNAL_SEGMENT_BYTES", str(8 * 1024 * 1024)))
+SHEETS_MAX_BUFFER = int(os.getenv("SHEETS_MAX_BUFFER", "10000"))
+
+
+class MemoryTurnQueue:
+    def __init__(self, max_buffer=SHEETS_MAX_BUFFER, name="sheets"):
+        self.max_buffer = max_buffer
+        self.name = name
+        self.buffer = deque()
+        self.lock = threading.Lock()
+
+    def put(self, turn):
+        with self.lock:
+            if len(self.buffer) >= self.max_buffer:
+                # Sheets has been unreachable for a long time; shed the oldest
+                self.buffer.popleft()
+                metrics.inc(f"{self.name}.turns_dropped")
+                print(f"⚠️ {self.name} log buffer full, dropping oldest turn")
+            self.buffer.append(turn)
+
+    def peek(self, limit):
+        # Oldest `limit` turns, left in the queue until ack()
+        with self.lock:
+            return list(islice(self.buffer, limit))
+
+    def ack(self, batch):
+        # Drop a peeked batch once it's written (skipping any turns shed meanwhile)
+        with self.lock:
+            for turn in batch:
+                if self.buffer and self.buffer[0] is turn:
+                    self.buffer.popleft()
+
+    def close(self):
+        pass
+
+    def __len__(self):
+        return len(self.buffer)
+
+
+class TurnJournal:
+    def __init__(self, root=TURN_JOURNAL_DIR, fsync_interval=TURN_JOURNAL_FSYNC_SECONDS,
+                 segment_bytes=TURN_JOURNAL_SEGMENT_BYTES):
+        self.root = root
+        self.dir = os.path.join(root, str(os.getpid()))
+        self.fsync_interval = fsync_interval
+        self.segment_bytes = segment_bytes
+        self.lock = threading.Lock()
+        self.closed = False
+
+        os.makedirs(self.dir, exist_ok=True)
+        self.owner = open(os.path.join(self.dir, "lock"), "w")
+        fcntl.flock(self.owner, fcntl.LOCK_EX)
+
+        # Read position: (segment number, byte offset)
+        self.cursor = self._load_checkpoint(self.dir)
+        self.pending = sum(1 for _ in self._records(self.dir, self.cursor))
+        self.peeked = []  # end positions of the turns returned by the last peek()
+
+        segments = self._segments(self.dir)
+        self.segment = (segments[-1] + 1) if segments else self.cursor[0]
+        self.fh = open(self._path(self.dir, self.segment), "a", encoding="utf-8")
+        self.dirty = False
+
+        self._adopt_orphans()
+
+        metrics.set_gauge(f"journal.{os.path.basename(os.path.normpath(root))}.pending", lambda: self.pending)
+        if self.fsync_interval > 0:
+            threading.Thread(target=self._sync_loop, name="turn-journal-fsync", daemon=True).start()
+        atexit.register(self.close)
+
+    # — files
+
+    @staticmethod
+    def _path(directory, segment):
+        return os.path.join(directory, f"{segment:08d}.jsonl")
+
+    @staticmethod
+    def _segments(directory):
+        return sorted(int(name[:-6]) for name in os.listdir(directory) if name.endswith(".jsonl"))
+
+    @staticmethod
+    def _load_checkpoint(directory):
+        try:
+            with open(os.path.join(directory, "checkpoint")) as f:
+                position = json.load(f)
+            return position["segment"], position["offset"]
+        except (OSError, ValueError, KeyError):
+            segments = TurnJournal._segments(directory)
+            return (segments[0] if segments else 0), 0
+
+    def _save_checkpoint(self):
+        tmp = os.path.join(self.dir, "checkpoint.tmp")
+        with open(tmp, "w") as f:
+            json.dump({"segment": self.cursor[0], "offset": self.cursor[1]}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, os.path.join(self.dir, "checkpoint"))
+
+    @classmethod
+    def _records(cls, directory, cursor, active=None):
+        # Yields (turn, (segment, end offset)) from `cursor` on. A torn last
+        # line (crash mid-write) is skipped in closed segments and treated as
+        # not written yet in the `active` one.
+        start_segment, offset = cursor
+        for segment in cls._segments(directory):
+            if segment < start_segment:
+                continue
+            with open(cls._path(directory, segment), "rb") as f:
+                f.seek(offset if segment == start_segment else 0)
+                position = f.tell()
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        if segment == active:
+                            return
+                        break
+                    position += len(line)
+                    try:
+                        turn = tuple(json.loads(line))
+                    except ValueError:
+                        metrics.inc("journal.corrupt_records")
+                        continue
+                    yield turn, (segment, position)
+
+    def _adopt_orphans(self):
+        # Move queued turns from journals whose process has died into ours
+        for name in os.listdir(self.root):
+            directory = os.path.join(self.root, name)
+            if directory == self.dir or not os.path.isdir(directory):
+                continue
+            try:
+                owner = open(os.path.join(directory, "lock"), "a")
+            except OSError:
+                continue
+            try:
+                fcntl.flock(owner, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                owner.close()  # still alive
+                continue
+            adopted = 0
+            for turn, _ in self._records(directory, self._load_checkpoint(directory)):
+                self.put(turn)
+                adopted += 1
+            self.sync()
+            shutil.rmtree(directory, ignore_errors=True)
+            owner.close()
+            if adopted:
+                print(f"📥 Adopted {adopted} queued turns from journal {name}")
+
+    # — writing
+
+    def put(self, turn):
+        line = json.dumps(turn, ensure_ascii=False) + "\n"
+        with self.lock:
+            self.fh.write(line)
+            self.fh.flush()
+            self.pending += 1
+            self.dirty = True
+            if self.fh.tell() >= self.segment_bytes:
+                os.fsync(self.fh.fileno())
+                self.fh.close()
+                self.segment += 1
+                self.fh = open(self._path(self.dir, self.segment), "a", encoding="utf-8")
+        metrics.inc("journal.appended")
+        if self.fsync_interval <= 0:
+            self.sync()
+
+    def sync(self):
+        with self.lock:
+            if not self.dirty or self.fh.closed:
+                return
+            self.dirty = False
+            fd = self.fh.fileno()
+        with metrics.timer("journal.fsync"):
+            os.fsync(fd)
+
+    def _sync_loop(self):
+        while not self.closed:
+            time.sleep(self.fsync_interval)
+            try:
+                self.sync()
+            except (OSError, ValueError):
+                pass  # segment rotated/closed underneath us; the next pass catches up
+
+    # — reading (single consumer: the sheet writer thread)
+
+    def peek(self, limit):
+        turns, self.peeked = [], []
+        records = self._records(self.dir, self.cursor, active=self.segment)
+        for turn, end in islice(records, limit):
+            turns.append(turn)
+            self.peeked.append(end)
+        return turns
+
+    def ack(self, batch):
+        if not batch:
+            return
+        with self.lock:
+            self.cursor = self.peeked[len(batch) - 1]
+            self.pending = max(self.pending - len(batch), 0)
+        self._save_checkpoint()
+        for segment in self._segments(self.dir):
+            if segment < self.cursor[0]:
+                os.remove(self._path(self.dir, segment))
+
+    def close(self):
+        if self.closed:
+            return
+        self.sync()
+        self.closed = True
+        with self.lock:
+            self.fh.close()
+        self.owner.close()  # releases the directory lock
+
+    def __len__(self):
+        return self.pending
+
+
+def make_turn_queue(name="sheets"):
+    # Each sink drains its own journal, TURN_JOURNAL_DIR/<name>
+    if TURN_JOURNAL == "off":
+        return MemoryTurnQueue(name=name)
+    return TurnJournal(os.path.join(TURN_JOURNAL_DIR, name))
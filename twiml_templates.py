@@ -0,0 +1,116 @@
+# twiml_templates.py
+#
+# Precompiled TwiML for the webhook responses. /voice, /missed-call and the
+# empty-body branch of /sms-reply used to build a VoiceResponse /
+# MessagingResponse tree and serialize it through ElementTree on every call,
+# though their XML only depends on config (FORWARD_TO_NUMBER). TwimlTemplates
+# renders those once, with the twilio helpers so the bytes are exactly what
+# they produce, and renders them again on reload() or when FORWARD_TO_NUMBER
+# no longer matches the value they were rendered with (load_dotenv(override=
+# True), a settings change). Dynamic replies (the AI text in /sms-reply) are
+# escaped the way ElementTree escapes text and spliced into a prebuilt
+# <Message>, without building a tree.
+#
+#   TWIML_TEMPLATES   "on" (default) or "off" (build with the twilio helpers on every call)
+#
+#   twiml = TwimlTemplates()
+#   return Response(twiml.voice(), mimetype="application/xml")
+#   return Response(twiml.message(reply), mimetype="application/xml")
+
+import os
+
+from twilio.twiml.messaging_response import MessagingResponse
+from twilio.twiml.voice_response import VoiceResponse
+
+TWIML_TEMPLATES = os.getenv("TWIML_TEMPLATES", "on").lower()
+
+MISSED_CALL_SAY = "Thank you for calling. We’ll text you shortly."
+HOLD_SAY = "Please hold while we connect your call."
+UNAVAILABLE_SAY = "Sorry, we’re currently unavailable to take your call."
+NOT_UNDERSTOOD = "Sorry, we couldn't understand your message. Please try again."
+
+_MESSAGE_OPEN = '<?xml version="1.0" encoding="UTF-8"?><Response><Message>'.encode()
+_MESSAGE_CLOSE = "</Message></Response>".encode()
+
+
+def escape_text(text):
+    # What ElementTree does to element text (attributes aren't needed here)
+    if "&" in text:
+        text = text.replace("&", "&amp;")
+    if "<" in text:
+        text = text.replace("<", "&lt;")
+    if ">" in text:
+        text = text.replace(">", "&gt;")
+    return text
+
+
+# — the twilio helpers, used to render the templates (and for TWIML_TEMPLATES=off)
+
+def build_voice(forward_to):
+    response = VoiceResponse()
+    response.say(HOLD_SAY, voice="alice")
+    if forward_to:
+        response.dial(forward_to)
+    else:
+        response.say(UNAVAILABLE_SAY)
+    return str(response).encode()
+
+
+def build_missed_call():
+    response = VoiceResponse()
+    response.say(MISSED_CALL_SAY, voice="alice")
+    return str(response).encode()
+
+
+def build_message(text=None):
+    # <Response><Message>text</Message></Response>, or an empty <Response /> for None
+    twiml = MessagingResponse()
+    if text is not None:
+        twiml.message(text)
+    return str(twiml).encode()
+
+
+class TwimlTemplates:
+    def __init__(self, enabled=TWIML_TEMPLATES != "off"):
+        self.enabled = enabled
+        self.forward_to = None
+        self.reload()
+
+    def reload(self):
+        # Render the static responses for the current config
+        forward_to = os.getenv("FORWARD_TO_NUMBER")
+        self._voice = build_voice(forward_to)
+        self._missed_call = build_missed_call()
+        self._empty = build_message()
+        self._empty_message = build_message("")
+        self._not_understood = build_message(NOT_UNDERSTOOD)
+        if self.forward_to is not None and forward_to != self.forward_to:
+            print(f"🔁 TwiML re-rendered for FORWARD_TO_NUMBER={forward_to}")
+        self.forward_to = forward_to or ""
+
+    def voice(self):
+        # Forward the call to FORWARD_TO_NUMBER, or apologise if there isn't one
+        forward_to = os.getenv("FORWARD_TO_NUMBER")
+        if not self.enabled:
+            return build_voice(forward_to)
+        if (forward_to or "") != self.forward_to:
+            self.reload()
+        return self._voice
+
+    def missed_call(self):
+        return self._missed_call if self.enabled else build_missed_call()
+
+    def empty(self):
+        # Acknowledge a text without replying (the reply is sent later)
+        return self._empty if self.enabled else build_message()
+
+    def not_understood(self):
+        return self._not_understood if self.enabled else build_message(NOT_UNDERSTOOD)
+
+    def message(self, text):
+        # Reply to a text with `text`
+        if not self.enabled:
+            return build_message(text or "")
+        if not text:
+            return self._empty_message
+        return _MESSAGE_OPEN + escape_text(text).encode() + _MESSAGE_CLOSE
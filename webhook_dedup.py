@@ -0,0 +1,321 @@
+# webhook_dedup.py
+#
+# Twilio and Telnyx redeliver a webhook when we're slow to answer it, and a
+# redelivered /sms-reply used to rerun the whole pipeline: another OpenAI
+# run, duplicate log rows, a second text. dedup_webhooks(app, webhooks)
+# makes webhook handling idempotent:
+#
+#   - each POST is keyed on its route plus the provider's id for the event
+#     (MessageSid / CallSid + CallStatus for Twilio, the event id for
+#     Telnyx); the first delivery claims the key and its response is kept
+#     for WEBHOOK_DEDUP_TTL
+#   - a redelivery gets that response back without running the handler. If
+#     the first delivery is still being handled, it waits for it (up to
+#     WEBHOOK_DEDUP_WAIT) rather than starting a second run, then answers
+#     with an empty 200
+#   - a delivery that fails (an exception or a 5xx) releases its key, so the
+#     provider's retry is handled from scratch
+#
+# webhooks.allow_outreach(number) is the per-caller suppression window for
+# texts we start ourselves: /missed-call and /call-status often both fire for
+# the same call, and only the first "sorry we missed you" text within
+# OUTREACH_WINDOW_SECONDS goes out. If that text can't be sent,
+# webhooks.release_outreach(number) gives the window back.
+#
+# Two backends, like thread_store.py: a bounded in-process LRU (per worker),
+# or SQLite shared by every worker on the host (the default).
+#
+# Metrics: webhooks.dedup (lookup time, including any wait), webhooks.duplicates,
+# webhooks.in_progress (redeliveries answered while the first was still
+# running), webhooks.outreach_suppressed.
+#
+# adedup_webhooks(app, webhooks) is the Quart version; its index calls run in
+# worker threads (asyncio.to_thread) so SQLite never blocks the event loop.
+#
+#   WEBHOOK_DEDUP              "sqlite" (default), "memory" or "off"
+#   WEBHOOK_DEDUP_PATH         SQLite file (default webhooks.db)
+#   WEBHOOK_DEDUP_SIZE         max keys kept by the memory backend (default 10000)
+#   WEBHOOK_DEDUP_TTL          seconds a response is kept (default 86400)
+#   WEBHOOK_DEDUP_WAIT         seconds a redelivery waits for the first delivery (default 10)
+#   OUTREACH_WINDOW_SECONDS    one missed-call text per caller per window (default 600)
+
+import asyncio
+import json
+import os
+import threading
+import time
+
+import metrics
+from sqlite_db import per_thread_connection
+from thread_store import LRUTTLCache, normalize_number
+
+WEBHOOK_DEDUP = os.getenv("WEBHOOK_DEDUP", "sqlite").lower()
+WEBHOOK_DEDUP_PATH = os.getenv("WEBHOOK_DEDUP_PATH", "webhooks.db")
+WEBHOOK_DEDUP_SIZE = int(os.getenv("WEBHOOK_DEDUP_SIZE", "10000"))
+WEBHOOK_DEDUP_TTL = float(os.getenv("WEBHOOK_DEDUP_TTL", "86400"))
+WEBHOOK_DEDUP_WAIT = float(os.getenv("WEBHOOK_DEDUP_WAIT", "10"))
+OUTREACH_WINDOW_SECONDS = float(os.getenv("OUTREACH_WINDOW_SECONDS", "600"))
+
+CLAIM_TIMEOUT = 60      # a claim older than this is assumed abandoned (worker died)
+POLL_INTERVAL = 0.05
+PRUNE_EVERY = 1000      # claims between sweeps of expired SQLite rows
+
+
+def webhook_key(path, form, payload=None):
+    # Identity of one webhook event, or None if it doesn't carry one
+    event_id = form.get("MessageSid") or form.get("SmsSid") or form.get("CallSid")
+    if event_id and form.get("CallStatus"):
+        event_id += ":" + form.get("CallStatus")  # status callbacks reuse the CallSid
+    if not event_id and isinstance(payload, dict):
+        event_id = (payload.get("data") or {}).get("id")  # Telnyx event id
+    return f"{path}:{event_id}" if event_id else None
+
+
+class _WebhookIndex:
+    # begin(key) -> (claimed, response): (True, None) to handle the webhook,
+    # (False, response) for a redelivery of a finished one, (False, None)
+    # while the first delivery is still being handled
+
+    def check(self, key, wait=WEBHOOK_DEDUP_WAIT):
+        # begin(), waiting out a first delivery that's still in progress
+        deadline = time.monotonic() + wait
+        while True:
+            claimed, response = self.begin(key)
+            if claimed or response is not None or time.monotonic() >= deadline:
+                return claimed, response
+            time.sleep(POLL_INTERVAL)
+
+    async def acheck(self, key, wait=WEBHOOK_DEDUP_WAIT):
+        # check() for the event loop: the lookups run in a worker thread
+        deadline = time.monotonic() + wait
+        while True:
+            claimed, response = await asyncio.to_thread(self.begin, key)
+            if claimed or response is not None or time.monotonic() >= deadline:
+                return claimed, response
+            await asyncio.sleep(POLL_INTERVAL)
+
+    def allow_outreach(self, number, kind="missed-call"):
+        # True for the first `kind` text to `number` within the window
+        if self.claim_once(f"outreach:{kind}:{normalize_number(number)}", OUTREACH_WINDOW_SECONDS):
+            return True
+        metrics.inc("webhooks.outreach_suppressed")
+        print(f"🤫 Already texted {number} ({kind}) recently, not texting again")
+        return False
+
+    def release_outreach(self, number, kind="missed-call"):
+        # The text allow_outreach() let through wasn't sent: let the next one go
+        self.release_once(f"outreach:{kind}:{normalize_number(number)}")
+
+
+class NoWebhookIndex(_WebhookIndex):
+    # WEBHOOK_DEDUP=off: every delivery is handled
+    def begin(self, key):
+        return True, None
+
+    def finish(self, key, response):
+        pass
+
+    def abandon(self, key):
+        pass
+
+    def claim_once(self, key, ttl):
+        return True
+
+    def release_once(self, key):
+        pass
+
+
+class MemoryWebhookIndex(_WebhookIndex):
+    def __init__(self, maxsize=WEBHOOK_DEDUP_SIZE, ttl=WEBHOOK_DEDUP_TTL):
+        self.cache = LRUTTLCache(maxsize, ttl)  # key -> (response or None while in progress, claimed_at)
+        self.outreach = LRUTTLCache(maxsize, OUTREACH_WINDOW_SECONDS)
+        self.lock = threading.Lock()
+
+    def begin(self, key):
+        with self.lock:
+            entry = self.cache.get(key)
+            if entry is None or (entry[0] is None and time.time() - entry[1] > CLAIM_TIMEOUT):
+                self.cache.set(key, (None, time.time()))
+                return True, None
+            return False, entry[0]
+
+    def finish(self, key, response):
+        self.cache.set(key, (response, time.time()))
+
+    def abandon(self, key):
+        with self.lock:
+            entry = self.cache.get(key)
+            if entry is not None and entry[0] is None:
+                self.cache.pop(key)
+
+    def claim_once(self, key, ttl):
+        with self.lock:
+            if self.outreach.get(key):
+                return False
+            self.outreach.set(key, True)
+            return True
+
+    def release_once(self, key):
+        self.outreach.pop(key)
+
+
+class SQLiteWebhookIndex(_WebhookIndex):
+    def __init__(self, path=WEBHOOK_DEDUP_PATH, ttl=WEBHOOK_DEDUP_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._db = per_thread_connection(path)
+        self.claims = 0
+        self._db().execute(
+            """
+            CREATE TABLE IF NOT EXISTS webhooks (
+                key         TEXT PRIMARY KEY,
+                response    TEXT,
+                claimed_at  REAL NOT NULL,
+                expires_at  REAL NOT NULL
+            )
+            """
+        )
+
+    def _claim(self, key, ttl, response=None):
+        # True if this process now owns `key`: new, expired, or abandoned
+        db = self._db()
+        now = time.time()
+        cur = db.execute(
+            "INSERT OR IGNORE INTO webhooks (key, response, claimed_at, expires_at) VALUES (?, ?, ?, ?)",
+            (key, response, now, now + ttl),
+        )
+        if cur.rowcount == 1:
+            self.claims += 1
+            if self.claims % PRUNE_EVERY == 0:
+                self.prune()
+            return True
+        cur = db.execute(
+            """
+            UPDATE webhooks SET response = ?, claimed_at = ?, expires_at = ?
+            WHERE key = ? AND (expires_at < ? OR (response IS NULL AND claimed_at < ?))
+            """,
+            (response, now, now + ttl, key, now, now - CLAIM_TIMEOUT),
+        )
+        return cur.rowcount == 1
+
+    def begin(self, key):
+        if self._claim(key, self.ttl):
+            return True, None
+        row = self._db().execute("SELECT response FROM webhooks WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return self._claim(key, self.ttl), None  # released in between
+        return False, json.loads(row[0]) if row[0] else None
+
+    def finish(self, key, response):
+        self._db().execute(
+            "UPDATE webhooks SET response = ?, expires_at = ? WHERE key = ?",
+            (json.dumps(response), time.time() + self.ttl, key),
+        )
+
+    def abandon(self, key):
+        self._db().execute("DELETE FROM webhooks WHERE key = ? AND response IS NULL", (key,))
+
+    def claim_once(self, key, ttl):
+        return self._claim(key, ttl, response="true")
+
+    def release_once(self, key):
+        self._db().execute("DELETE FROM webhooks WHERE key = ?", (key,))
+
+    def prune(self):
+        cur = self._db().execute("DELETE FROM webhooks WHERE expires_at < ?", (time.time(),))
+        return cur.rowcount
+
+
+def make_webhook_index():
+    if WEBHOOK_DEDUP == "off":
+        return NoWebhookIndex()
+    if WEBHOOK_DEDUP == "memory":
+        return MemoryWebhookIndex()
+    return SQLiteWebhookIndex()
+
+
+def _duplicate(app, key, response):
+    metrics.inc("webhooks.duplicates")
+    if response is None:
+        # First delivery still running: don't start a second one
+        metrics.inc("webhooks.in_progress")
+        print(f"♻️ Webhook {key} is still being handled, skipping the redelivery")
+        return app.response_class("", status=200)
+    print(f"♻️ Duplicate webhook {key}, replaying the first response")
+    body, status, content_type = response
+    return app.response_class(body, status=status, content_type=content_type)
+
+
+def dedup_webhooks(app, webhooks):
+    # Answer redelivered webhooks from the first delivery's response (Flask)
+    from flask import g, request
+
+    @app.before_request
+    def _check_redelivery():
+        if request.method != "POST":
+            return None
+        payload = None if request.form else request.get_json(force=True, silent=True)
+        key = webhook_key(request.path, request.form, payload)
+        if not key:
+            return None
+        with metrics.timer("webhooks.dedup"):
+            claimed, response = webhooks.check(key)
+        if claimed:
+            g.webhook_key = key
+            return None
+        return _duplicate(app, key, response)
+
+    @app.after_request
+    def _remember_response(response):
+        key = g.pop("webhook_key", None)
+        if key:
+            if response.status_code >= 500:
+                webhooks.abandon(key)  # let the provider's retry run it again
+            else:
+                webhooks.finish(key, (response.get_data(as_text=True), response.status_code, response.content_type))
+        return response
+
+    @app.teardown_request
+    def _release_claim(error=None):
+        # Still set only if the handler raised
+        key = g.pop("webhook_key", None)
+        if key:
+            webhooks.abandon(key)
+
+
+def adedup_webhooks(app, webhooks):
+    # dedup_webhooks() for the Quart app
+    from quart import g, request
+
+    @app.before_request
+    async def _check_redelivery():
+        if request.method != "POST":
+            return None
+        form = await request.form
+        payload = None if form else await request.get_json(force=True, silent=True)
+        key = webhook_key(request.path, form, payload)
+        if not key:
+            return None
+        with metrics.timer("webhooks.dedup"):
+            claimed, response = await webhooks.acheck(key)
+        if claimed:
+            g.webhook_key = key
+            return None
+        return _duplicate(app, key, response)
+
+    @app.after_request
+    async def _remember_response(response):
+        key = g.pop("webhook_key", None)
+        if key:
+            if response.status_code >= 500:
+                await asyncio.to_thread(webhooks.abandon, key)
+            else:
+                await asyncio.to_thread(webhooks.finish, key, (await response.get_data(as_text=True),
+                                                               response.status_code, response.content_type))
+        return response
+
+    @app.teardown_request
+    async def _release_claim(error=None):
+        key = g.pop("webhook_key", None)
+        if key:
+            await asyncio.to_thread(webhooks.abandon, key)